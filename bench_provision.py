@@ -0,0 +1,186 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+
+ABS_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Steps that only touch the (simulated) router, the rest change this
+# machine: known_hosts, authorized_keys, iptables and the forwarder
+BENCH_STEPS = ["host_ip", "host_auth", "lxc_up", "xr_console", "xr_auth", "xr_config", "tap", "xr_intf", "netdevice"]
+
+
+def bench_router(args):
+    '''Provision one simulated router in this process and save its trace'''
+    import setup_netstack
+    from provision_journal import Journal, run_steps
+    from tracer import TRACER
+    logging.getLogger("paramiko").setLevel(logging.WARNING)
+
+    steps = dict((name, (name, func, verify)) for name, func, verify in setup_netstack.PROVISION_STEPS)
+    # Keys, pushed files and the inventory all live in the scratch dir,
+    # simulated routers stay out of the real known_hosts and inventory
+    ctx = {"host_telnet": args.host_telnet, "xr_telnet": args.xr_telnet, "net_name": args.net_name,
+           "port_ssh_fwd": 0, "gip": "10.1.%d.1" % (args.index % 256), "br_mac": "52:54:00:00:00:01",
+           "host_ssh_port": args.ssh_port, "ssh_dir": os.path.join(args.work_dir, ".ssh"),
+           "files_dir": args.work_dir, "inventory": os.path.join(args.work_dir, "inventory.db")}
+    journal = Journal(args.net_name, dict(ctx), journal_dir=os.path.join(args.work_dir, "journal"), fresh=True)
+    status = 0
+    try:
+        with TRACER.span("provision "+args.net_name, "run"):
+            run_steps(journal, [steps[name] for name in BENCH_STEPS], ctx, setup_netstack.sync_globals)
+    except Exception, e:
+        print "Provisioning "+args.net_name+" failed: "+str(e)
+        status = 1
+    TRACER.write(args.trace)
+    sys.stdout.flush()
+    os._exit(status)
+
+
+def prepare_work_dir(work_dir):
+    os.makedirs(os.path.join(work_dir, ".ssh"))
+    with open(os.path.join(work_dir, ".ssh", "id_rsa.pub"), "w") as f:
+        f.write("ssh-rsa AAAAB3NzaC1yc2EAAAADAQABAAABAQbench bench@localhost\n")
+    # Stand-in for the kimctrl binary, about its real size
+    with open(os.path.join(work_dir, "kimctrl"), "wb") as f:
+        f.write(os.urandom(512 * 1024))
+    shutil.copy(os.path.join(ABS_PATH, "start_netbroker.sh"), work_dir)
+
+
+def start_simulator(count, args, work_dir):
+    ready = os.path.join(work_dir, "routers.json")
+    cmd = [sys.executable, os.path.join(ABS_PATH, "sim_router.py"), "-n", str(count), "--ssh-port", str(args.ssh_port),
+           "--boot-delay", str(args.boot_delay), "--intf-delay", str(args.intf_delay), "--latency", str(args.latency),
+           "--ready-file", ready]
+    log = open(os.path.join(work_dir, "simulator.log"), "w")
+    sim = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 60
+    while not os.path.exists(ready):
+        if sim.poll() is not None or time.time() > deadline:
+            if sim.poll() is None:
+                sim.kill()
+            raise RuntimeError("Simulator did not start, see "+log.name)
+        time.sleep(0.1)
+    with open(ready) as f:
+        return sim, json.load(f)
+
+
+def run_round(count, args):
+    '''Provision count simulated routers at once, returns the round's report'''
+    work_dir = tempfile.mkdtemp(prefix="bench_provision.")
+    try:
+        prepare_work_dir(work_dir)
+        sim, routers = start_simulator(count, args, work_dir)
+        try:
+            start = time.time()
+            procs = []
+            for index, router in enumerate(routers):
+                trace = os.path.join(work_dir, router["net_name"]+".trace.json")
+                cmd = [sys.executable, os.path.abspath(__file__), "router", router["net_name"], str(router["host_telnet"]),
+                       str(router["xr_telnet"]), "--index", str(index), "--ssh-port", str(router["ssh_port"]),
+                       "--work-dir", work_dir, "--trace", trace]
+                log = open(os.path.join(work_dir, router["net_name"]+".log"), "w")
+                procs.append((router, trace, log, subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)))
+
+            results = []
+            for router, trace, log, proc in procs:
+                status = proc.wait()
+                log.close()
+                events = []
+                if os.path.exists(trace):
+                    with open(trace) as f:
+                        events = json.load(f)["traceEvents"]
+                results.append({"net_name": router["net_name"], "status": status, "events": events})
+            wall = time.time() - start
+        finally:
+            sim.terminate()
+            sim.wait()
+        failed = [r["net_name"] for r in results if r["status"] != 0]
+        if failed and args.keep:
+            print "Logs of the failed routers kept in "+work_dir
+        return summarize(count, wall, results)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+def summarize(count, wall, results):
+    '''Per step latency across the routers of a round, from their traces'''
+    phases = {}
+    totals = []
+    for result in results:
+        for event in result["events"]:
+            seconds = event["dur"] / 1e6
+            if event["cat"] == "step":
+                phases.setdefault(event["name"], []).append(seconds)
+            elif event["cat"] == "run":
+                totals.append(seconds)
+    order = [name for name in BENCH_STEPS if name in phases]
+    return {"routers": count, "wall": wall, "failed": len([r for r in results if r["status"] != 0]),
+            "router_p50": percentile(totals, 50), "router_max": percentile(totals, 100),
+            "phases": [{"name": name, "mean": sum(phases[name]) / len(phases[name]), "p50": percentile(phases[name], 50),
+                        "p95": percentile(phases[name], 95), "max": percentile(phases[name], 100)} for name in order]}
+
+
+def print_round(report):
+    print "\n%d router(s): %.2fs wall, per router p50 %.2fs max %.2fs, %d failed" % (
+        report["routers"], report["wall"], report["router_p50"], report["router_max"], report["failed"])
+    print "%-14s %9s %9s %9s %9s" % ("STEP", "MEAN(s)", "P50(s)", "P95(s)", "MAX(s)")
+    for phase in report["phases"]:
+        print "%-14s %9.2f %9.2f %9.2f %9.2f" % (phase["name"], phase["mean"], phase["p50"], phase["p95"], phase["max"])
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="End to end provisioning benchmark against simulated routers")
+    sub = parser.add_subparsers(dest='action')
+    run = sub.add_parser('run', help="benchmark rounds of 1, 10 and 50 routers (or -n ...)")
+    run.add_argument('-n', '--counts', help="routers per round", type=int, nargs='+', default=[1, 10, 50])
+    run.add_argument('--boot-delay', help="seconds until the simulated XR lxc is up", type=float, default=5.0)
+    run.add_argument('--intf-delay', help="seconds after boot until interfaces have MAC/ifh", type=float, default=2.0)
+    run.add_argument('--latency', help="seconds per simulated command answer", type=float, default=0.05)
+    run.add_argument('--ssh-port', type=int, default=2222)
+    run.add_argument('-o', '--report', help="write the JSON report here", type=str)
+    run.add_argument('-k', '--keep', help="keep the logs and traces of every round", action='store_true')
+    router = sub.add_parser('router', help="provision one simulated router (used by run)")
+    router.add_argument('net_name', type=str)
+    router.add_argument('host_telnet', type=str)
+    router.add_argument('xr_telnet', type=str)
+    router.add_argument('--index', type=int, default=0)
+    router.add_argument('--ssh-port', type=int, default=2222)
+    router.add_argument('--work-dir', type=str, required=True)
+    router.add_argument('--trace', type=str, required=True)
+
+    args = parser.parse_args(argv)
+
+    if args.action == 'router':
+        bench_router(args)
+        return
+
+    reports = []
+    for count in args.counts:
+        report = run_round(count, args)
+        print_round(report)
+        reports.append(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"boot_delay": args.boot_delay, "intf_delay": args.intf_delay, "latency": args.latency,
+                       "rounds": reports}, f, indent=2)
+    if any(r["failed"] for r in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,20 +1,5 @@
-function is_port_free {
-
-check=`lsof -i:$1`
-result=$?
-if [[ $result == 1 ]]
-then
-    return 1
-else
-    return 0
-fi
-}
-boot_port=`ps -ef | grep $1 | grep $2 | grep kvm | awk '{print $53}'`
-host_port=`ps -ef | grep $1 | grep $2 | grep kvm | awk '{print $59}'`
-
-split_var=(${boot_port//:/ })
-split_var_port=${split_var[2]}
-split_boot_final=(${split_var_port//,/ })
+split_boot_final=(`python /home/cisco/sunstone/proc_index.py xr-port $2`)
+split_host_final=(`python /home/cisco/sunstone/proc_index.py host-port $2`)
 
 red='\033[0;31m'
 green='\033[0;32m'
@@ -26,10 +11,6 @@ NC='\033[0m'
 #printf "${blue}\n\n\n\n##########################################################################\n${NC}"
 #echo -e "${red}\n\nTo view the boot process, run \"telnet localhost ${split_boot_final[0]}\"\n${NC}"
 
-split_var=(${host_port//:/ })
-split_var_port=${split_var[2]}
-split_host_final=(${split_var_port//,/ })
-
 #echo -e "${red}\nTo telnet into host_linux, run \"telnet localhost ${split_host_final[0]}\"\n${NC}"
 #printf "${blue}\n\n##########################################################################\n\n\n${NC}"
 
@@ -39,28 +20,17 @@ split_host_final=(${split_var_port//,/ })
 
 printf "\n\n\n Starting the provisioner script....\n\n Setting up net devices on the host as XR LXC boots up. Please wait........\n\n\n"
 
-port=7000
-while true
-do
-   is_port_free $port
-   check_port=$?
-   if [[ $check_port -eq 1 ]]
-   then
-       break
-   fi
-
-   if [[ $port -eq 7060 ]]
-   then
-       printf "Unable to find a free port in the range of 7000-7060, aborting...."
-       exit 0
-   fi
-   port=$((port+1))
-done
+port=`python /home/cisco/sunstone/port_alloc.py allocate 7000 7060 -o $2`
+if [[ $? -ne 0 ]]
+then
+    printf "Unable to find a free port in the range of 7000-7060, aborting...."
+    exit 0
+fi
 
 su cisco -c  "python $HOME/sunstone/setup_netstack.py -p ${split_host_final[0]} -x ${split_boot_final[0]} -n $2 -f $port -c"
 #printf "python /home/cisco/sunstone/setup_netstack.py -p ${split_host_final[0]} -x ${split_boot_final[0]} -n $2 -f $port"
 
-host_ip=`/home/cisco/sunstone/get_host_ip.tcl ${split_host_final[0]}`
+host_ip=`python /home/cisco/sunstone/inventory.py host-ip $2`
 
 echo -e "${blue}\n\n\n\n##########################################################################\n\n\n${NC}"
 
@@ -0,0 +1,7 @@
+# Where the sshds of a nested router sit. Kept free of imports so the
+# plain /proc lookups can use them without paramiko.
+
+# sshd of the host linux, only ever moved for the simulator
+HOST_SSH_PORT = 22
+# The XR lxc sshd, only reachable from the host
+XR_SSH_DEST = ('10.11.12.14', 22)
@@ -0,0 +1,219 @@
+import re
+import time
+import socket
+from tracer import TRACER
+
+# Prompts seen on the XR CLI, in XR config mode and on the linux shells
+# (host linux "[host:~]$", XR lxc "[xr-vm_node0_RP0_CPU0:~]$")
+XR_EXEC_PROMPT = r'RP/0/RP0/CPU0:ios#\s*$'
+XR_CONFIG_PROMPT = r'RP/0/RP0/CPU0:ios\(config[^)]*\)#\s*$'
+XR_PROMPTS = [XR_EXEC_PROMPT, XR_CONFIG_PROMPT]
+HOST_PROMPT = r'\[host:~\]\$\s*$'
+SHELL_PROMPT = r'\[[^\[\]\r\n]*\][\$#]\s*$'
+USERNAME_PROMPT = r'Username:\s*$'
+PASSWORD_PROMPT = r'Password:\s*$'
+
+DEFAULT_TIMEOUT = 30
+RECV_SIZE = 65535
+# Leading part of a command looked for in its echo, long commands may come
+# back wrapped by the terminal
+ECHO_CHARS = 32
+
+
+class ExpectTimeout(Exception):
+    """Raised when none of the expected patterns show up in time"""
+
+    def __init__(self, patterns, output):
+        Exception.__init__(self, "Timed out waiting for "+str(patterns))
+        self.patterns = patterns
+        self.output = output
+
+
+class ExpectEOF(Exception):
+    """Raised when the remote end closes the channel while we wait"""
+
+    def __init__(self, patterns, output):
+        Exception.__init__(self, "Channel closed while waiting for "+str(patterns))
+        self.patterns = patterns
+        self.output = output
+
+
+class ExpectChannel(object):
+    '''Prompt driven reader over a paramiko shell channel.
+
+    Instead of sleeping a fixed amount after every send and doing a single
+    recv(), keep reading until one of the expected prompts shows up and
+    return as soon as it does.
+    '''
+
+    def __init__(self, channel, timeout=DEFAULT_TIMEOUT):
+        self.channel = channel
+        self.timeout = timeout
+        self.buffer = ''
+
+    def send(self, data):
+        self.channel.sendall(data)
+
+    def sendline(self, line, eol='\n'):
+        self.send(str(line)+eol)
+
+    def _recv(self, wait):
+        self.channel.settimeout(wait)
+        try:
+            data = self.channel.recv(RECV_SIZE)
+        except socket.timeout:
+            return None
+        TRACER.add("bytes", len(data))
+        return data
+
+    def flush(self):
+        '''Discard anything already received, returns the discarded data'''
+        data = self.buffer
+        self.buffer = ''
+        while self.channel.recv_ready():
+            chunk = self._recv(0)
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def expect(self, patterns, timeout=None):
+        '''Wait until one of the regexes in patterns matches the output.
+
+        Returns (index, match, output) where output is everything read up to
+        and including the match. Anything received after the match is kept
+        for the next call.
+        '''
+        if isinstance(patterns, basestring):
+            patterns = [patterns]
+        compiled = [re.compile(p) for p in patterns]
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.time() + timeout
+
+        while True:
+            for index, regex in enumerate(compiled):
+                match = regex.search(self.buffer)
+                if match:
+                    output = self.buffer[:match.end()]
+                    self.buffer = self.buffer[match.end():]
+                    return index, match, output
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise ExpectTimeout(patterns, self.buffer)
+
+            data = self._recv(min(remaining, 1.0))
+            if data is None:
+                continue
+            if data == '':
+                raise ExpectEOF(patterns, self.buffer)
+            self.buffer += data
+
+    def iter_until(self, patterns, timeout=None):
+        '''Yield output as it arrives until one of the patterns matches.
+
+        Complete lines are handed out straight away, whatever follows the
+        last newline is held back until it either ends in a newline or turns
+        out to be the prompt, so output of any length is never truncated.
+        The last chunk ends with the match.
+        '''
+        if isinstance(patterns, basestring):
+            patterns = [patterns]
+        compiled = [re.compile(p) for p in patterns]
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.time() + timeout
+
+        while True:
+            for regex in compiled:
+                match = regex.search(self.buffer)
+                if match:
+                    chunk = self.buffer[:match.end()]
+                    self.buffer = self.buffer[match.end():]
+                    yield chunk
+                    return
+
+            lines_end = self.buffer.rfind('\n') + 1
+            if lines_end:
+                chunk = self.buffer[:lines_end]
+                self.buffer = self.buffer[lines_end:]
+                yield chunk
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise ExpectTimeout(patterns, self.buffer)
+
+            data = self._recv(min(remaining, 1.0))
+            if data is None:
+                continue
+            if data == '':
+                raise ExpectEOF(patterns, self.buffer)
+            self.buffer += data
+
+    def _send_cmd(self, cmd, eol, deadline):
+        '''Send a command and read up to its echo.
+
+        Prompts of lines sent earlier may still be on their way, they come
+        in ahead of the echo and must not pass for this command's prompt.
+        A blank line has no echo, the next prompt is its own.
+        '''
+        self.sendline(cmd, eol)
+        echo = str(cmd).strip()[:ECHO_CHARS]
+        if not echo:
+            return ''
+        index, match, output = self.expect(re.escape(echo), max(deadline - time.time(), 0))
+        return output
+
+    def stream(self, cmd, prompts, timeout=None, eol='\n'):
+        '''Send a command and yield its output in chunks until a prompt is back'''
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.time() + timeout
+        span = TRACER.start(str(cmd).strip() or "<enter>", "cli")
+        try:
+            stale = self.flush()
+            if stale:
+                yield stale
+            echo = self._send_cmd(cmd, eol, deadline)
+            if echo:
+                yield echo
+            for chunk in self.iter_until(prompts, max(deadline - time.time(), 0)):
+                span.add("bytes", len(chunk))
+                yield chunk
+        finally:
+            TRACER.finish(span)
+
+    def run(self, cmd, prompts, timeout=None, eol='\n'):
+        '''Send a command and return its output once its prompt is back'''
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.time() + timeout
+        with TRACER.span(str(cmd).strip() or "<enter>", "cli"):
+            stale = self.flush()
+            echo = self._send_cmd(cmd, eol, deadline)
+            index, match, output = self.expect(prompts, max(deadline - time.time(), 0))
+        return stale + echo + output
+
+def xr_cli_login(console, username='root', password='root', timeout=120):
+    '''Drop from the XR lxc shell into the XR CLI.
+
+    Answers the Username/Password prompts if the CLI asks for them and
+    returns once the exec prompt is reachable.
+    '''
+    login_prompts = [USERNAME_PROMPT, PASSWORD_PROMPT, XR_EXEC_PROMPT]
+    deadline = time.time() + timeout
+
+    console.sendline('exec')
+    output = ''
+    while True:
+        index, match, more = console.expect(login_prompts, max(deadline - time.time(), 0))
+        output += more
+        if index == 0:
+            console.sendline(username)
+        elif index == 1:
+            console.sendline(password)
+        else:
+            break
+
+    return output
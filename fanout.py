@@ -0,0 +1,188 @@
+import sys
+import json
+import time
+import fnmatch
+import argparse
+import threading
+import Queue
+from expect_channel import XR_PROMPTS
+from ssh_pool import POOL
+from remote_batch import run_batch
+from proc_index import INDEX
+from inventory import Inventory, lookup_host_ip
+import restart_flume
+import xr_session
+from endpoints import HOST_SSH_PORT
+
+# Serialises the prefixed output of the router threads
+PRINT_LOCK = threading.Lock()
+
+
+def emit(net_name, text):
+    '''Print text a line at a time, each line prefixed with the router name'''
+    lines = text.replace('\r', '').split('\n')
+    with PRINT_LOCK:
+        for line in lines:
+            if line:
+                print "["+net_name+"] "+line
+        sys.stdout.flush()
+
+
+def select_routers(patterns):
+    '''net names of the running VMs matching any of the fnmatch patterns'''
+    names = sorted(vm.net_name for vm in INDEX.vms() if vm.net_name)
+    return [n for n in names if any(fnmatch.fnmatch(n, p) for p in patterns)]
+
+
+def resolve_host_ip(net_name, host_port=HOST_SSH_PORT):
+    '''Host ip from the inventory if the host still answers on it, otherwise
+    ask the host console again'''
+    inventory = Inventory()
+    host_ip = lookup_host_ip(net_name, inventory)
+    try:
+        POOL.get_client(host_ip, host_port, 'root', 'lab')
+    except Exception:
+        inventory.forget(net_name)
+        host_ip = lookup_host_ip(net_name, inventory)
+    return host_ip
+
+
+class LineEmitter(object):
+    '''Hands streamed chunks to emit() a complete line at a time'''
+
+    def __init__(self, net_name):
+        self.net_name = net_name
+        self.partial = ''
+
+    def write(self, chunk):
+        lines = (self.partial + chunk).split('\n')
+        self.partial = lines.pop()
+        if lines:
+            emit(self.net_name, '\n'.join(lines))
+
+    def close(self):
+        if self.partial:
+            emit(self.net_name, self.partial)
+        self.partial = ''
+
+
+def run_cli(net_name, host_ip, cmds, host_port=HOST_SSH_PORT):
+    '''Run XR CLI commands in one session, streaming the output. Returns the
+    full output.'''
+    console, login = xr_session.open_xr_console(xr_session.xr_client(host_ip, host_port))
+    out = LineEmitter(net_name)
+    output = ''
+    try:
+        for cmd in cmds:
+            for chunk in console.stream(cmd, XR_PROMPTS, xr_session.XR_CMD_TIMEOUT):
+                out.write(chunk)
+                output += chunk
+    finally:
+        out.close()
+        console.channel.close()
+    return output
+
+
+def run_shell(net_name, host_ip, cmds, host_port=HOST_SSH_PORT):
+    '''Run XR shell commands as one batch, returns the exit status of the last one run'''
+    status = 0
+    for result in run_batch(xr_session.xr_client(host_ip, host_port), cmds, stop_on_error=True):
+        emit(net_name, "$ "+result.cmd+"\n"+result.stdout+result.stderr)
+        status = result.status
+    return status
+
+
+def run_router(net_name, job):
+    '''Run the job's command sets on one router, returns its report entry'''
+    start = time.time()
+    entry = {"net_name": net_name, "host_ip": None, "status": 0, "error": None}
+    try:
+        entry["host_ip"] = resolve_host_ip(net_name, job["ssh_port"])
+        if job["shell"]:
+            entry["status"] = run_shell(net_name, entry["host_ip"], job["shell"], job["ssh_port"])
+        if job["cli"] and entry["status"] == 0:
+            output = run_cli(net_name, entry["host_ip"], job["cli"], job["ssh_port"])
+            if job["restart_flume"] and not restart_flume.flume_procs(output):
+                entry["status"] = 1
+                entry["error"] = "flume is not running after the restart"
+    except Exception, e:
+        entry["status"] = 1
+        entry["error"] = str(e)
+    entry["duration"] = time.time() - start
+    result = "ok" if entry["status"] == 0 else "FAILED, "+str(entry["error"] or "status "+str(entry["status"]))
+    emit(net_name, "done in %.1fs: " % entry["duration"] + result)
+    return entry
+
+
+def fan_out(routers, job, concurrency):
+    '''Run the job on every router, at most concurrency at a time, returns
+    the report entries in router order'''
+    work = Queue.Queue()
+    for index, net_name in enumerate(routers):
+        work.put((index, net_name))
+    results = [None] * len(routers)
+
+    def worker():
+        while True:
+            try:
+                index, net_name = work.get_nowait()
+            except Queue.Empty:
+                return
+            results[index] = run_router(net_name, job)
+
+    threads = [threading.Thread(target=worker) for i in range(max(1, min(concurrency, len(routers))))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Run XR CLI/shell commands on every router matching a pattern")
+    parser.add_argument('-t', '--target', help="net name pattern (fnmatch, e.g. 'rtr*'), may be repeated",
+                        action='append', default=[])
+    parser.add_argument('-c', '--cli', help="XR CLI command, may be repeated", action='append', default=[])
+    parser.add_argument('-s', '--shell', help="XR shell command, may be repeated", action='append', default=[])
+    parser.add_argument('--restart-flume', help="restart flume and check it came back", action='store_true')
+    parser.add_argument('-p', '--ssh-port', help="ssh port of the hosts", type=int, default=HOST_SSH_PORT)
+    parser.add_argument('-j', '--concurrency', help="max routers worked on at once", type=int, default=16)
+    parser.add_argument('-o', '--report', help="write a JSON report here", type=str)
+
+    args = parser.parse_args(argv)
+
+    job = {"cli": list(args.cli), "shell": list(args.shell), "restart_flume": args.restart_flume,
+           "ssh_port": args.ssh_port}
+    if args.restart_flume:
+        job["cli"].extend(restart_flume.FLUME_RESTART_CMDS)
+    if not job["cli"] and not job["shell"]:
+        parser.error("nothing to run, use -c, -s and/or --restart-flume")
+
+    routers = select_routers(args.target or ['*'])
+    if not routers:
+        print "No running router matches "+str(args.target)
+        sys.exit(1)
+    print "Running on "+str(len(routers))+" router(s): "+' '.join(routers)
+
+    start = time.time()
+    results = fan_out(routers, job, args.concurrency)
+    report = {"started": start, "duration": time.time() - start, "job": job, "routers": results}
+
+    print "\n%-20s %-16s %-10s %-10s" % ("NET", "HOST", "STATUS", "TIME(s)")
+    for result in results:
+        status = "ok" if result["status"] == 0 else "FAILED"
+        print "%-20s %-16s %-10s %-10.1f" % (result["net_name"], result["host_ip"], status, result["duration"])
+    failed = len([r for r in results if r["status"] != 0])
+    print "\n"+str(len(results) - failed)+" succeeded, "+str(failed)+" failed in %.1fs" % report["duration"]
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+import threading
+
+
+def stat_signature(path):
+    '''(mtime, size, inode) of path, None if it does not exist'''
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size, st.st_ino)
+
+
+def file_checksum(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), ''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+class FileWatcher(object):
+    '''Tracks changes of one file from its stat() metadata.
+
+    The file is only read and hashed when its (mtime, size, inode) changes,
+    and a new version is only published when the content really differs,
+    so a touch or an identical rewrite wakes nobody. Waiters block on a
+    condition until the version moves past the one they have seen.
+    '''
+
+    def __init__(self, path, interval=1.0):
+        self.path = path
+        self.interval = interval
+        self.cond = threading.Condition()
+        self.signature = None
+        self.checksum = None
+        self.version = 0
+        self.changed = None
+        self.thread = None
+        self.check()
+
+    def check(self):
+        '''Stat the file, rehash it if its metadata moved. Returns True when
+        the content changed.'''
+        signature = stat_signature(self.path)
+        with self.cond:
+            if signature == self.signature:
+                return False
+            self.signature = signature
+        try:
+            checksum = file_checksum(self.path) if signature else None
+        except IOError:
+            checksum = None
+        with self.cond:
+            if checksum == self.checksum:
+                return False
+            self.checksum = checksum
+            self.version += 1
+            self.changed = time.time()
+            self.cond.notify_all()
+        self.on_change(checksum)
+        return True
+
+    def on_change(self, checksum):
+        '''Called after a new version was published, for subclasses'''
+        pass
+
+    def wait(self, version, timeout):
+        '''Block until the version is past the given one or timeout seconds
+        went by, returns the current version'''
+        end = time.time() + timeout
+        with self.cond:
+            while self.version <= version:
+                remaining = end - time.time()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            return self.version
+
+    def _poll(self):
+        while True:
+            try:
+                self.check()
+            except Exception, e:
+                print "Checking "+self.path+" failed: "+str(e)
+            time.sleep(self.interval)
+
+    def start(self):
+        '''Poll the file from a daemon thread every interval seconds'''
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._poll, name="watch "+os.path.basename(self.path))
+            self.thread.daemon = True
+            self.thread.start()
+        return self
+
+
+class PickleSnapshot(FileWatcher):
+    '''Keeps the last good unpickled content of a file, and its JSON.
+
+    The file is loaded and serialised once per change by the watcher, not
+    by the readers. A load that fails (e.g. the writer is half way through
+    rewriting the file) keeps the previous snapshot and is retried on the
+    next poll.
+    '''
+
+    def __init__(self, path, interval=1.0):
+        self.data = None
+        self.json = None
+        self.etag = None
+        self.error = "not loaded yet"
+        FileWatcher.__init__(self, path, interval)
+
+    def on_change(self, checksum):
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+            serialised = json.dumps(data)
+        except Exception, e:
+            with self.cond:
+                self.error = str(e)
+                # Forget what was seen so the next poll loads it again
+                self.signature = None
+                self.checksum = None
+            return
+        with self.cond:
+            self.data = data
+            self.json = serialised
+            self.etag = checksum
+            self.error = None
+
+    def snapshot(self):
+        '''(json, etag) of the last good load, json is None if there is none'''
+        with self.cond:
+            return self.json, self.etag
@@ -0,0 +1,447 @@
+import os
+import sys
+import json
+import time
+import errno
+import fcntl
+import select
+import socket
+import argparse
+import threading
+import Queue
+import subprocess
+from ssh_pool import SSHPool
+from endpoints import HOST_SSH_PORT, XR_SSH_DEST
+
+ABS_PATH = os.path.dirname(os.path.abspath(__file__))
+CONTROL_SOCKET = os.path.join(os.path.expanduser('~'), '.nested_router_provisioner', 'forwarder.sock')
+# Held by the running forwarder for its whole life (path + LOCK_SUFFIX),
+# and by whoever is starting one (path + SPAWN_SUFFIX)
+LOCK_SUFFIX = '.lock'
+SPAWN_SUFFIX = '.spawn'
+BUF_SIZE = 32768
+# Buffered for a slow end before its peer is not read any more
+MAX_PENDING = 4 * BUF_SIZE
+
+
+class AlreadyRunning(Exception):
+    pass
+
+
+def lock_file(path, blocking=True):
+    '''Open path and take an exclusive flock on it, None if not blocking and
+    someone else holds it'''
+    lock = open(path, 'a')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    except IOError, e:
+        lock.close()
+        if e.errno in (errno.EAGAIN, errno.EACCES):
+            return None
+        raise
+    return lock
+
+
+class Forward(object):
+    def __init__(self, local_port, host, user, password, dest_host, dest_port, host_port=HOST_SSH_PORT):
+        self.local_port = int(local_port)
+        self.host = host
+        self.host_port = int(host_port)
+        self.user = user
+        self.password = password
+        self.dest_host = dest_host
+        self.dest_port = int(dest_port)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.connections = 0
+        self.active = 0
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', self.local_port))
+        self.listener.listen(16)
+
+    def info(self):
+        return {"local_port": self.local_port, "host": self.host, "host_port": self.host_port, "user": self.user,
+                "dest_host": self.dest_host, "dest_port": self.dest_port,
+                "bytes_in": self.bytes_in, "bytes_out": self.bytes_out,
+                "connections": self.connections, "active": self.active}
+
+
+class Tunnel(object):
+    '''One accepted local connection and its channel. Data read from one end
+    waits in the other end's buffer until that end can take it.'''
+
+    def __init__(self, forward, conn, channel):
+        self.forward = forward
+        self.conn = conn
+        self.channel = channel
+        # end -> data waiting to be written to it
+        self.pending = {conn: '', channel: ''}
+        self.eof = False
+
+    def peer(self, end):
+        return self.channel if end is self.conn else self.conn
+
+
+class ForwardServer(object):
+    '''Serves every local port forward from one process.
+
+    There is one pooled SSH transport per host, and each accepted local
+    connection rides it as a direct-tcpip channel. A single select() loop
+    pumps all the tunnels without ever blocking: both ends are non-blocking
+    and buffer what the other end cannot take yet. Anything that may block
+    (SSH connects, channel opens, control requests) runs on a thread of its
+    own and hands its result back to the loop. Control requests are
+    add/remove/list JSON lines on a unix control socket.
+    '''
+
+    def __init__(self, control_path=CONTROL_SOCKET):
+        self.pool = SSHPool()
+        self.forwards = {}
+        # socket or channel -> Tunnel
+        self.tunnels = {}
+        # Callables the loop runs for other threads, the pipe wakes it up
+        self.calls = Queue.Queue()
+        self.wake_r, self.wake_w = os.pipe()
+        self.control_path = control_path
+        self.running = True
+        control_dir = os.path.dirname(control_path)
+        if not os.path.isdir(control_dir):
+            os.makedirs(control_dir)
+        # Only one forwarder per control socket, the lock goes with the process
+        self.lock = lock_file(control_path + LOCK_SUFFIX, blocking=False)
+        if self.lock is None:
+            raise AlreadyRunning("A forwarder already serves "+control_path)
+        if os.path.exists(control_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(control_path)
+            except socket.error:
+                # Left behind by a forwarder that died
+                os.unlink(control_path)
+            else:
+                raise AlreadyRunning("Something is listening on "+control_path)
+            finally:
+                probe.close()
+        self.control = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.control.bind(control_path)
+        self.control.listen(8)
+
+    def on_loop(self, func, wait=True):
+        '''Run func on the loop thread, and return its result when wait'''
+        done = threading.Event()
+        result = {}
+
+        def call():
+            try:
+                result["value"] = func()
+            except Exception, e:
+                result["error"] = e
+            done.set()
+        self.calls.put(call)
+        os.write(self.wake_w, 'x')
+        if not wait:
+            return None
+        done.wait()
+        if "error" in result:
+            raise result["error"]
+        return result["value"]
+
+    def add(self, local_port, host, user='root', password='lab', dest_host=XR_SSH_DEST[0], dest_port=XR_SSH_DEST[1],
+            host_port=HOST_SSH_PORT):
+        '''Called from a control thread'''
+        # Authenticate up front so a bad host fails the add, not the first client
+        self.pool.get_client(host, int(host_port), user, password)
+        return self.on_loop(lambda: self._add(int(local_port), host, user, password, dest_host, dest_port, host_port))
+
+    def _add(self, local_port, host, user, password, dest_host, dest_port, host_port):
+        if local_port in self.forwards:
+            self.remove(local_port)
+        self.forwards[local_port] = Forward(local_port, host, user, password, dest_host, dest_port, host_port)
+        return self.forwards[local_port].info()
+
+    def remove(self, local_port):
+        if int(local_port) not in self.forwards:
+            raise ValueError("port "+str(local_port)+" is not forwarded")
+        forward = self.forwards.pop(int(local_port))
+        forward.listener.close()
+        for tunnel in set(self.tunnels.values()):
+            if tunnel.forward is forward:
+                self._close(tunnel)
+        return forward.info()
+
+    def list(self):
+        return [f.info() for f in sorted(self.forwards.values(), key=lambda f: f.local_port)]
+
+    def _accept(self, forward):
+        conn, peer = forward.listener.accept()
+        thread = threading.Thread(target=self._open_channel, args=(forward, conn, peer))
+        thread.daemon = True
+        thread.start()
+
+    def _open_channel(self, forward, conn, peer):
+        try:
+            transport = self.pool.get_client(forward.host, forward.host_port, forward.user,
+                                             forward.password).get_transport()
+            channel = transport.open_channel('direct-tcpip', (forward.dest_host, forward.dest_port), peer)
+        except Exception, e:
+            print "Forward "+str(forward.local_port)+": unable to open channel, "+str(e)
+            conn.close()
+            return
+        self.on_loop(lambda: self._start_tunnel(forward, conn, channel), wait=False)
+
+    def _start_tunnel(self, forward, conn, channel):
+        if self.forwards.get(forward.local_port) is not forward:
+            # Removed while the channel was being opened
+            conn.close()
+            channel.close()
+            return
+        conn.setblocking(0)
+        channel.settimeout(0.0)
+        tunnel = Tunnel(forward, conn, channel)
+        forward.connections += 1
+        forward.active += 1
+        self.tunnels[conn] = tunnel
+        self.tunnels[channel] = tunnel
+
+    def _close(self, tunnel):
+        if self.tunnels.pop(tunnel.conn, None) is None:
+            return
+        self.tunnels.pop(tunnel.channel, None)
+        tunnel.forward.active -= 1
+        for end in (tunnel.conn, tunnel.channel):
+            try:
+                end.close()
+            except Exception:
+                pass
+
+    def _pump(self, end):
+        tunnel = self.tunnels[end]
+        try:
+            data = end.recv(BUF_SIZE)
+        except socket.timeout:
+            return
+        except socket.error, e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = ''
+        if not data:
+            # Hand over what is still buffered, then close
+            tunnel.eof = True
+            return
+        tunnel.pending[tunnel.peer(end)] += data
+        if end is tunnel.conn:
+            tunnel.forward.bytes_out += len(data)
+        else:
+            tunnel.forward.bytes_in += len(data)
+
+    def _flush(self, tunnel):
+        for end in (tunnel.conn, tunnel.channel):
+            data = tunnel.pending[end]
+            if not data:
+                continue
+            try:
+                sent = end.send(data)
+            except socket.timeout:
+                sent = 0
+            except socket.error, e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    self._close(tunnel)
+                    return
+                sent = 0
+            tunnel.pending[end] = data[sent:]
+        if tunnel.eof and not any(tunnel.pending.values()):
+            self._close(tunnel)
+
+    def _handle_control(self):
+        conn, _ = self.control.accept()
+        thread = threading.Thread(target=self._control_request, args=(conn,))
+        thread.daemon = True
+        thread.start()
+
+    def _control_request(self, conn):
+        conn.settimeout(30)
+        try:
+            request = json.loads(conn.makefile().readline())
+            cmd = request.pop("cmd")
+            if cmd == "add":
+                reply = {"result": "ok", "forward": self.add(**request)}
+            elif cmd == "remove":
+                reply = {"result": "ok", "forward": self.on_loop(lambda: self.remove(request["local_port"]))}
+            elif cmd == "list":
+                reply = {"result": "ok", "forwards": self.on_loop(self.list)}
+            else:
+                reply = {"result": "failure", "error": "unknown command "+str(cmd)}
+        except Exception, e:
+            reply = {"result": "failure", "error": str(e)}
+        try:
+            conn.sendall(json.dumps(reply)+"\n")
+        except socket.error:
+            pass
+        finally:
+            conn.close()
+
+    def stop(self):
+        '''Make serve_forever drop every forward and return'''
+        self.on_loop(self._stop, wait=False)
+
+    def _stop(self):
+        self.running = False
+        for port in self.forwards.keys():
+            self.remove(port)
+        self.control.close()
+        os.unlink(self.control_path)
+        self.lock.close()
+
+    def serve_forever(self):
+        print "Forwarder listening for control requests on "+self.control_path
+        while self.running:
+            listeners = dict((f.listener, f) for f in self.forwards.values())
+            tunnels = set(self.tunnels.values())
+            # Stop reading an end while its peer still has too much to write
+            reading = [end for end, t in self.tunnels.items()
+                       if not t.eof and len(t.pending[t.peer(end)]) < MAX_PENDING]
+            writing = [t.conn for t in tunnels if t.pending[t.conn]]
+            # select() cannot tell when a channel has window again, poll those
+            channel_waits = any(t.pending[t.channel] for t in tunnels)
+            readable, _, _ = select.select([self.control, self.wake_r] + listeners.keys() + reading,
+                                                  writing, [], 0.05 if channel_waits else 1.0)
+            for r in readable:
+                if r is self.control:
+                    self._handle_control()
+                elif r is self.wake_r:
+                    os.read(self.wake_r, 4096)
+                elif r in listeners:
+                    self._accept(listeners[r])
+                elif r in self.tunnels:
+                    self._pump(r)
+            while True:
+                try:
+                    call = self.calls.get_nowait()
+                except Queue.Empty:
+                    break
+                call()
+            for tunnel in set(self.tunnels.values()):
+                self._flush(tunnel)
+
+
+def control(request, path=CONTROL_SOCKET, timeout=30):
+    '''Send one request to a running forwarder and return its reply'''
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+        sock.sendall(json.dumps(request)+"\n")
+        reply = json.loads(sock.makefile().readline())
+    finally:
+        sock.close()
+    if reply.get("result") != "ok":
+        raise RuntimeError("Forwarder request "+str(request.get("cmd"))+" failed: "+str(reply.get("error")))
+    return reply
+
+
+def is_running(path=CONTROL_SOCKET):
+    try:
+        control({"cmd": "list"}, path, timeout=2)
+    except (socket.error, RuntimeError, ValueError):
+        return False
+    return True
+
+
+def ensure_running(path=CONTROL_SOCKET, wait=10):
+    '''Start a detached forwarder if none answers on the control socket.
+    Concurrent callers take turns, so only the first one starts it and the
+    others find it running.'''
+    if is_running(path):
+        return
+    control_dir = os.path.dirname(path)
+    if not os.path.isdir(control_dir):
+        os.makedirs(control_dir)
+    spawn_lock = lock_file(path + SPAWN_SUFFIX)
+    try:
+        if is_running(path):
+            return
+        log = open(os.path.join(control_dir, 'forwarder.log'), 'a')
+        # A forwarder still starting up (or one started by hand) holds the
+        # daemon lock, the new one then just exits and we wait for the other
+        subprocess.Popen([sys.executable, os.path.join(ABS_PATH, 'forward_daemon.py'), 'serve', '-c', path],
+                         stdout=log, stderr=subprocess.STDOUT, close_fds=True, preexec_fn=os.setsid)
+        deadline = time.time() + wait
+        while time.time() < deadline:
+            if is_running(path):
+                return
+            time.sleep(0.1)
+        raise RuntimeError("Forwarder did not start, see "+log.name)
+    finally:
+        spawn_lock.close()
+
+
+def add_forward(local_port, host, user='root', password='lab', dest=XR_SSH_DEST, host_port=HOST_SSH_PORT):
+    ensure_running()
+    return control({"cmd": "add", "local_port": int(local_port), "host": host, "host_port": int(host_port),
+                    "user": user, "password": password, "dest_host": dest[0], "dest_port": dest[1]})["forward"]
+
+
+def list_forwards(host=None):
+    '''Forwards of the running forwarder (to host if given), [] if there is none'''
+    if not is_running():
+        return []
+    forwards = control({"cmd": "list"})["forwards"]
+    return [f for f in forwards if host is None or f["host"] == host]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='action')
+    serve = sub.add_parser('serve', help="run the forwarder in the foreground")
+    serve.add_argument('-c', '--control', help="control socket path", type=str, default=CONTROL_SOCKET)
+    add = sub.add_parser('add', help="forward a local port through a host")
+    add.add_argument('local_port', type=int)
+    add.add_argument('host', type=str)
+    add.add_argument('-d', '--dest', help="destination host:port behind the host", type=str,
+                     default=XR_SSH_DEST[0]+":"+str(XR_SSH_DEST[1]))
+    add.add_argument('-s', '--ssh-port', help="ssh port of the host", type=int, default=HOST_SSH_PORT)
+    add.add_argument('-l', '--user', type=str, default='root')
+    add.add_argument('-P', '--password', type=str, default='lab')
+    remove = sub.add_parser('remove', help="stop forwarding a local port, or every port of a host")
+    remove.add_argument('local_port', nargs='?', type=int)
+    remove.add_argument('-H', '--host', help="remove all the forwards through this host", type=str)
+    sub.add_parser('list', help="show forwards and their byte counters")
+
+    args = parser.parse_args(argv)
+
+    if args.action == 'serve':
+        try:
+            server = ForwardServer(args.control)
+        except AlreadyRunning, e:
+            print str(e)
+            return
+        server.serve_forever()
+    elif args.action == 'add':
+        dest_host, dest_port = args.dest.rsplit(':', 1)
+        print json.dumps(add_forward(args.local_port, args.host, args.user, args.password, (dest_host, int(dest_port)),
+                                     args.ssh_port))
+    elif args.action == 'remove':
+        # Nothing is forwarded when no forwarder runs
+        if not is_running():
+            return
+        if args.host:
+            ports = [f["local_port"] for f in list_forwards(host=args.host)]
+        elif args.local_port:
+            ports = [args.local_port]
+        else:
+            parser.error("remove needs a local port or --host")
+        for port in ports:
+            try:
+                print json.dumps(control({"cmd": "remove", "local_port": port})["forward"])
+            except RuntimeError, e:
+                print str(e)
+    else:
+        print "%-8s %-18s %-20s %-8s %-12s %-12s" % ("PORT", "HOST", "DEST", "ACTIVE", "BYTES_IN", "BYTES_OUT")
+        for f in list_forwards():
+            print "%-8s %-18s %-20s %-8s %-12s %-12s" % (f["local_port"], f["host"], f["dest_host"]+":"+str(f["dest_port"]),
+                                                        f["active"], f["bytes_in"], f["bytes_out"])
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
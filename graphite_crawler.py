@@ -0,0 +1,165 @@
+import sys
+import json
+import time
+import Queue
+import argparse
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+GRAPHITE_SERVER = "http://10.105.237.219"
+# Levels of the tree are expanded this many nodes at a time
+CONCURRENCY = 8
+# The shape of the tree changes when a router or plugin comes and goes,
+# re-walk it this often and only fetch leaf values in between
+TREE_TTL = 600
+# Targets per render request, sent as a POST so the URL length is no limit
+RENDER_BATCH = 200
+
+
+def parallel(func, items, concurrency):
+    '''func(item) for every item on at most concurrency threads, results in
+    item order. The first exception is raised once every thread is done.'''
+    work = Queue.Queue()
+    for index, item in enumerate(items):
+        work.put((index, item))
+    results = [None] * len(items)
+    errors = []
+
+    def worker():
+        while True:
+            try:
+                index, item = work.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results[index] = func(item)
+            except Exception, e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker) for i in range(max(1, min(concurrency, len(items))))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+def nested_set(dic, keys, value):
+    for key in keys[:-1]:
+        dic = dic.setdefault(key, {})
+    dic[keys[-1]] = value
+
+
+class GraphiteCrawler(object):
+    '''Walks the metric tree under root and fetches every leaf's recent
+    average.
+
+    One pooled requests.Session keeps connections to graphite-web open
+    across requests. The tree is walked a level at a time with the find API,
+    whose answer says which children are leaves, so leaves cost no request
+    of their own. Leaf values come from multi-target render requests.
+    '''
+
+    def __init__(self, server=GRAPHITE_SERVER, root="collectd", concurrency=CONCURRENCY, tree_ttl=TREE_TTL,
+                 batch=RENDER_BATCH, timeout=30):
+        self.server = server
+        self.root = root
+        self.concurrency = concurrency
+        self.tree_ttl = tree_ttl
+        self.batch = batch
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.lock = threading.Lock()
+        self.leaves = None
+        self.walked = 0
+        self.requests = 0
+
+    def _request(self, path, **kw):
+        with self.lock:
+            self.requests += 1
+        response = self.session.request(kw.pop("method", "GET"), self.server + path, timeout=self.timeout, **kw)
+        response.raise_for_status()
+        return response.json()
+
+    def children(self, node):
+        '''(branches, leaves) directly under a node'''
+        branches = []
+        leaves = []
+        for child in self._request("/metrics/find/", params={"query": node + ".*"}):
+            (leaves if child.get("leaf") else branches).append(child["id"])
+        return branches, leaves
+
+    def walk(self):
+        '''Every leaf under root, breadth first'''
+        leaves = []
+        level = [self.root]
+        while level:
+            following = []
+            for branches, found in parallel(self.children, level, self.concurrency):
+                following.extend(branches)
+                leaves.extend(found)
+            level = following
+        return sorted(leaves)
+
+    def tree(self, refresh=False):
+        '''The leaves, re-walked when the cached walk is older than tree_ttl'''
+        if refresh or self.leaves is None or time.time() - self.walked > self.tree_ttl:
+            self.leaves = self.walk()
+            self.walked = time.time()
+        return self.leaves
+
+    def render(self, targets, since="-1min"):
+        '''{target: average of its non-null datapoints since since}'''
+        data = [("target", target) for target in targets] + [("from", since), ("format", "json")]
+        values = {}
+        for series in self._request("/render", method="POST", data=data):
+            points = [value for value, timestamp in series["datapoints"] if value is not None]
+            values[series["target"]] = sum(points) / len(points) if points else None
+        return values
+
+    def collect(self, since="-1min"):
+        '''Nested dict of every leaf's average below root, like the old
+        graphite_nd_stats. A leaf that vanished since the tree was walked
+        forces a re-walk on the next call.'''
+        leaves = self.tree()
+        batches = [leaves[i:i + self.batch] for i in range(0, len(leaves), self.batch)]
+        values = {}
+        for result in parallel(lambda targets: self.render(targets, since), batches, self.concurrency):
+            values.update(result)
+        if len(values) < len(leaves):
+            self.walked = 0
+        metrics = {}
+        prefix = self.root + "."
+        for leaf in leaves:
+            nested_set(metrics, leaf[len(prefix):].split("."), values.get(leaf))
+        return metrics
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Fetch the latest value of every metric under a Graphite node")
+    parser.add_argument('-g', '--graphite', type=str, default=GRAPHITE_SERVER)
+    parser.add_argument('-r', '--root', type=str, default="collectd")
+    parser.add_argument('-j', '--concurrency', type=int, default=CONCURRENCY)
+    parser.add_argument('-b', '--batch', type=int, default=RENDER_BATCH, help="targets per render request")
+    parser.add_argument('-n', '--rounds', type=int, default=1, help="collect this many times, reusing the tree")
+
+    args = parser.parse_args(argv)
+    crawler = GraphiteCrawler(args.graphite, args.root, args.concurrency, batch=args.batch)
+    for i in range(args.rounds):
+        start = time.time()
+        sent = crawler.requests
+        metrics = crawler.collect()
+        sys.stderr.write("%d leaves in %.2fs, %d requests\n" % (len(crawler.leaves), time.time() - start,
+                                                                  crawler.requests - sent))
+    print json.dumps(metrics, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,158 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+from proc_index import INDEX
+import telnet_console
+
+INVENTORY_DB = os.path.join(os.path.expanduser('~'), '.nested_router_provisioner', 'inventory.db')
+
+# Columns besides net_name, in the order they are listed
+FIELDS = ['qemu_pid', 'qemu_start', 'host_telnet', 'xr_telnet', 'host_ip', 'xr_int_ip', 'xr_intf_mac', 'xr_ifh', 'fwd_port', 'updated']
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS routers (
+    net_name TEXT PRIMARY KEY,
+    qemu_pid INTEGER,
+    qemu_start INTEGER,
+    host_telnet INTEGER,
+    xr_telnet INTEGER,
+    host_ip TEXT,
+    xr_int_ip TEXT,
+    xr_intf_mac TEXT,
+    xr_ifh INTEGER,
+    fwd_port INTEGER,
+    updated REAL
+)'''
+
+
+class Inventory(object):
+    '''What is known about each router, keyed by net name.
+
+    The provisioner records a router once it is up, every other tool looks
+    it up here instead of scraping ps and logging into the host console
+    again. An entry belongs to the qemu process that was running when it
+    was recorded, it is dropped as soon as that VM is gone or restarted.
+    '''
+
+    def __init__(self, path=INVENTORY_DB):
+        db_dir = os.path.dirname(path)
+        if not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+        # Provisioners and tools write concurrently, wait for the lock
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.text_factory = str
+        with self.db:
+            self.db.execute(SCHEMA)
+            # Databases from before qemu_start, their rows no longer validate
+            columns = [c[1] for c in self.db.execute("PRAGMA table_info(routers)")]
+            if "qemu_start" not in columns:
+                self.db.execute("ALTER TABLE routers ADD COLUMN qemu_start INTEGER")
+
+    def record(self, net_name, **fields):
+        '''Insert or update a router, qemu_pid and qemu_start default to the
+        running VM's'''
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError("Unknown inventory fields "+str(sorted(unknown)))
+        if "qemu_pid" not in fields:
+            vm = INDEX.find_vm(net_name)
+            fields["qemu_pid"] = vm.pid if vm else None
+            fields["qemu_start"] = vm.start_time if vm else None
+        fields["updated"] = time.time()
+        names = sorted(fields)
+        with self.db:
+            self.db.execute("INSERT OR IGNORE INTO routers (net_name) VALUES (?)", (net_name,))
+            self.db.execute("UPDATE routers SET "+", ".join(n+" = ?" for n in names)+" WHERE net_name = ?",
+                            [fields[n] for n in names] + [net_name])
+
+    def forget(self, net_name):
+        with self.db:
+            self.db.execute("DELETE FROM routers WHERE net_name = ?", (net_name,))
+
+    def _valid(self, row):
+        # A pid alone may have been reused by a VM started since
+        vm = INDEX.find_vm(row["net_name"])
+        return vm is not None and (vm.pid, vm.start_time) == (row["qemu_pid"], row["qemu_start"])
+
+    def get(self, net_name):
+        '''The router's entry as a dict, None if there is none or the VM it
+        was recorded for is no longer running'''
+        row = self.db.execute("SELECT * FROM routers WHERE net_name = ?", (net_name,)).fetchone()
+        if row is None:
+            return None
+        if not self._valid(row):
+            self.forget(net_name)
+            return None
+        return dict(row)
+
+    def routers(self):
+        '''Entries of every router still running, stale ones are dropped'''
+        entries = []
+        for row in self.db.execute("SELECT * FROM routers ORDER BY net_name").fetchall():
+            if self._valid(row):
+                entries.append(dict(row))
+            else:
+                self.forget(row["net_name"])
+        return entries
+
+
+def lookup_host_ip(net_name, inventory=None):
+    '''Host ip of a router from the inventory, asking the host console (and
+    recording the answer) only when the inventory has none. Raises
+    LookupError when no running VM of that name has a host console.'''
+    inventory = inventory or Inventory()
+    entry = inventory.get(net_name)
+    if entry and entry["host_ip"]:
+        return entry["host_ip"]
+    host_telnet = INDEX.host_telnet_port(net_name)
+    if host_telnet is None:
+        raise LookupError("no host console found for "+net_name)
+    host_ip = telnet_console.get_host_ip(host_telnet)
+    inventory.record(net_name, host_ip=host_ip, host_telnet=int(host_telnet))
+    return host_ip
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='action')
+    get = sub.add_parser('get', help="print a router's entry, or one field of it")
+    get.add_argument('net_name', type=str)
+    get.add_argument('field', nargs='?', choices=FIELDS, type=str)
+    host_ip = sub.add_parser('host-ip', help="print a router's host ip, asking its console if not known")
+    host_ip.add_argument('net_name', type=str)
+    forget = sub.add_parser('forget', help="drop a router's entry")
+    forget.add_argument('net_name', type=str)
+    sub.add_parser('list', help="print every live router")
+
+    args = parser.parse_args(argv)
+    inventory = Inventory()
+
+    if args.action == 'get':
+        entry = inventory.get(args.net_name)
+        if entry is None:
+            sys.stderr.write("No live inventory entry for "+args.net_name+"\n")
+            sys.exit(1)
+        if args.field:
+            print entry[args.field]
+        else:
+            for field in FIELDS:
+                print field, entry[field]
+    elif args.action == 'host-ip':
+        try:
+            print lookup_host_ip(args.net_name, inventory)
+        except LookupError, e:
+            sys.stderr.write(str(e)+"\n")
+            sys.exit(1)
+    elif args.action == 'forget':
+        inventory.forget(args.net_name)
+    else:
+        print "%-20s %-8s %-8s %-8s %-16s %-16s %-18s %-8s" % ("NET", "PID", "HOST", "XR", "HOST_IP", "XR_INT_IP", "XR_MAC", "FWD")
+        for e in inventory.routers():
+            print "%-20s %-8s %-8s %-8s %-16s %-16s %-18s %-8s" % (e["net_name"], e["qemu_pid"], e["host_telnet"], e["xr_telnet"],
+                                                                   e["host_ip"], e["xr_int_ip"], e["xr_intf_mac"], e["fwd_port"])
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
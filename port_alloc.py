@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import errno
+import fcntl
+import socket
+import argparse
+
+LEASE_FILE = os.path.join(os.path.expanduser('~'), '.nested_router_provisioner', 'port_leases.json')
+
+
+def is_port_free(port, host='127.0.0.1'):
+    '''A port is free if we can bind it for both TCP and UDP'''
+    for kind in (socket.SOCK_STREAM, socket.SOCK_DGRAM):
+        sock = socket.socket(socket.AF_INET, kind)
+        try:
+            sock.bind((host, port))
+        except socket.error:
+            return False
+        finally:
+            sock.close()
+    return True
+
+
+def listening_ports():
+    '''Every local TCP/UDP port in use according to /proc/net, read in one go
+    instead of probing port by port'''
+    ports = set()
+    for table in ('tcp', 'tcp6', 'udp', 'udp6'):
+        try:
+            with open('/proc/net/'+table) as f:
+                lines = f.readlines()[1:]
+        except IOError:
+            continue
+        for line in lines:
+            fields = line.split()
+            if len(fields) > 1:
+                ports.add(int(fields[1].rsplit(':', 1)[1], 16))
+    return ports
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        return e.errno == errno.EPERM
+    return True
+
+
+class PortAllocator(object):
+    '''Hands out local ports and records them as leases in a shared state file.
+
+    The lease file is flock()ed while it is read and updated, so provisioners
+    running in parallel never pick the same port. Leases held by a pid that
+    has since exited are reclaimed.
+    '''
+
+    def __init__(self, lease_file=LEASE_FILE):
+        self.lease_file = lease_file
+        lease_dir = os.path.dirname(lease_file)
+        if not os.path.isdir(lease_dir):
+            os.makedirs(lease_dir)
+
+    def _locked(self):
+        f = open(self.lease_file, 'a+')
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def _load(self, f):
+        f.seek(0)
+        data = f.read()
+        leases = json.loads(data) if data.strip() else {}
+        # Reclaim leases whose owner is gone
+        return dict((port, lease) for port, lease in leases.items() if pid_alive(lease["pid"]))
+
+    def _save(self, f, leases):
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps(leases, indent=2, sort_keys=True))
+        f.flush()
+
+    def allocate(self, start, end, owner="", pid=None, count=1, skip=()):
+        '''Lease count free ports in [start, end] for pid (this process by
+        default), returns them as a list. Ports in skip are never handed out,
+        even when nothing holds them yet'''
+        pid = pid or os.getpid()
+        skip = set(int(port) for port in skip)
+        f = self._locked()
+        try:
+            leases = self._load(f)
+            in_use = listening_ports()
+            ports = []
+            for port in range(int(start), int(end) + 1):
+                if str(port) in leases or port in in_use or port in skip:
+                    continue
+                if not is_port_free(port):
+                    continue
+                ports.append(port)
+                leases[str(port)] = {"pid": pid, "owner": owner}
+                if len(ports) == count:
+                    break
+            if len(ports) < count:
+                raise RuntimeError("Unable to find "+str(count)+" free port(s) in the range of "+str(start)+"-"+str(end))
+            self._save(f, leases)
+            return ports
+        finally:
+            f.close()
+
+    def release(self, port):
+        f = self._locked()
+        try:
+            leases = self._load(f)
+            leases.pop(str(port), None)
+            self._save(f, leases)
+        finally:
+            f.close()
+
+    def leases(self):
+        f = self._locked()
+        try:
+            leases = self._load(f)
+            self._save(f, leases)
+            return leases
+        finally:
+            f.close()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='action')
+    alloc = sub.add_parser('allocate', help="lease free ports in a range and print them")
+    alloc.add_argument('start', type=int)
+    alloc.add_argument('end', type=int)
+    alloc.add_argument('-n', '--count', type=int, default=1)
+    alloc.add_argument('-o', '--owner', type=str, default="")
+    alloc.add_argument('-p', '--pid', help="pid owning the lease, defaults to the calling process", type=int)
+    release = sub.add_parser('release', help="drop the lease on a port")
+    release.add_argument('port', type=int)
+    sub.add_parser('list', help="print live leases")
+
+    args = parser.parse_args(argv)
+    allocator = PortAllocator()
+
+    if args.action == 'allocate':
+        try:
+            # Called from a script, the lease belongs to that script
+            ports = allocator.allocate(args.start, args.end, args.owner, args.pid or os.getppid(), args.count)
+        except RuntimeError, e:
+            sys.stderr.write(str(e)+"\n")
+            sys.exit(1)
+        print ' '.join(str(p) for p in ports)
+    elif args.action == 'release':
+        allocator.release(args.port)
+    else:
+        for port, lease in sorted(allocator.leases().items()):
+            print port, lease["pid"], lease["owner"]
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
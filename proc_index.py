@@ -0,0 +1,228 @@
+import os
+import sys
+import time
+import argparse
+from collections import namedtuple
+from endpoints import XR_SSH_DEST
+
+PROC_ROOT = '/proc'
+CACHE_TTL = 2.0
+
+# Order of the -serial telnet ports sunstone.sh hands to qemu
+XR_CONSOLE_SERIAL = 0
+HOST_CONSOLE_SERIAL = 3
+
+# ssh options that take a value, the target host is the first bare argument
+SSH_ARG_OPTS = 'BbcDEeFIiJLlmOopQRSWw'
+
+QemuProc = namedtuple('QemuProc', ['pid', 'start_time', 'name', 'net_name', 'serial_ports', 'cmdline'])
+SshForward = namedtuple('SshForward', ['pid', 'local_port', 'dest_host', 'dest_port', 'target', 'user'])
+
+
+def parse_qemu(pid, argv, start_time=None):
+    '''Pick the -name and the -serial telnet:host:port,... ports out of a
+    kvm/qemu command line'''
+    name = None
+    serial_ports = []
+    for opt, value in zip(argv, argv[1:]):
+        if opt == '-name':
+            name = value
+        elif opt == '-serial' and value.startswith('telnet:'):
+            address = value[len('telnet:'):].split(',')[0]
+            serial_ports.append(int(address.rsplit(':', 1)[1]))
+    net_name = name.split(':', 1)[-1] if name else None
+    return QemuProc(pid, start_time, name, net_name, serial_ports, ' '.join(argv))
+
+
+def parse_ssh(pid, argv):
+    '''Return an SshForward for every -L spec of an ssh command line'''
+    specs = []
+    user = None
+    target = None
+    i = 1
+    while i < len(argv):
+        arg = argv[i]
+        if arg.startswith('-') and len(arg) > 1 and target is None:
+            opt = arg[1:]
+            # Flags can be bunched up (-fNL 7000:...), the last one may take a value
+            while opt and opt[0] not in SSH_ARG_OPTS:
+                opt = opt[1:]
+            if opt:
+                flag, value = opt[0], opt[1:]
+                if not value and i + 1 < len(argv):
+                    i += 1
+                    value = argv[i]
+                if flag == 'L':
+                    specs.append(value)
+                elif flag == 'l':
+                    user = value
+        elif target is None:
+            target = arg
+        i += 1
+
+    if target is not None and '@' in target:
+        user, target = target.split('@', 1)
+
+    forwards = []
+    for spec in specs:
+        fields = spec.split(':')
+        if len(fields) == 4:
+            fields = fields[1:]
+        if len(fields) != 3:
+            continue
+        try:
+            forwards.append(SshForward(pid, int(fields[0]), fields[1], int(fields[2]), target, user))
+        except ValueError:
+            continue
+    return forwards
+
+
+class ProcIndex(object):
+    '''Index of the qemu VMs and ssh port forwards running on this machine.
+
+    Built from /proc instead of ps|grep|awk. Only processes not seen on a
+    previous scan have their cmdline read, and a scan is reused for ttl
+    seconds. A process is known by its pid and start time, so a reused pid
+    is read again.
+    '''
+
+    def __init__(self, ttl=CACHE_TTL, proc_root=PROC_ROOT):
+        self.ttl = ttl
+        self.proc_root = proc_root
+        self.last_scan = 0
+        # (pid, start time) -> QemuProc, [SshForward, ...] or None for
+        # processes we don't care about
+        self.procs = {}
+        self.by_net_name = {}
+        self.by_host_ip = {}
+
+    def _start_time(self, pid):
+        '''Start time in clock ticks since boot (field 22 of stat), None if
+        the process is gone'''
+        try:
+            with open(os.path.join(self.proc_root, pid, 'stat')) as f:
+                data = f.read()
+        except IOError:
+            return None
+        # The command name (field 2) is in parentheses and may hold spaces
+        fields = data[data.rfind(')') + 2:].split()
+        return int(fields[19]) if len(fields) > 19 else None
+
+    def _read_argv(self, pid):
+        try:
+            with open(os.path.join(self.proc_root, pid, 'cmdline')) as f:
+                data = f.read()
+        except IOError:
+            return None
+        return data.rstrip('\0').split('\0') if data else None
+
+    def _classify(self, pid, argv, start):
+        prog = os.path.basename(argv[0])
+        if 'kvm' in prog or 'qemu' in prog:
+            return parse_qemu(int(pid), argv, start)
+        if prog == 'ssh':
+            return parse_ssh(int(pid), argv) or None
+        return None
+
+    def refresh(self, force=False):
+        now = time.time()
+        if not force and now - self.last_scan < self.ttl:
+            return
+        procs = set()
+        for pid in os.listdir(self.proc_root):
+            if pid.isdigit():
+                start = self._start_time(pid)
+                if start is not None:
+                    procs.add((pid, start))
+
+        for key in set(self.procs) - procs:
+            del self.procs[key]
+        for pid, start in procs - set(self.procs):
+            argv = self._read_argv(pid)
+            self.procs[(pid, start)] = self._classify(pid, argv, start) if argv else None
+
+        self.by_net_name = {}
+        self.by_host_ip = {}
+        for entry in self.procs.values():
+            if isinstance(entry, QemuProc):
+                if entry.net_name:
+                    self.by_net_name[entry.net_name] = entry
+            elif entry:
+                for fwd in entry:
+                    self.by_host_ip.setdefault(fwd.target, []).append(fwd)
+        self.last_scan = now
+
+    def vms(self):
+        self.refresh()
+        return [e for e in self.procs.values() if isinstance(e, QemuProc)]
+
+    def find_vm(self, net_name):
+        '''VM started with -n net_name, falling back to any VM whose
+        command line mentions net_name the way the old grep did'''
+        self.refresh()
+        vm = self.by_net_name.get(net_name)
+        if vm is None:
+            for entry in self.vms():
+                if net_name in entry.cmdline:
+                    return entry
+        return vm
+
+    def _serial_port(self, net_name, index):
+        vm = self.find_vm(net_name)
+        if vm is None or len(vm.serial_ports) <= index:
+            return None
+        return vm.serial_ports[index]
+
+    def host_telnet_port(self, net_name):
+        return self._serial_port(net_name, HOST_CONSOLE_SERIAL)
+
+    def xr_telnet_port(self, net_name):
+        return self._serial_port(net_name, XR_CONSOLE_SERIAL)
+
+    def ssh_forwards(self, host_ip=None, local_port=None, dest_host=None, dest_port=None):
+        self.refresh()
+        if host_ip is not None:
+            forwards = list(self.by_host_ip.get(host_ip, []))
+        else:
+            forwards = [f for fwds in self.by_host_ip.values() for f in fwds]
+        if local_port is not None:
+            forwards = [f for f in forwards if f.local_port == int(local_port)]
+        if dest_host is not None:
+            forwards = [f for f in forwards if f.dest_host == dest_host]
+        if dest_port is not None:
+            forwards = [f for f in forwards if f.dest_port == int(dest_port)]
+        return forwards
+
+
+INDEX = ProcIndex()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('action', choices=['host-port', 'xr-port', 'fwd-port', 'fwd-pids'],
+                        help="host-port/xr-port NET: console telnet ports of a VM, "
+                             "fwd-port HOST_IP: local ssh forward port to a host, "
+                             "fwd-pids PORT: pids of the ssh forwards to the XR lxc on a local port")
+    parser.add_argument('key', help="net name, host ip or local port", type=str)
+
+    args = parser.parse_args(argv)
+
+    if args.action == 'host-port':
+        result = [INDEX.host_telnet_port(args.key)]
+    elif args.action == 'xr-port':
+        result = [INDEX.xr_telnet_port(args.key)]
+    elif args.action == 'fwd-port':
+        result = [f.local_port for f in INDEX.ssh_forwards(host_ip=args.key)]
+    else:
+        result = [f.pid for f in INDEX.ssh_forwards(local_port=args.key, dest_host=XR_SSH_DEST[0],
+                                                    dest_port=XR_SSH_DEST[1])]
+
+    result = [r for r in result if r is not None]
+    if not result:
+        sys.exit(1)
+    for r in sorted(set(result)):
+        print r
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,160 @@
+import os
+import sys
+import time
+import shlex
+import argparse
+import threading
+import subprocess
+import Queue
+from port_alloc import PortAllocator
+
+ABS_PATH = os.path.dirname(os.path.abspath(__file__))
+LOG_DIR = os.path.join(ABS_PATH, "logs")
+
+# Same range display.sh hands ssh forwarding ports out of
+FWD_PORT_BASE = 7000
+FWD_PORT_MAX = 7060
+
+
+def read_inventory(path):
+    '''Inventory lines are "net_name host_telnet_port xr_telnet_port [fwd_port]",
+    blank lines and # comments are skipped'''
+    routers = []
+    with open(path) as inv:
+        for line in inv:
+            line = line.split('#')[0].strip()
+            if not line:
+                continue
+            routers.append(parse_router(line.split()))
+    return routers
+
+
+def parse_router(fields):
+    if len(fields) not in (3, 4):
+        raise ValueError("Expected net_name host_port xr_port [fwd_port], got "+str(fields))
+    router = {"net_name": fields[0], "host_telnet": fields[1], "xr_telnet": fields[2], "fwd_port": None}
+    if len(fields) == 4:
+        router["fwd_port"] = int(fields[3])
+    return router
+
+
+def assign_fwd_ports(routers, base=FWD_PORT_BASE, top=FWD_PORT_MAX, allocator=None):
+    '''Lease a distinct free forwarding port for every router without an
+    explicit one, the leases last as long as this process. Ports set in the
+    inventory are not bound yet, so they are kept out of the lease'''
+    pending = [r for r in routers if not r["fwd_port"]]
+    if not pending:
+        return
+    taken = set(r["fwd_port"] for r in routers if r["fwd_port"])
+    allocator = allocator or PortAllocator()
+    ports = allocator.allocate(base, top, "provision_fleet", count=len(pending), skip=taken)
+    for router, port in zip(pending, ports):
+        router["fwd_port"] = port
+
+
+def provision_cmd(router, chef_install, log_dir):
+    cmd = "python "+ABS_PATH+"/setup_netstack.py -p "+str(router["host_telnet"])+" -x "+str(router["xr_telnet"]) + \
+          " -n "+router["net_name"]+" -f "+str(router["fwd_port"]) + \
+          " -t "+os.path.join(log_dir, router["net_name"]+".trace.json")
+    if chef_install:
+        cmd += " -c"
+    return cmd
+
+
+def provision_router(router, chef_install, log_dir):
+    '''Run setup_netstack for one router in its own process, output to its own log'''
+    log_path = os.path.join(log_dir, router["net_name"]+".log")
+    cmd = provision_cmd(router, chef_install, log_dir)
+    start = time.time()
+    with open(log_path, "w") as log:
+        log.write("cmd is "+cmd+"\n")
+        log.flush()
+        try:
+            status = subprocess.call(shlex.split(cmd), stdout=log, stderr=subprocess.STDOUT)
+        except Exception, e:
+            log.write(str(e)+"\n")
+            status = -1
+    return {"net_name": router["net_name"], "fwd_port": router["fwd_port"], "status": status,
+            "duration": time.time() - start, "log": log_path}
+
+
+def provision_fleet(routers, concurrency, chef_install=False, log_dir=LOG_DIR):
+    '''Provision routers in parallel, at most concurrency at a time.
+
+    Each router runs in a separate setup_netstack process, so one failing
+    router never takes the others down. Returns one result per router in
+    inventory order.
+    '''
+    if not os.path.isdir(log_dir):
+        os.makedirs(log_dir)
+
+    work = Queue.Queue()
+    for index, router in enumerate(routers):
+        work.put((index, router))
+    results = [None] * len(routers)
+
+    def worker():
+        while True:
+            try:
+                index, router = work.get_nowait()
+            except Queue.Empty:
+                return
+            print "Provisioning "+router["net_name"]+" (ssh forward port "+str(router["fwd_port"])+")"
+            start = time.time()
+            try:
+                result = provision_router(router, chef_install, log_dir)
+            except Exception, e:
+                # Keep the worker going for the routers still queued
+                print "Provisioning "+router["net_name"]+" failed: "+str(e)
+                result = {"net_name": router["net_name"], "fwd_port": router["fwd_port"], "status": -1,
+                          "duration": time.time() - start, "log": None}
+            results[index] = result
+            print router["net_name"]+" finished with status "+str(result["status"])+" in %.1fs" % result["duration"]
+
+    threads = [threading.Thread(target=worker) for i in range(max(1, min(concurrency, len(routers))))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def print_summary(results):
+    print "\n%-20s %-8s %-10s %-10s %s" % ("NET", "PORT", "STATUS", "TIME(s)", "LOG")
+    for result in results:
+        status = "ok" if result["status"] == 0 else "FAILED(" + str(result["status"]) + ")"
+        print "%-20s %-8s %-10s %-10.1f %s" % (result["net_name"], result["fwd_port"], status,
+                                             result["duration"], result["log"])
+    failed = len([r for r in results if r["status"] != 0])
+    print "\n"+str(len(results) - failed)+" succeeded, "+str(failed)+" failed"
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--inventory', help="file with one \"net_name host_port xr_port [fwd_port]\" per line", type=str)
+    parser.add_argument('-r', '--router', help="net_name:host_port:xr_port[:fwd_port], may be repeated", action='append', default=[])
+    parser.add_argument('-j', '--concurrency', help="max routers provisioned at once", type=int, default=8)
+    parser.add_argument('-l', '--log_dir', help="directory for per-router logs", type=str, default=LOG_DIR)
+    parser.add_argument('-c', '--chef_client_install', help="install chef client", action='store_true')
+
+    args = parser.parse_args(argv)
+
+    routers = []
+    if args.inventory:
+        routers.extend(read_inventory(args.inventory))
+    for spec in args.router:
+        routers.append(parse_router(spec.split(':')))
+    if not routers:
+        parser.error("no routers given, use -i and/or -r")
+
+    assign_fwd_ports(routers)
+    results = provision_fleet(routers, args.concurrency, args.chef_client_install, args.log_dir)
+    print_summary(results)
+
+    if any(r["status"] != 0 for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
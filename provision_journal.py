@@ -0,0 +1,91 @@
+import os
+import json
+import time
+from tracer import TRACER
+
+JOURNAL_DIR = os.path.join(os.path.expanduser('~'), '.nested_router_provisioner', 'journal')
+
+
+class Journal(object):
+    '''Per router record of the provisioning steps already completed.
+
+    Each completed step is stored with the values it produced (host ip,
+    interface MAC, ifh, ...) in a JSON file, so a rerun can pick those up
+    and resume at the first step that still needs doing. The journal is
+    reset when the router is provisioned with different arguments.
+    '''
+
+    def __init__(self, net_name, params, journal_dir=JOURNAL_DIR, fresh=False):
+        self.path = os.path.join(journal_dir, net_name+".json")
+        if not os.path.isdir(journal_dir):
+            os.makedirs(journal_dir)
+        self.state = {"net_name": net_name, "params": params, "steps": []}
+        if not fresh and os.path.exists(self.path):
+            with open(self.path) as f:
+                state = json.load(f)
+            if state.get("params") == params:
+                self.state = state
+            else:
+                print "Provisioning arguments changed, starting "+net_name+" from scratch"
+        self.save()
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.rename(tmp, self.path)
+
+    def outputs(self, step):
+        '''Values recorded for a completed step, None if it never completed'''
+        for entry in self.state["steps"]:
+            if entry["name"] == step:
+                return entry["outputs"]
+        return None
+
+    def record(self, step, outputs):
+        self.state["steps"].append({"name": step, "time": time.time(), "outputs": outputs})
+        self.save()
+
+    def truncate(self, step):
+        '''Forget step and every step recorded after it'''
+        names = [entry["name"] for entry in self.state["steps"]]
+        if step in names:
+            self.state["steps"] = self.state["steps"][:names.index(step)]
+            self.save()
+
+
+def run_steps(journal, steps, ctx, on_update=None):
+    '''Run (name, func, verify) steps in order, skipping completed ones.
+
+    func(ctx) does the work and returns a dict of values to merge into ctx
+    and record. A completed step is skipped while verify(ctx) (if given)
+    confirms it still holds; from the first step that is not skipped on,
+    everything runs again. on_update(ctx) is called whenever ctx changes.
+    '''
+    resuming = True
+    for name, func, verify in steps:
+        outputs = journal.outputs(name)
+        if resuming and outputs is not None:
+            ctx.update(outputs)
+            if on_update:
+                on_update(ctx)
+            try:
+                with TRACER.span(name, "verify"):
+                    still_valid = verify is None or verify(ctx)
+            except Exception, e:
+                print "Check for "+name+" failed: "+str(e)
+                still_valid = False
+            if still_valid:
+                print "Skipping "+name+", already done"
+                continue
+
+        resuming = False
+        journal.truncate(name)
+        print "\nRunning step "+name+"\n"
+        with TRACER.span(name, "step"):
+            outputs = func(ctx) or {}
+        ctx.update(outputs)
+        if on_update:
+            on_update(ctx)
+        journal.record(name, outputs)
+    return ctx
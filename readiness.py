@@ -0,0 +1,64 @@
+import time
+import random
+from tracer import TRACER
+
+
+class ReadinessTimeout(Exception):
+    """Raised when a probe does not pass before its deadline"""
+
+    def __init__(self, probe, attempts, last_error):
+        msg = probe.name+" not ready after "+str(probe.deadline)+"s ("+str(attempts)+" attempts)"
+        if last_error is not None:
+            msg += ", last error: "+str(last_error)
+        Exception.__init__(self, msg)
+        self.probe = probe
+        self.attempts = attempts
+        self.last_error = last_error
+
+
+class Probe(object):
+    '''A readiness condition.
+
+    check() returns a value other than None once the condition holds, that
+    value is what wait_for() hands back (so 0 or an empty list pass). None
+    or an exception means "not yet", a boolean check returns True or None.
+    Retries back off exponentially from base to cap seconds with
+    +/- jitter, and the whole wait is bounded by deadline seconds.
+    '''
+
+    def __init__(self, name, check, deadline=300, base=0.5, cap=10, jitter=0.25):
+        self.name = name
+        self.check = check
+        self.deadline = deadline
+        self.base = base
+        self.cap = cap
+        self.jitter = jitter
+
+    def delay(self, attempt):
+        delay = min(self.cap, self.base * (2 ** attempt))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+def wait_for(probe):
+    '''Poll probe until it passes, return the value its check returned'''
+    start = time.time()
+    end = start + probe.deadline
+    attempt = 0
+    last_error = None
+    with TRACER.span(probe.name, "wait"):
+        while True:
+            try:
+                value = probe.check()
+            except Exception, e:
+                value = None
+                last_error = e
+            attempt += 1
+            if value is not None:
+                print probe.name+" ready after %.1fs (%d attempts)" % (time.time() - start, attempt)
+                return value
+
+            remaining = end - time.time()
+            if remaining <= 0:
+                raise ReadinessTimeout(probe, attempt, last_error)
+            TRACER.add("retries", 1)
+            TRACER.sleep(min(probe.delay(attempt - 1), remaining))
@@ -0,0 +1,95 @@
+import re
+import time
+import uuid
+from collections import namedtuple
+from tracer import TRACER
+
+RECV_SIZE = 32768
+
+BatchResult = namedtuple('BatchResult', ['cmd', 'status', 'stdout', 'stderr'])
+
+
+class BatchError(RuntimeError):
+    """Raised when a command of a batch ran but its output did not come back"""
+
+
+def build_script(cmd_list, token, stop_on_error):
+    '''Wrap each command between begin/end markers on both stdout and
+    stderr so one exec channel can carry the whole list'''
+    lines = []
+    for index, cmd in enumerate(cmd_list):
+        begin = "__%s_BEGIN_%d__" % (token, index)
+        end = "__%s_END_%d_" % (token, index)
+        lines.append("printf '%s\\n'; printf '%s\\n' >&2" % (begin, begin))
+        lines.append("{ %s\n} < /dev/null" % cmd)
+        lines.append("rc=$?")
+        lines.append("printf '\\n%s%%d__\\n' $rc; printf '\\n%s%%d__\\n' $rc >&2" % (end, end))
+        if stop_on_error:
+            lines.append("[ $rc -eq 0 ] || exit $rc")
+    return "\n".join(lines) + "\n"
+
+
+def split_output(data, token):
+    '''Return {index: (status, text)} for every command that finished'''
+    pattern = re.compile(r'__%s_BEGIN_(\d+)__\n(.*?)\n__%s_END_\1_(\d+)__\n' % (token, token), re.S)
+    results = {}
+    for match in pattern.finditer(data):
+        results[int(match.group(1))] = (int(match.group(3)), match.group(2))
+    return results
+
+
+@TRACER.traced("batch", "remote")
+def run_batch(client, cmd_list, stop_on_error=True, timeout=None):
+    '''Run an ordered list of shell commands over a single exec channel.
+
+    Returns a BatchResult per command that ran, in order. With
+    stop_on_error the batch ends at the first non-zero exit status,
+    otherwise every command runs regardless. Raises BatchError when a
+    command that should have run has no result.
+    '''
+    token = "NRP" + uuid.uuid4().hex[:8]
+    script = build_script(cmd_list, token, stop_on_error)
+    TRACER.add("commands", len(cmd_list))
+
+    channel = client.get_transport().open_session()
+    channel.exec_command(script)
+
+    # Drain stdout and stderr together, the channel window is shared
+    out, err = [], []
+    deadline = None if timeout is None else time.time() + timeout
+    while True:
+        got_data = False
+        if channel.recv_ready():
+            out.append(channel.recv(RECV_SIZE))
+            got_data = True
+        if channel.recv_stderr_ready():
+            err.append(channel.recv_stderr(RECV_SIZE))
+            got_data = True
+        if got_data:
+            continue
+        # The exit status may come in before the last of the output, the
+        # output is only complete once the channel reached EOF
+        if channel.exit_status_ready() and (channel.eof_received or channel.closed):
+            break
+        if deadline is not None and time.time() > deadline:
+            channel.close()
+            raise RuntimeError("Batch timed out after "+str(timeout)+"s: "+str(cmd_list))
+        time.sleep(0.01)
+    exit_status = channel.recv_exit_status()
+    channel.close()
+
+    TRACER.add("bytes", len(script) + sum(len(d) for d in out + err))
+
+    stdout = split_output(''.join(out), token)
+    stderr = split_output(''.join(err), token)
+
+    results = []
+    for index, cmd in enumerate(cmd_list):
+        if index not in stdout:
+            if stop_on_error and results and results[-1].status != 0:
+                break
+            raise BatchError("No result for command "+str(index)+" ("+cmd+") of the batch, it exited with "
+                             + str(exit_status))
+        status, text = stdout[index]
+        results.append(BatchResult(cmd, status, text, stderr.get(index, (status, ''))[1]))
+    return results
@@ -0,0 +1,159 @@
+import time
+import heapq
+import random
+import threading
+import Queue
+
+SKIP = 'skip'
+COALESCE = 'coalesce'
+
+
+class Job(object):
+    '''A callable run every interval seconds, and what its runs looked like'''
+
+    def __init__(self, name, func, interval, offset, overlap):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.overlap = overlap
+        self.next_due = time.time() + offset
+        self.queued = False
+        self.running = False
+        self.pending = None
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.queued_ticks = 0
+        self.last_start = None
+        self.last_duration = None
+        self.last_lag = None
+        self.last_error = None
+
+    def metrics(self):
+        return {"interval": self.interval, "overlap": self.overlap, "queued": self.queued, "running": self.running,
+                "runs": self.runs, "failures": self.failures, "skipped": self.skipped,
+                "queued_ticks": self.queued_ticks, "last_start": self.last_start,
+                "last_duration": self.last_duration, "last_lag": self.last_lag, "last_error": self.last_error,
+                "next_due": self.next_due}
+
+
+class Scheduler(object):
+    '''Runs jobs at a fixed rate on a bounded pool of worker threads.
+
+    A job is due at its first start plus a whole number of intervals, so a
+    slow run does not push the following ones back. A job never overlaps
+    itself: a tick that comes while it is still running is dropped (SKIP),
+    or remembered and run as soon as the current run ends (COALESCE, any
+    number of missed ticks make one run). Those are counted as skipped. A
+    tick that comes while the job still waits for a free worker is counted
+    as a queued tick instead, the run it waits for covers it.
+    '''
+
+    def __init__(self, workers=4):
+        self.cond = threading.Condition()
+        self.jobs = {}
+        self.heap = []
+        self.work = Queue.Queue()
+        self.workers = workers
+        self.threads = []
+        self.stopped = False
+
+    def every(self, name, interval, func, jitter=0, offset=None, overlap=SKIP):
+        '''Run func() every interval seconds, the first time after offset
+        seconds, or a random 0..jitter seconds when no offset is given'''
+        if offset is None:
+            offset = random.uniform(0, jitter)
+        job = Job(name, func, interval, offset, overlap)
+        with self.cond:
+            if name in self.jobs:
+                raise ValueError("A job named "+name+" is already scheduled")
+            self.jobs[name] = job
+            heapq.heappush(self.heap, (job.next_due, name))
+            self.cond.notify()
+        return job
+
+    def _dispatch(self):
+        while True:
+            with self.cond:
+                while not self.stopped and (not self.heap or self.heap[0][0] > time.time()):
+                    self.cond.wait(self.heap[0][0] - time.time() if self.heap else None)
+                if self.stopped:
+                    return
+                due, name = heapq.heappop(self.heap)
+                job = self.jobs[name]
+                # Next tick on the fixed grid, past ticks missed while the
+                # dispatcher was behind are not replayed
+                job.next_due = due + job.interval * max(1, int((time.time() - due) // job.interval) + 1)
+                heapq.heappush(self.heap, (job.next_due, name))
+                if job.queued:
+                    job.queued_ticks += 1
+                    continue
+                if job.running:
+                    job.skipped += 1
+                    if job.overlap == COALESCE:
+                        job.pending = job.pending or due
+                    continue
+                job.queued = True
+            self.work.put((job, due))
+
+    def _work(self):
+        while True:
+            item = self.work.get()
+            if item is None:
+                return
+            job, due = item
+            with self.cond:
+                job.queued = False
+                if self.stopped:
+                    continue
+                job.running = True
+            while due is not None:
+                start = time.time()
+                error = None
+                try:
+                    job.func()
+                except Exception, e:
+                    error = e
+                with self.cond:
+                    job.runs += 1
+                    job.last_start = start
+                    job.last_lag = start - due
+                    job.last_duration = time.time() - start
+                    job.last_error = str(error) if error is not None else None
+                    if error is not None:
+                        job.failures += 1
+                    # A coalesced tick runs right away on this worker
+                    due, job.pending = job.pending, None
+                    if self.stopped:
+                        due = None
+                    job.running = due is not None
+                if error is not None:
+                    print "Job "+job.name+" failed: "+str(error)
+
+    def start(self):
+        if not self.threads:
+            self.threads.append(threading.Thread(target=self._dispatch, name="scheduler"))
+            for i in range(self.workers):
+                self.threads.append(threading.Thread(target=self._work, name="scheduler worker %d" % i))
+            for thread in self.threads:
+                thread.daemon = True
+                thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        '''Stop dispatching and end the threads once the runs in progress
+        are over. Returns whether they all ended within timeout seconds.'''
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        for thread in self.threads[1:]:
+            self.work.put(None)
+        end = None if timeout is None else time.time() + timeout
+        for thread in self.threads:
+            thread.join(None if end is None else max(0, end - time.time()))
+        return not any(thread.is_alive() for thread in self.threads)
+
+    def metrics(self):
+        '''{job name: metrics} of every job'''
+        with self.cond:
+            return dict((name, job.metrics()) for name, job in self.jobs.iteritems())
@@ -10,16 +10,64 @@ import pdb
 import time
 import re
 import os.path
+from expect_channel import ExpectChannel, ExpectTimeout, xr_cli_login, XR_PROMPTS, SHELL_PROMPT
+from ssh_pool import POOL
+from remote_batch import run_batch
+from readiness import Probe, wait_for
+import telnet_console
+from proc_index import INDEX
+from provision_journal import Journal, run_steps
+from file_transfer import transfer_files, push, pull
+from xr_config import ConfigPlan, apply_config_plan
+from xr_parsers import ShowInterfacesParser, ShowImDatabaseParser, parse_stream
+from inventory import Inventory, INVENTORY_DB
+from tracer import TRACER
+import forward_daemon
+from endpoints import HOST_SSH_PORT, XR_SSH_DEST
+import xr_session
+from xr_session import XR_LOGIN_TIMEOUT, XR_CMD_TIMEOUT
 
 logging.basicConfig(level=logging.DEBUG)
 
 ABS_PATH = os.path.dirname(os.path.abspath(__file__))
 home_dir = os.path.expanduser('~')
 HOST_IP = ''
+HOST_PORT = HOST_SSH_PORT
 CHEF_SERVER_IP = ""
 host_prefix = "xr-shell-"
 XR_LXC_HOST = ""
 
+# Per command timeout (seconds) for the interactive linux shells, commands
+# return as soon as the prompt is back
+SHELL_CMD_TIMEOUT = 30
+
+# Upper bounds (seconds) on the readiness waits, each wait ends as soon as
+# its condition holds
+LXC_UP_DEADLINE = 900
+XR_SSH_DEADLINE = 300
+XR_CLI_DEADLINE = 300
+TAP_UP_DEADLINE = 60
+XR_INTF_DEADLINE = 300
+
+XR_MGMT_INTF = "GigabitEthernet0/RP0/CPU0/0"
+
+def host_client():
+    '''Pooled SSH client to the host linux'''
+    return POOL.get_client(HOST_IP, HOST_PORT, 'root', 'lab')
+
+def xr_client():
+    '''Pooled SSH client to the XR lxc shell, nested in the host transport'''
+    return xr_session.xr_client(HOST_IP, HOST_PORT)
+
+def ssh_dir(ctx):
+    '''Local .ssh directory the public key is pushed from and the XR key
+    authorized in'''
+    return ctx.get("ssh_dir", home_dir+"/.ssh")
+
+def files_dir(ctx):
+    '''Local directory holding kimctrl and start_netbroker.sh'''
+    return ctx.get("files_dir", ABS_PATH)
+
 def split_by_n( seq, n ):
     """A generator to divide a sequence into chunks of n units."""
     while seq:
@@ -27,287 +75,232 @@ def split_by_n( seq, n ):
         seq = seq[n:]
 
 
-def disable_paging(remote_conn):
-    '''Disable paging on a Cisco router'''
-
-    remote_conn.send("terminal length 0\n")
-    time.sleep(1)
-
-    # Clear the buffer on the screen
-    output = remote_conn.recv(1000)
-
+def run_shell_cmd_list(console, cmd_list, eol, timeout=SHELL_CMD_TIMEOUT):
+    '''Run commands one after the other in an interactive linux shell,
+    moving on as soon as the shell prompt is back'''
+    output = ""
+    for cmd in cmd_list:
+        try:
+            output += console.run(str(cmd), SHELL_PROMPT, timeout, eol)
+        except ExpectTimeout, e:
+            print "No prompt after "+str(timeout)+"s for: "+str(cmd)
+            output += e.output
+            console.buffer = ""
     return output
 
-def rexists(sftp, path):
-    """os.path.exists for paramiko's SCP object
-    """
-    try:
-        sftp.stat(path)
-    except IOError, e:
-        if e[0] == 2:
-            return False
-    else:
-        return True
-
 def get_host_ip(host_port):
-    cmd = ABS_PATH+"/get_host_ip.tcl "+ str(host_port)
-    host_ip = subprocess.check_output(shlex.split(cmd))
+    host_ip = telnet_console.get_host_ip(host_port)
     return host_ip
 
 def setup_xr_console(xr_port):
-    cmd = ABS_PATH+"/setup_xr_console.tcl "+ str(xr_port)
-    print "\n\n\n CMD is \n\n\n"
-    print str(cmd) + "\n\n\n"
-    output = subprocess.check_output(shlex.split(cmd))
+    print "\n\n\n Setting up XR console on port "+str(xr_port)+"\n\n\n"
+    telnet_console.setup_xr_console(xr_port)
     return
 
-def setup_host_auth(host_port):
-    proxy_hostname = HOST_IP 
-    proxy_username = 'root'
-    proxy_password = 'lab'
-    proxy_port = 22
+def setup_host_auth(host_port, local_file=None):
+    proxy_client = host_client()
 
-    proxy_client = paramiko.SSHClient()
-    proxy_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    proxy_client.connect(proxy_hostname, username=proxy_username, password=proxy_password, timeout=5)
-
-    sftp = proxy_client.open_sftp()
     remote_file="/root/base_rsa.pub"
-    local_file=home_dir+"/.ssh/id_rsa.pub"
-    sftp.put(local_file, remote_file)
-    sftp.close()
+    local_file=local_file or home_dir+"/.ssh/id_rsa.pub"
+    transfer_files(proxy_client, [push(local_file, remote_file)])
     
     cmd="cat /root/base_rsa.pub >> ~/.ssh/authorized_keys"
     stdin, stdout, stderr = proxy_client.exec_command(cmd)
-
-    proxy_client.close()
+    stdout.channel.recv_exit_status()
     return
 
-def setup_xr_auth(port_ssh_fwd):
-    remote_client = paramiko.SSHClient()
-    remote_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    remote_client.connect('127.0.0.1', port=int(port_ssh_fwd), username='root', password='lab')
+def setup_xr_auth(local_file=None):
+    remote_client = xr_client()
 
-    sftp = remote_client.open_sftp()
     remote_file="/root/base_rsa.pub"
-    local_file=home_dir+"/.ssh/id_rsa.pub"
-    sftp.put(local_file, remote_file)
-    sftp.close()
+    local_file=local_file or home_dir+"/.ssh/id_rsa.pub"
+    transfer_files(remote_client, [push(local_file, remote_file)])
 
     cmd="cat /root/base_rsa.pub >> ~/.ssh/authorized_keys"
     stdin, stdout, stderr = remote_client.exec_command(cmd)
-    remote_client.close()    
+    stdout.channel.recv_exit_status()
     return
    
 def setup_port_forwarding(port_ssh_fwd):
-    #Kill any existing port_forwarding processes
-    cmd = "/bin/bash "+ABS_PATH+"/kill_ssh_port_fwds "+str(port_ssh_fwd)
-    p = subprocess.call(shlex.split(cmd))
+    #Kill any ssh -L process left over from older provisioning runs
+    for fwd in INDEX.ssh_forwards(local_port=port_ssh_fwd, dest_host=XR_SSH_DEST[0], dest_port=XR_SSH_DEST[1]):
+        try:
+            os.kill(fwd.pid, signal.SIGKILL)
+        except OSError, e:
+            print str(e)
 
-    cmd= "ssh -f -N -L "+str(port_ssh_fwd)+":10.11.12.14:22 -l root "+HOST_IP
-    p = subprocess.call(shlex.split(cmd))
+    #The shared forwarder serves the port over its pooled host transport
+    forward = forward_daemon.add_forward(port_ssh_fwd, HOST_IP, host_port=HOST_PORT)
+    print "Forwarding port "+str(forward["local_port"])+" to "+forward["dest_host"]+":"+str(forward["dest_port"])+" via "+HOST_IP
     return
 
 
-def execute_host_cmd(cmd):
-    print "Host command to be executed is\n\n"
-    ssh_cmd = "ssh root@"+HOST_IP+" \""+cmd+"\"" 
-    print str(ssh_cmd)
-    output = subprocess.check_output(shlex.split(ssh_cmd))
-    return output
+def check_batch(results):
+    '''Raise for the first failed command of a batch, like check_output'''
+    for result in results:
+        if result.status != 0:
+            print result.stderr
+            raise subprocess.CalledProcessError(result.status, result.cmd, result.stdout)
+    return results
 
-def execute_host_intr_shell_cmd(inv_shell_cmd_list):
-    proxy_hostname = HOST_IP
-    proxy_username = 'root'
-    proxy_password = 'lab'
-    proxy_port = 22
+def execute_host_cmds(cmd_list, stop_on_error=True):
+    print "Host commands to be executed are\n\n"
+    print cmd_list
+    return run_batch(host_client(), cmd_list, stop_on_error)
 
-    proxy_client = paramiko.SSHClient()
-    proxy_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    proxy_client.connect(proxy_hostname, username=proxy_username, password=proxy_password, timeout=5)
+def execute_host_cmd(cmd):
+    results = check_batch(execute_host_cmds([cmd]))
+    return results[0].stdout
 
-    proxy_console = proxy_client.invoke_shell()
+def execute_host_intr_shell_cmd(inv_shell_cmd_list):
+    proxy_console = ExpectChannel(host_client().invoke_shell())
     print "Interactive SSH session established"
     print "Cmd list is \n\n"
+    print inv_shell_cmd_list
 
-    # Turn off paging
-    disable_paging(proxy_console)
-    for inv_shell_cmd in inv_shell_cmd_list:
-        proxy_console.send(str(inv_shell_cmd)+"\n")
-        time.sleep(2)
-
-    proxy_console.send("\n\n")
-
-    output = proxy_console.recv(10000)
+    proxy_console.expect(SHELL_PROMPT, SHELL_CMD_TIMEOUT)
+    output = run_shell_cmd_list(proxy_console, inv_shell_cmd_list, "\n")
     print output
-    proxy_client.close()
-
-def execute_xr_intr_shell_cmd(inv_shell_cmd_list, port_ssh_fwd):
-    remote_hostname = '127.0.0.1' 
-    remote_username = 'root'
-    remote_password = 'lab'
-    remote_port = int(port_ssh_fwd)
+    proxy_console.channel.close()
 
-    remote_client = paramiko.SSHClient()
-    remote_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    remote_client.connect(remote_hostname, port=remote_port, username=remote_username, password=remote_password, timeout=5)
-
-    remote_console = remote_client.invoke_shell()
+def execute_xr_intr_shell_cmd(inv_shell_cmd_list):
+    remote_console = ExpectChannel(xr_client().invoke_shell())
     print "Interactive SSH session established"
     print "Cmd list is \n\n"
+    print inv_shell_cmd_list
 
-    # Turn off paging
-    disable_paging(remote_console)
-
-    for inv_shell_cmd in inv_shell_cmd_list:
-        remote_console.send(str(inv_shell_cmd)+"\r")
-        remote_console.send("\r\r")
-        time.sleep(2)
-
-
-    output = remote_console.recv(10000)
+    remote_console.expect(SHELL_PROMPT, SHELL_CMD_TIMEOUT)
+    output = run_shell_cmd_list(remote_console, inv_shell_cmd_list, "\r")
     print output
 
-    remote_client.close()
+    remote_console.channel.close()
  
-def execute_xr_console_cmd(cmd_list, port_ssh_fwd):
-    remote_client = paramiko.SSHClient()
-    remote_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    remote_client.connect('127.0.0.1', port=int(port_ssh_fwd), username='root', password='lab')
-
-    remote_console = remote_client.invoke_shell()
-    print "Interactive SSH session established"
-    print "Cmd list is \n\n"
-    print cmd_list
-    output = remote_console.recv(1000)
-    print output
-
-    # Turn off paging
-    disable_paging(remote_console)
-    remote_console.send("exec\n")
-    time.sleep(5)
-    remote_console.send("root\n")
-    remote_console.send("root\n\n\n")
-    remote_console.send("\n\n\n")
-
-    time.sleep(30)
-    remote_console.send("show version \r\r\r")
-    for cmd in cmd_list:
-        remote_console.send(str(cmd)+"\n\n")
-        time.sleep(2)
+def open_xr_console(timeout=XR_LOGIN_TIMEOUT):
+    '''Interactive session logged into the XR CLI with paging turned off,
+    returns (console, login output)'''
+    return xr_session.open_xr_console(xr_client(), timeout)
 
-    remote_console.send(str(cmd)+"\n\n")
-    output = remote_console.recv(10000)
+def execute_xr_console_cmd(cmd_list):
+    output = xr_session.execute_xr_console_cmd(xr_client(), cmd_list)
     print output
-    remote_client.close() 
     return output
  
     
-def execute_xr_shell_cmd(cmd, port_ssh_fwd):
-    print "XR command to be executed is\n\n"
-    ssh_cmd = "ssh -p "+str(port_ssh_fwd)+" root@127.0.0.1 \""+cmd+"\""
-    print str(ssh_cmd)
-    output = subprocess.check_output(shlex.split(ssh_cmd))
-    return output
+def execute_xr_shell_cmds(cmd_list, stop_on_error=True):
+    print "XR commands to be executed are\n\n"
+    print cmd_list
+    return run_batch(xr_client(), cmd_list, stop_on_error)
+
+def execute_xr_shell_cmd(cmd):
+    results = check_batch(execute_xr_shell_cmds([cmd]))
+    return results[0].stdout
 
     
 def is_xr_lxc_up():
+    '''True once the XR LXC is running, None until then'''
     output = execute_host_cmd("virsh -c lxc:/// list | awk '{print $2}'")
-    for lxc in output.split():
-        if lxc == "default-sdr--1":
-            result = True
-            break
-        else:
-            result = False
-    return result
-
-def check_remote_path(remote_host, user, pswd, port, path_name):
-
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    client.connect(remote_host, port=int(port), username=user, password=pswd, timeout=5)
-
-    sftp = client.open_sftp()
-    if rexists(sftp, path_name):
-        result = True
-    else:
-        result = False
-    sftp.close()
-    client.close()
-    return result
-
-def main(argv):
-    global HOST_IP
-
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-p', '--host_telnet_port', help="telnet port to connect to host linux", nargs='+', type=str)
-    parser.add_argument('-x', '--XR_telnet_port', help="telnet port to connect to XR console", nargs='+', type=str)
-    parser.add_argument('-n', '--net_name', help="user defined net name", nargs='+', type=str)
-    parser.add_argument('-f', '--port_ssh_fowarding', help="Port to forward the XR shell ssh connection to", nargs='+', type=str)
-    parser.add_argument('-c', '--chef_client_install', help="install chef client", action='store_true')
-
-    args = parser.parse_args()
-
-    host_telnet=args.host_telnet_port[0]
-    xr_telnet=args.XR_telnet_port[0]
-    net_name=args.net_name[0]
-    port_ssh_fwd= args.port_ssh_fowarding[0]
-    chef_install=args.chef_client_install
+    if "default-sdr--1" in output.split():
+        return True
+    return None
+
+def xr_show(console, cmd, parser):
+    '''Run an XR show command, echoing its output as it streams in, and
+    yield the parser's records along the way'''
+    def echo(chunks):
+        for chunk in chunks:
+            sys.stdout.write(chunk)
+            yield chunk
+    return parse_stream(parser, echo(console.stream(cmd, XR_PROMPTS, XR_CMD_TIMEOUT)))
+
+def get_xr_intf_mac(console, intf=XR_MGMT_INTF):
+    '''MAC of an XR interface in aa:bb:cc:dd:ee:ff form, None until it shows up'''
+    mac_addr = None
+    # Read through to the prompt even once the MAC is known, the session is reused
+    for record in xr_show(console, 'sh interfaces '+intf, ShowInterfacesParser(needed=("mac",))):
+        if record["name"] == intf:
+            mac_addr = record["mac"]
+    if mac_addr is None:
+        return None
+    return ':'.join((split_by_n(''.join(mac_addr.split('.')),2)))
+
+def get_xr_ifh(console, intf=XR_MGMT_INTF):
+    '''ifh allocated to an XR interface, None until it is allocated'''
+    ifh_value = None
+    for record in xr_show(console, 'sh im database interface '+intf, ShowImDatabaseParser()):
+        if record["name"] == intf:
+            ifh_value = record["ifh"]
+    return ifh_value
+
+def step_host_ip(ctx):
+    #A host ip recorded for this very VM saves a console login
+    entry = Inventory(ctx.get("inventory", INVENTORY_DB)).get(ctx["net_name"])
+    if entry and entry["host_ip"]:
+        try:
+            POOL.get_client(entry["host_ip"], ctx.get("host_ssh_port", HOST_SSH_PORT), 'root', 'lab')
+            print "Host ip "+entry["host_ip"]+" taken from the inventory"
+            return {"host_ip": entry["host_ip"]}
+        except Exception, e:
+            print "Host not reachable on the inventory ip "+entry["host_ip"]+": "+str(e)
     print "Trying to determine the ip address of the host"
+    return {"host_ip": get_host_ip(ctx["host_telnet"])}
 
-    HOST_IP = get_host_ip(host_telnet).rstrip('\n')
+def verify_host_ip(ctx):
+    return host_client() is not None
 
+def step_host_auth(ctx):
     #Remove known hosts
-    if os.path.exists(home_dir+'/.ssh/known_hosts'):
-        cmd = "rm "+home_dir+"/.ssh/known_hosts"
+    if os.path.exists(ssh_dir(ctx)+'/known_hosts'):
+        cmd = "rm "+ssh_dir(ctx)+"/known_hosts"
         print "cmd is "+str(cmd)
         output = subprocess.check_output(shlex.split(cmd))
 
+    setup_host_auth(ctx["host_telnet"], ssh_dir(ctx)+"/id_rsa.pub")
 
-    setup_host_auth(host_telnet) 
-
+def step_lxc_up(ctx):
     print "\n\n\nChecking if XR lxc is up.....\n\n\n"
-    while True: 
-        lxc_output = is_xr_lxc_up()
-        if lxc_output == True:
-            print "XR LXC is up"
-            break
-        time.sleep(2)
-    #Now that XR lxc is up, wait for about 30 seconds
-    print "Sleep for about 30 seconds"
- 
-    time.sleep(30)
-    
-    #Now try to set up XR console
-    setup_xr_console(xr_telnet)
+    wait_for(Probe("XR LXC", is_xr_lxc_up, deadline=LXC_UP_DEADLINE))
 
-    setup_port_forwarding(port_ssh_fwd)
-        
-    setup_xr_auth(port_ssh_fwd)
+def step_xr_console(ctx):
+    #Now try to set up XR console, the console script retries until the
+    #XR prompt shows up so there is no need to wait for it here
+    setup_xr_console(ctx["xr_telnet"])
 
-    #Now start executing commands
-    #Determine the ip address of <net>Br1
-    cmd = "ifconfig "+net_name+"Br1"
-    output = subprocess.check_output(shlex.split(cmd))
+def step_port_forwarding(ctx):
+    setup_port_forwarding(ctx["port_ssh_fwd"])
+    return {"fwd_port": int(ctx["port_ssh_fwd"])}
 
-    gip = re.search(r'inet addr:(\S+)', output)
-    mac = re.search(r'HWaddr\s+(\S+)', output)
- 
-    #Create a list of xr console commands
- 
-    xr_int_ip = '.'.join([gip.group(1).split('.')[0], gip.group(1).split('.')[1], gip.group(1).split('.')[2], str(int(gip.group(1).split('.')[3])+9)])
+def verify_port_forwarding(ctx):
+    return any(f["local_port"] == ctx["fwd_port"] for f in forward_daemon.list_forwards(host=HOST_IP))
+
+def step_xr_auth(ctx):
+    wait_for(Probe("XR shell ssh", xr_client, deadline=XR_SSH_DEADLINE))
+    setup_xr_auth(ssh_dir(ctx)+"/id_rsa.pub")
 
-    xr_con_cmd_list = ['conf t', 'int GigabitEthernet0/RP0/CPU0/0', 'ip addr '+xr_int_ip+' 255.255.255.0', 'no shut', 'commit'] 
-    execute_xr_console_cmd(xr_con_cmd_list, port_ssh_fwd)
+def verify_xr_auth(ctx):
+    return xr_client() is not None
 
-    xr_con_cmd_list = ['conf t', 'router static address-family ipv4 unicast 0.0.0.0/0 GigabitEthernet0/RP0/CPU0/0 '+ str(gip.group(1)), 'commit']     
+def step_xr_config(ctx):
+    gip = ctx["gip"]
+    xr_int_ip = '.'.join([gip.split('.')[0], gip.split('.')[1], gip.split('.')[2], str(int(gip.split('.')[3])+9)])
 
-    execute_xr_console_cmd(xr_con_cmd_list, port_ssh_fwd)
+    #All the XR config for this router, only what differs from the running
+    #config gets committed
+    plan = ConfigPlan()
+    plan.set('interface '+XR_MGMT_INTF, 'ipv4 address '+xr_int_ip+' 255.255.255.0')
+    plan.unset('interface '+XR_MGMT_INTF, 'shutdown')
+    plan.set('router static', 'address-family ipv4 unicast', '0.0.0.0/0 '+XR_MGMT_INTF+' '+str(gip))
 
+    remote_console, output = open_xr_console()
+    changed, config_output = apply_config_plan(remote_console, plan, XR_CMD_TIMEOUT)
+    print output + config_output
+    remote_console.channel.close()
+    return {"xr_int_ip": xr_int_ip}
+
+def step_tap(ctx):
     create_tap = 0
 
     try:
-        output = execute_xr_shell_cmd('ifconfig tap123', port_ssh_fwd)
+        output = execute_xr_shell_cmd('ifconfig tap123')
     except Exception,e:
         print(e)
         create_tap = 1
@@ -315,89 +308,71 @@ def main(argv):
     if create_tap:
         while True:
             try:
-                execute_host_cmd('modprobe lcndklm')
-                time.sleep(2)
-                execute_host_cmd('echo 1 1 1 1 > /proc/sys/kernel/printk')
-                time.sleep(2)
-
-                if not check_remote_path('127.0.0.1', 'root', 'lab',  port_ssh_fwd, "/dev/net"):
-                    execute_xr_shell_cmd('mkdir /dev/net/', port_ssh_fwd)
-                    time.sleep(2)
-                if not check_remote_path('127.0.0.1', 'root', 'lab', port_ssh_fwd, '/dev/net/tuncisco'):
-                    execute_xr_shell_cmd('mknod /dev/net/tuncisco c 10 201', port_ssh_fwd)
-                    time.sleep(2)
-
-                execute_xr_console_cmd(['proc restart netio'], port_ssh_fwd)
-                time.sleep(5)
-                execute_xr_shell_cmd('ifconfig tap123 up', port_ssh_fwd)
-                time.sleep(2)
+                check_batch(execute_host_cmds(['modprobe lcndklm', 'echo 1 1 1 1 > /proc/sys/kernel/printk']))
+
+                check_batch(execute_xr_shell_cmds(['[ -d /dev/net ] || mkdir /dev/net/',
+                                                   '[ -e /dev/net/tuncisco ] || mknod /dev/net/tuncisco c 10 201']))
+
+                execute_xr_console_cmd(['proc restart netio'])
+                wait_for(Probe("tap123", lambda: execute_xr_shell_cmds(['ifconfig tap123 up'])[0].status == 0 or None,
+                               deadline=TAP_UP_DEADLINE))
 
                 break
             except Exception,e:
                 print(e)
-                execute_xr_shell_cmd('rm -r /dev/net', port_ssh_fwd)
+                execute_xr_shell_cmd('rm -r /dev/net')
 
-    while True:
-        show_int_out = execute_xr_console_cmd(['sh interfaces GigabitEthernet 0/RP0/CPU0/0'], port_ssh_fwd)
-        print show_int_out
-        try:
-            mac_addr = re.search(r'address is\s+(\S+)\s+\(bia', show_int_out)
-            xr_intf_mac = ':'.join((split_by_n(''.join(mac_addr.group(1).split('.')),2)))
-            print xr_intf_mac
-            break 
-        except Exception,e:
-            print str(e)
-        time.sleep(2)
+def verify_tap(ctx):
+    return execute_xr_shell_cmds(['ifconfig tap123'])[0].status == 0
 
-    while True:
-        show_im_db =  execute_xr_console_cmd(['sh im database interface GigabitEthernet 0/RP0/CPU0/0'], port_ssh_fwd)
-        print show_im_db
-        try:
-            ifh_value =  re.search(r'ifh\s+(\S+)\s+\(', show_im_db)
-            xr_ifh_value= int(ifh_value.group(1), 0)
-            print xr_ifh_value
-            break 
-        except Exception,e: 
-            print str(e)
-        time.sleep(2)
-
- 
-   #Give the XR instance some rest. Sleep for 15 seconds
-    time.sleep(15)
-   #Copy kimctrl to host
-    cmd = "scp "+ABS_PATH+"/kimctrl root@"+HOST_IP+":/root/kimctrl"
-    print "cmd is "+str(cmd)
-    output = subprocess.check_output(shlex.split(cmd))
+def step_xr_intf(ctx):
+    #One XR CLI session is reused for every retry of the interface probes
+    xr_console, output = wait_for(Probe("XR CLI", lambda: open_xr_console(XR_CMD_TIMEOUT), deadline=XR_CLI_DEADLINE))
+    try:
+        xr_intf_mac = wait_for(Probe("XR interface MAC", lambda: get_xr_intf_mac(xr_console), deadline=XR_INTF_DEADLINE))
+        print xr_intf_mac
 
+        xr_ifh_value = wait_for(Probe("XR interface ifh", lambda: get_xr_ifh(xr_console), deadline=XR_INTF_DEADLINE))
+        print xr_ifh_value
+    finally:
+        xr_console.channel.close()
+    return {"xr_intf_mac": xr_intf_mac, "xr_ifh_value": xr_ifh_value}
 
+def step_netdevice(ctx):
+   #Copy kimctrl to host
+    transfer_files(host_client(), [push(files_dir(ctx)+"/kimctrl", "/root/kimctrl")])
 
    #Copy netbroker start script to XR
-    cmd = "scp -P "+str(port_ssh_fwd)+" "+ABS_PATH+"/start_netbroker.sh root@127.0.0.1:/root/start_netbroker.sh"
-    print "cmd is "+str(cmd)
-    output = subprocess.check_output(shlex.split(cmd))
-    execute_xr_shell_cmd('chmod 777 /root/start_netbroker.sh', port_ssh_fwd)
+    transfer_files(xr_client(), [push(files_dir(ctx)+"/start_netbroker.sh", "/root/start_netbroker.sh", 0777)])
 
 
 
    #Now create the netdevice
-    execute_host_intr_shell_cmd(['/root/kimctrl -a ge0000 -m '+str(xr_intf_mac)+' -i '+str(xr_ifh_value), '\r\r', 'ps -ef | grep kimctrl'])
-    execute_xr_shell_cmd('ifconfig ge0000 '+str(xr_int_ip)+'  up', port_ssh_fwd) 
-    execute_host_cmd('modprobe cisco_nb')
-    execute_xr_intr_shell_cmd(['/root/start_netbroker.sh'], port_ssh_fwd)
-    execute_xr_shell_cmd('/sbin/arp -s '+str(gip.group(1))+' '+str(mac.group(1)), port_ssh_fwd)
-
-
+    with TRACER.span("kimctrl"):
+        execute_host_intr_shell_cmd(['/root/kimctrl -a ge0000 -m '+str(ctx["xr_intf_mac"])+' -i '+str(ctx["xr_ifh_value"]), '\r\r', 'ps -ef | grep kimctrl'])
+        execute_xr_shell_cmd('ifconfig ge0000 '+str(ctx["xr_int_ip"])+'  up') 
+    with TRACER.span("netbroker"):
+        execute_host_cmd('modprobe cisco_nb')
+        execute_xr_intr_shell_cmd(['/root/start_netbroker.sh'])
+        execute_xr_shell_cmd('/sbin/arp -s '+str(ctx["gip"])+' '+str(ctx["br_mac"]))
+
+def verify_netdevice(ctx):
+    return execute_xr_shell_cmds(['ifconfig ge0000'])[0].status == 0
+
+def step_xr_key(ctx):
    #Copy XR shell public key to local authorized keys 
 
 
-    cmd = "scp -P "+str(port_ssh_fwd)+"  root@127.0.0.1:/root/.ssh/id_rsa.pub "+ABS_PATH+"/xr_shell.pub"
-    output = subprocess.check_output(shlex.split(cmd))
+    transfer_files(xr_client(), [pull("/root/.ssh/id_rsa.pub", files_dir(ctx)+"/xr_shell.pub")])
 
 #    pdb.set_trace()
-    input_file = [ABS_PATH+'/xr_shell.pub']
+    input_file = [files_dir(ctx)+'/xr_shell.pub']
     cmd = ['cat'] + input_file
-    with open(home_dir+'/.ssh/authorized_keys', "a") as outfile:
+    with open(ssh_dir(ctx)+'/authorized_keys', "a") as outfile:
         subprocess.call(cmd, stdout=outfile)
+
+def step_net_setup(ctx):
+    xr_int_ip = ctx["xr_int_ip"]
    #Set up networking and hosts in XR
     xr_int_net = '.'.join([xr_int_ip.split('.')[0], xr_int_ip.split('.')[1], xr_int_ip.split('.')[2], '0'])
 
@@ -410,51 +385,106 @@ def main(argv):
 
     CHEF_SERVER_IP = ip.group(1)
 
-    XR_LXC_HOST = str(host_prefix)+net_name
+    XR_LXC_HOST = str(host_prefix)+ctx["net_name"]
 
 #    net_setup_cmd_list = ['ip route del default', 'ip route add default via '+xr_int_ip+' dev ge0000', 'echo \"'+CHEF_SERVER_IP+' sunstone\" >> /etc/hosts', 'mkdir /root/rpms', 'hostname '+XR_LXC_HOST, 'echo \"'+XR_LXC_HOST+'\" > /etc/hostname' ]
-    net_setup_cmd_list = ['ip route del default', 'ip route add default via '+gip.group(1)+' dev ge0000', 'echo \"'+CHEF_SERVER_IP+' sunstone\" >> /etc/hosts', 'hostname '+XR_LXC_HOST, 'echo \"'+XR_LXC_HOST+'\" > /etc/hostname']
+    net_setup_cmd_list = ['ip route del default', 'ip route add default via '+ctx["gip"]+' dev ge0000', 'echo \"'+CHEF_SERVER_IP+' sunstone\" >> /etc/hosts', 'hostname '+XR_LXC_HOST, 'echo \"'+XR_LXC_HOST+'\" > /etc/hostname']
 
-    if not check_remote_path('127.0.0.1', 'root', 'lab', port_ssh_fwd, "/root/rpms"):
-        execute_xr_shell_cmd('mkdir /root/rpms', port_ssh_fwd)
-        time.sleep(2)
+    net_setup_cmd_list = ['mkdir -p /root/rpms'] + net_setup_cmd_list
 
-    for cmd in net_setup_cmd_list:
-        execute_xr_shell_cmd(cmd, port_ssh_fwd)
+    check_batch(execute_xr_shell_cmds(net_setup_cmd_list))
+    return {"chef_server_ip": CHEF_SERVER_IP}
 
-    if chef_install:
-        #Copy chef rpm iand starter tar into XR shell and set up chef-client
-        cmd = " scp -P "+str(port_ssh_fwd)+"  /tftpboot/chef-12.0.3-1.x86_64.rpm root@127.0.0.1:/root/rpms/" 
-        output = subprocess.check_output(shlex.split(cmd))
+def step_chef(ctx):
+    #Copy chef rpm iand starter tar into XR shell and set up chef-client,
+    #files already there from an earlier run are not copied again
+    chef_manifest = [push("/tftpboot/chef-12.0.3-1.x86_64.rpm", "/root/rpms/chef-12.0.3-1.x86_64.rpm"),
+                     push("/tftpboot/chef-starter.tar", "/root/rpms/chef-starter.tar"),
+                     push("/tftpboot/client.rb", "/root/client.rb")]
+    transfer_files(xr_client(), chef_manifest)
+  
+   #Now set up the chef-client within XR
+    chef_setup_cmd_list = ['rpm -q chef-12.0.3 || rpm -ivh --nodeps /root/rpms/chef-12.0.3-1.x86_64.rpm', 'rm -rf /root/chef-repo']
+    check_batch(execute_xr_shell_cmds(chef_setup_cmd_list))
+
+    chef_client_cmd_list = ['tar -xvf /root/rpms/chef-starter.tar -C /root/', 'cd chef-repo', 'knife configure client .', 'cp /root/client.rb ./client.rb', 'knife ssl fetch', 'ps -ef | grep chef']
+    execute_xr_intr_shell_cmd(chef_client_cmd_list)
+
+    env_var='export SSL_CERT_FILE=/root/chef-repo/.chef/trusted_certs/sunstone.crt'
+    cmd = str(env_var)+'&& chef-client -d -c /root/chef-repo/client.rb -i 60 -s 20 -L /root/chef-repo/logs &'
+    execute_xr_shell_cmd(cmd)
+
+# Provisioning steps in order, as (name, step, check that a completed step
+# still holds on a rerun)
+PROVISION_STEPS = [
+    ("host_ip", step_host_ip, verify_host_ip),
+    ("host_auth", step_host_auth, None),
+    ("lxc_up", step_lxc_up, lambda ctx: is_xr_lxc_up()),
+    ("xr_console", step_xr_console, None),
+    ("xr_auth", step_xr_auth, verify_xr_auth),
+    ("xr_config", step_xr_config, None),
+    ("tap", step_tap, verify_tap),
+    ("xr_intf", step_xr_intf, None),
+    ("netdevice", step_netdevice, verify_netdevice),
+    ("xr_key", step_xr_key, None),
+    ("net_setup", step_net_setup, None),
+    #XR sessions ride the host transport, the forward is only for users
+    #and tools outside the provisioner
+    ("port_forwarding", step_port_forwarding, verify_port_forwarding),
+]
+
+def sync_globals(ctx):
+    global HOST_IP, HOST_PORT
+    if "host_ip" in ctx:
+        HOST_IP = ctx["host_ip"]
+    HOST_PORT = ctx.get("host_ssh_port", HOST_SSH_PORT)
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--host_telnet_port', help="telnet port to connect to host linux", nargs='+', type=str)
+    parser.add_argument('-x', '--XR_telnet_port', help="telnet port to connect to XR console", nargs='+', type=str)
+    parser.add_argument('-n', '--net_name', help="user defined net name", nargs='+', type=str)
+    parser.add_argument('-f', '--port_ssh_fowarding', help="Port to forward the XR shell ssh connection to", nargs='+', type=str)
+    parser.add_argument('-s', '--ssh-port', help="ssh port of the host linux", type=int, default=HOST_SSH_PORT)
+    parser.add_argument('-c', '--chef_client_install', help="install chef client", action='store_true')
+    parser.add_argument('--fresh', help="ignore the journal of an earlier run and provision from scratch", action='store_true')
+    parser.add_argument('-t', '--trace', help="write a Chrome trace (chrome://tracing, Perfetto) of the run here", type=str)
 
-        cmd = " scp -P "+str(port_ssh_fwd)+" /tftpboot/chef-starter.tar root@127.0.0.1:/root/rpms/"
-        output = subprocess.check_output(shlex.split(cmd)) 
+    args = parser.parse_args()
 
-        cmd = " scp -P "+str(port_ssh_fwd)+" /tftpboot/client.rb root@127.0.0.1:/root/"
-        output = subprocess.check_output(shlex.split(cmd))
-  
-       #Now set up the chef-client within XR
-        output = ""
-        try:
-            output = execute_xr_shell_cmd('rpm -q chef-12.0.3', port_ssh_fwd)
-        except Exception,e:
-            print(e)
-       
-        if output.rstrip('\n') != 'chef-12.0.3-1.x86_64':
-            execute_xr_shell_cmd('rpm -ivh --nodeps /root/rpms/chef-12.0.3-1.x86_64.rpm', port_ssh_fwd)  
+    ctx = {"host_telnet": args.host_telnet_port[0],
+           "xr_telnet": args.XR_telnet_port[0],
+           "net_name": args.net_name[0],
+           "port_ssh_fwd": args.port_ssh_fowarding[0],
+           "host_ssh_port": args.ssh_port}
+    chef_install=args.chef_client_install
+
+    #Determine the ip address of <net>Br1, cheap enough to redo on every run
+    cmd = "ifconfig "+ctx["net_name"]+"Br1"
+    output = subprocess.check_output(shlex.split(cmd))
 
-        if check_remote_path('127.0.0.1', 'root', 'lab', port_ssh_fwd, "/root/chef-repo"):
-            execute_xr_shell_cmd('rm -r /root/chef-repo', port_ssh_fwd)
-            time.sleep(2)
+    ctx["gip"] = re.search(r'inet addr:(\S+)', output).group(1)
+    ctx["br_mac"] = re.search(r'HWaddr\s+(\S+)', output).group(1)
 
-        chef_client_cmd_list = ['tar -xvf /root/rpms/chef-starter.tar -C /root/', 'cd chef-repo', 'knife configure client .', 'cp /root/client.rb ./client.rb', 'knife ssl fetch', 'ps -ef | grep chef']
-        execute_xr_intr_shell_cmd(chef_client_cmd_list, port_ssh_fwd)
+    steps = list(PROVISION_STEPS)
+    if chef_install:
+        steps.append(("chef", step_chef, None))
 
-        env_var='export SSL_CERT_FILE=/root/chef-repo/.chef/trusted_certs/sunstone.crt'
-        cmd = str(env_var)+'&& chef-client -d -c /root/chef-repo/client.rb -i 60 -s 20 -L /root/chef-repo/logs &'
-        execute_xr_shell_cmd(cmd, port_ssh_fwd)
+    journal = Journal(ctx["net_name"], dict(ctx), fresh=args.fresh)
+    try:
+        with TRACER.span("provision "+ctx["net_name"], "run"):
+            run_steps(journal, steps, ctx, sync_globals)
+    finally:
+        TRACER.summary()
+        if args.trace:
+            TRACER.write(args.trace)
+            print "Trace written to "+args.trace
+
+    #Everything other tools need to know about this router
+    Inventory(INVENTORY_DB).record(ctx["net_name"], host_telnet=int(ctx["host_telnet"]), xr_telnet=int(ctx["xr_telnet"]),
+                       host_ip=ctx["host_ip"], xr_int_ip=ctx["xr_int_ip"], xr_intf_mac=ctx["xr_intf_mac"],
+                       xr_ifh=ctx["xr_ifh_value"], fwd_port=ctx["fwd_port"])
 
  
 if __name__ == "__main__":
     main(sys.argv[1:])
-
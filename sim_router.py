@@ -0,0 +1,770 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import signal
+import select
+import shutil
+import socket
+import hashlib
+import argparse
+import tempfile
+import threading
+import SocketServer
+import paramiko
+
+# What the provisioning scripts expect to see
+HOST_PROMPT = "[host:~]$ "
+XR_SHELL_PROMPT = "[xr-vm_node0_RP0_CPU0:~]$ "
+XR_EXEC_PROMPT = "RP/0/RP0/CPU0:ios#"
+XR_CONFIG_PROMPT = "RP/0/RP0/CPU0:ios(config)#"
+XR_SSH_DEST = ('10.11.12.14', 22)
+XR_MGMT_INTF = "GigabitEthernet0/RP0/CPU0/0"
+
+# Upper bound (seconds) on how long a finished exec channel is kept open
+# for the client to close it
+EXEC_LINGER = 30
+
+IAC = chr(255)
+WILL = chr(251)
+ECHO = chr(1)
+SGA = chr(3)
+
+HOST_KEY = None
+
+
+def host_key():
+    global HOST_KEY
+    if HOST_KEY is None:
+        HOST_KEY = paramiko.RSAKey.generate(2048)
+    return HOST_KEY
+
+
+def crlf(text):
+    return text.replace('\r\n', '\n').replace('\n', '\r\n')
+
+
+def strip_telnet(data):
+    '''Drop telnet commands and option negotiation from client data'''
+    return re.sub(IAC+r'[\xfb-\xfe].|'+IAC+r'\xfa.*?'+IAC+r'\xf0|'+IAC+r'[\xf0-\xfa]', '', data, flags=re.S)
+
+
+def read_lines(recv):
+    '''Yield lines from recv() until it returns '', any of \\r, \\n, \\r\\n and
+    \\r\\0 ends a line'''
+    buf = ''
+    while True:
+        data = recv()
+        if data is None:
+            yield None
+            continue
+        if not data:
+            return
+        buf += data
+        while True:
+            match = re.search(r'\r\n|\r\0|\r|\n', buf)
+            if not match:
+                break
+            yield buf[:match.start()]
+            buf = buf[match.end():]
+
+
+class SimRouter(object):
+    '''State of one simulated sunstone VM: host linux, XR lxc and XR CLI.
+
+    The XR lxc (virsh, console prompts, sshd at 10.11.12.14) only shows up
+    boot_delay seconds after start, interface MACs and ifhs intf_delay
+    seconds after that. Every command answer is held back by latency
+    seconds, +/- jitter.
+    '''
+
+    def __init__(self, index, host_ip, host_telnet, xr_telnet, root_dir, boot_delay=5.0, intf_delay=2.0,
+                 latency=0.05, jitter=0.25, data_ports=4):
+        self.index = index
+        self.net_name = "sim%d" % index
+        self.host_ip = host_ip
+        self.host_telnet = host_telnet
+        self.xr_telnet = xr_telnet
+        self.boot_delay = boot_delay
+        self.intf_delay = intf_delay
+        self.latency = latency
+        self.jitter = jitter
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.roots = {"host": os.path.join(root_dir, self.net_name, "host"),
+                      "xr": os.path.join(root_dir, self.net_name, "xr")}
+        for root in self.roots.values():
+            os.makedirs(os.path.join(root, "root", ".ssh"))
+        self.console_setup = False
+        self.tuncisco = False
+        self.tap = False
+        self.netdevice = False
+        self.flume_jid = 1143
+        self.flume_running = True
+        self.interfaces = [XR_MGMT_INTF] + ["GigabitEthernet0/0/0/%d" % n for n in range(data_ports)]
+        self.config = set([("hostname ios",)])
+        for intf in self.interfaces:
+            self.config.add(("interface "+intf,))
+            self.config.add(("interface "+intf, "shutdown"))
+
+    def booted(self):
+        return time.time() - self.started >= self.boot_delay
+
+    def intf_ready(self):
+        return time.time() - self.started >= self.boot_delay + self.intf_delay
+
+    def delay(self):
+        if self.latency:
+            time.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def path(self, machine, path):
+        return os.path.join(self.roots[machine], path.replace('~', '/root').lstrip('/'))
+
+    def mac(self, n):
+        return "5254.00%02x.%04x" % (self.index % 256, n)
+
+    def ifh(self, n):
+        return 0x01000030 + n * 0x10 if n == 0 else 0x00000040 + n * 0x20
+
+    # Linux side
+
+    def ifconfig(self, intf, ip, mac):
+        return ("%-10sLink encap:Ethernet  HWaddr %s\n"
+                "          inet addr:%s  Bcast:%s.255  Mask:255.255.255.0\n"
+                "          UP BROADCAST RUNNING MULTICAST  MTU:1500  Metric:1\n"
+                "          RX packets:%d errors:0 dropped:0 overruns:0 frame:0\n"
+                "          TX packets:%d errors:0 dropped:0 overruns:0 carrier:0\n"
+                % (intf, mac, ip, ip.rsplit('.', 1)[0], 1000 + self.index, 900 + self.index))
+
+    def run_command(self, machine, cmd):
+        '''Fake a shell command, returns (status, stdout, stderr)'''
+        cmd = cmd.strip()
+        words = cmd.split()
+        if not words:
+            return 0, '', ''
+        if machine == "host":
+            if words[0] == "virsh":
+                lxcs = "sysadmin\ndefault-sdr--1\n" if self.booted() else "sysadmin\n"
+                return 0, "Name\n\n"+lxcs+"\n", ''
+            if words[0] == "ifconfig" and len(words) > 1 and words[1] == "eth2":
+                return 0, self.ifconfig("eth2", self.host_ip, "52:54:00:%02x:00:02" % (self.index % 256)), ''
+            if words[0] == "/root/kimctrl":
+                with self.lock:
+                    self.netdevice = True
+                return 0, "kimctrl: netdevice ge0000 created\n", ''
+        else:
+            if words[0] == "ifconfig" and len(words) > 1 and words[1] in ("tap123", "ge0000"):
+                exists = self.tap if words[1] == "tap123" else self.netdevice
+                if not exists:
+                    return 1, '', words[1]+": error fetching interface information: Device not found\n"
+                return 0, self.ifconfig(words[1], "192.168.%d.1" % (self.index % 256), "00:00:00:00:00:00"), ''
+            if "mknod" in cmd and "tuncisco" in cmd:
+                with self.lock:
+                    self.tuncisco = True
+                return 0, '', ''
+            if cmd.startswith("rm -r /dev/net"):
+                with self.lock:
+                    self.tuncisco = False
+                    self.tap = False
+                return 0, '', ''
+        if words[0] == "md5sum" and len(words) == 2:
+            try:
+                with open(self.path(machine, words[1]), 'rb') as f:
+                    return 0, hashlib.md5(f.read()).hexdigest()+"  "+words[1]+"\n", ''
+            except IOError:
+                return 1, '', "md5sum: "+words[1]+": No such file or directory\n"
+        # Everything else (modprobe, mkdir, ip route, hostname, rpm, ...) just works
+        return 0, '', ''
+
+    def run_script(self, machine, script):
+        '''Interpret what remote_batch sends: printf markers, { cmd } blocks,
+        rc=$? and the stop on error check. Plain commands run one per line.'''
+        out, err = [], []
+        last = rc = 0
+        lines = script.split('\n')
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            if line.startswith('{ '):
+                body = [line[2:]]
+                i += 1
+                while i < len(lines) and not lines[i].startswith('}'):
+                    body.append(lines[i])
+                    i += 1
+                last, o, e = self.run_command(machine, '\n'.join(body))
+                out.append(o)
+                err.append(e)
+            elif line == 'rc=$?':
+                rc = last
+            elif line.startswith('[ $rc -eq 0 ] || exit'):
+                if rc:
+                    return rc, ''.join(out), ''.join(err)
+            elif line.startswith('printf '):
+                for fmt, to_err in re.findall(r"printf '([^']*)'(?: \$rc)?( >&2)?", line):
+                    text = fmt.replace('\\n', '\n').replace('%d', str(rc))
+                    (err if to_err else out).append(text)
+            elif line.strip():
+                last, o, e = self.run_command(machine, line)
+                out.append(o)
+                err.append(e)
+            i += 1
+        return last, ''.join(out), ''.join(err)
+
+    # XR CLI output
+
+    def running_config(self):
+        lines = ["Building configuration...", "!! IOS XR Configuration 6.1.1",
+                 "!! Last configuration change at "+time.strftime("%a %b %d %H:%M:%S %Y")+" by root", "!"]
+
+        def walk(prefix):
+            children = sorted(p for p in self.config if len(p) == len(prefix) + 1 and p[:len(prefix)] == prefix)
+            for child in children:
+                lines.append(' ' * len(prefix) + child[-1])
+                walk(child)
+                if not prefix:
+                    lines.append("!")
+        with self.lock:
+            walk(())
+        lines.append("end")
+        return '\n'.join(lines)+'\n'
+
+    def show_interface(self, n):
+        intf = self.interfaces[n]
+        shut = ("interface "+intf, "shutdown") in self.config
+        state = "administratively down" if shut else "up"
+        text = intf+" is "+state+", line protocol is "+("administratively down" if shut else "up")+" \n"
+        text += "  Interface state transitions: 1\n"
+        kind = "Management Ethernet" if n == 0 else "GigabitEthernet"
+        if self.intf_ready():
+            text += "  Hardware is "+kind+", address is "+self.mac(n)+" (bia "+self.mac(n)+")\n"
+        else:
+            text += "  Hardware is "+kind+"\n"
+        addr = [p[1] for p in self.config if len(p) == 2 and p[0] == "interface "+intf and p[1].startswith("ipv4 address")]
+        text += "  Internet address is "+(addr[0].split()[2]+"/24" if addr else "Unknown")+"\n"
+        text += ("  MTU 1514 bytes, BW 1000000 Kbit (Max: 1000000 Kbit)\n"
+                 "     reliability 255/255, txload 0/255, rxload 0/255\n"
+                 "  Encapsulation ARPA,\n"
+                 "  Full-duplex, 1000Mb/s, unknown, link type is autonegotiation\n"
+                 "  output flow control is off, input flow control is off\n"
+                 "  loopback not set,\n"
+                 "  ARP type ARPA, ARP timeout 04:00:00\n"
+                 "  Last input 00:00:00, output 00:00:00\n"
+                 "  Last clearing of \"show interface\" counters never\n"
+                 "  5 minute input rate 0 bits/sec, 0 packets/sec\n"
+                 "  5 minute output rate 0 bits/sec, 0 packets/sec\n"
+                 "     %d packets input, %d bytes, 0 total input drops\n"
+                 "     0 drops for unrecognized upper-level protocol\n"
+                 "     %d packets output, %d bytes, 0 total output drops\n" % (1000 + n, 64000 + n, 900 + n, 57600 + n))
+        return text
+
+    def show_im_database(self, n):
+        if not self.intf_ready():
+            return ''
+        intf = self.interfaces[n]
+        return ("\nView: OWN - Owner, L3P - Local 3rd Party, G3P - Global 3rd Party, LDP - Local Data Plane\n"
+                "      GDP - Global Data Plane, RED - Redundancy, UL - UL\n\n"
+                "Node 0/RP0/CPU0 (0x0)\n\n"
+                "Interface %s, ifh 0x%08x (up, 1514)\n"
+                "  Interface flags:          0x000100ff (ROOT_IS_HW|IFCONNECTOR\n"
+                "                            |IFINDEX|SUP_NAMED_SUB|BROADCAST\n"
+                "                            |CONFIG|HW|VIS|DATA|CONTROL)\n"
+                "  Encapsulation:            ether\n"
+                "  Interface type:           IFT_ETHERNET\n"
+                "  Control parent:           None\n"
+                "  Data parent:              None\n"
+                "  Views:                    GDP|LDP|L3P|OWN\n\n"
+                "  Protocol        Caps (state, mtu)\n"
+                "  --------        -----------------\n"
+                "  None            ether (up, 1514)\n" % (intf, self.ifh(n)))
+
+    def show_proc(self):
+        if not self.flume_running:
+            return ''
+        return "%d   %d    0  128K  20 Sleeping    flume      0 \n%d   %d    0  128K  20 Sleeping    flume      0 \n" % (
+            self.flume_jid, 5620 + self.flume_jid, self.flume_jid, 5621 + self.flume_jid)
+
+    def find_interfaces(self, name):
+        if not name:
+            return range(len(self.interfaces))
+        return [n for n, intf in enumerate(self.interfaces) if intf == name]
+
+
+class XrCli(object):
+    '''One XR CLI session, exec and config mode'''
+
+    def __init__(self, router):
+        self.router = router
+        self.config_mode = False
+        self.stack = []
+        self.pending_set = set()
+        self.pending_unset = set()
+        self.exited = False
+
+    def prompt(self):
+        return "\n"+(XR_CONFIG_PROMPT if self.config_mode else XR_EXEC_PROMPT)
+
+    def handle(self, cmd):
+        cmd = cmd.strip()
+        if self.config_mode:
+            return self._config(cmd)
+        router = self.router
+        if not cmd or cmd.startswith("terminal length"):
+            return ''
+        if cmd == "exit":
+            self.exited = True
+            return ''
+        if cmd in ("configure terminal", "conf t", "configure"):
+            self.config_mode = True
+            return ''
+        if cmd.startswith("show running-config") or cmd.startswith("sh run"):
+            return router.running_config()
+        match = re.match(r'^sh(?:ow)? interfaces?\s*(\S*)$', cmd)
+        if match:
+            found = router.find_interfaces(match.group(1))
+            if not found:
+                return "Interface not found ("+match.group(1)+")\n"
+            return ''.join(router.show_interface(n) for n in found)
+        match = re.match(r'^sh(?:ow)? im database interface\s*(\S*)$', cmd)
+        if match:
+            return ''.join(router.show_im_database(n) for n in router.find_interfaces(match.group(1)))
+        if re.match(r'^sh(?:ow)? proc', cmd):
+            return router.show_proc()
+        if cmd == "process shutdown flume":
+            router.flume_running = False
+            return ''
+        if cmd == "process start flume":
+            router.flume_running = True
+            router.flume_jid += 1
+            return ''
+        if cmd in ("proc restart netio", "process restart netio"):
+            with router.lock:
+                router.tap = router.tuncisco
+            return ''
+        return "                    ^\n% Invalid input detected at '^' marker.\n"
+
+    def _config(self, cmd):
+        router = self.router
+        if not cmd:
+            return ''
+        if cmd == "root":
+            self.stack = []
+        elif cmd == "exit":
+            if self.stack:
+                self.stack.pop()
+            else:
+                self.config_mode = False
+        elif cmd == "commit":
+            with router.lock:
+                router.config |= self.pending_set
+                for path in self.pending_unset:
+                    router.config = set(p for p in router.config if p[:len(path)] != path)
+            self.pending_set = set()
+            self.pending_unset = set()
+        elif cmd in ("abort", "end"):
+            self.pending_set = set()
+            self.pending_unset = set()
+            self.stack = []
+            self.config_mode = False
+        elif cmd.startswith("no "):
+            self.pending_unset.add(tuple(self.stack + [cmd[3:]]))
+        else:
+            self.stack.append(cmd)
+            self.pending_set.add(tuple(self.stack))
+        return ''
+
+
+def shell_session(router, machine, channel):
+    '''Interactive shell on the host or in the XR lxc, exec drops into the XR CLI'''
+    prompt = HOST_PROMPT if machine == "host" else XR_SHELL_PROMPT
+    cli = None
+    try:
+        channel.sendall(crlf("Last login: "+time.strftime("%a %b %d %H:%M:%S %Y")+"\n"+prompt))
+        for line in read_lines(lambda: channel.recv(4096)):
+            router.delay()
+            if cli is not None:
+                reply = cli.handle(line)
+                if cli.exited:
+                    cli = None
+                    channel.sendall(crlf(line+"\n"+prompt))
+                else:
+                    channel.sendall(crlf(line+"\n"+reply+cli.prompt()))
+                continue
+            if line.strip() == "exec" and machine == "xr":
+                cli = XrCli(router)
+                channel.sendall(crlf(line+"\n"+cli.prompt()))
+                continue
+            if line.strip() == "exit":
+                break
+            status, out, err = router.run_command(machine, line)
+            channel.sendall(crlf(line+"\n"+out+err+prompt))
+    except (socket.error, EOFError):
+        pass
+    finally:
+        channel.close()
+
+
+def exec_session(router, machine, channel, command):
+    '''Run an exec request like sshd: output, exit status and EOF, then
+    wait for the client to close the channel. Closing it here could overtake
+    the acknowledgement of the request and the client would give up on it.'''
+    try:
+        router.delay()
+        status, out, err = router.run_script(machine, command)
+        channel.sendall(out)
+        channel.sendall_stderr(err)
+        channel.send_exit_status(status)
+        channel.shutdown_write()
+        deadline = time.time() + EXEC_LINGER
+        while not channel.closed and channel.get_transport().is_active() and time.time() < deadline:
+            time.sleep(0.05)
+    except (socket.error, EOFError):
+        pass
+    finally:
+        channel.close()
+
+
+class SimSFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.filehandle.fileno()))
+        except OSError, e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        return paramiko.SFTP_OK
+
+
+class SimSFTP(paramiko.SFTPServerInterface):
+    '''SFTP into a per machine directory standing in for its filesystem'''
+
+    def __init__(self, server, root):
+        paramiko.SFTPServerInterface.__init__(self, server)
+        self.root = root
+
+    def _path(self, path):
+        return os.path.join(self.root, os.path.normpath('/'+path).lstrip('/'))
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._path(path)))
+        except OSError, e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        path = self._path(path)
+        try:
+            fd = os.open(path, flags | getattr(os, 'O_BINARY', 0), 0666)
+        except OSError, e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        handle = SimSFTPHandle(flags)
+        handle.filehandle = os.fdopen(fd, mode)
+        handle.readfile = handle.filehandle
+        handle.writefile = handle.filehandle
+        return handle
+
+    def chattr(self, path, attr):
+        try:
+            if attr._flags & attr.FLAG_PERMISSIONS:
+                os.chmod(self._path(path), attr.st_mode)
+        except OSError, e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def remove(self, path):
+        try:
+            os.remove(self._path(path))
+        except OSError, e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(self._path(path))
+        except OSError, e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def list_folder(self, path):
+        path = self._path(path)
+        try:
+            entries = []
+            for name in os.listdir(path):
+                attr = paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(path, name)))
+                attr.filename = name
+                entries.append(attr)
+            return entries
+        except OSError, e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+class SimSSHServer(paramiko.ServerInterface):
+    '''sshd of the host (machine "host") or of the XR lxc (machine "xr").
+    The host also opens direct-tcpip channels to the XR sshd once the lxc
+    is up.'''
+
+    def __init__(self, router, machine):
+        self.router = router
+        self.machine = machine
+        self.direct = set()
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if username == 'root' and password == 'lab':
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_direct_tcpip_request(self, chanid, origin, destination):
+        if self.machine != "host" or tuple(destination) != XR_SSH_DEST or not self.router.booted():
+            return paramiko.OPEN_FAILED_CONNECT_FAILED
+        self.direct.add(chanid)
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        start_thread(shell_session, self.router, self.machine, channel)
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        start_thread(exec_session, self.router, self.machine, channel, command)
+        return True
+
+
+def serve_ssh(router, machine, sock):
+    '''Run an sshd session on sock (a socket, or a direct-tcpip channel for
+    the XR sshd) until the client goes away'''
+    transport = paramiko.Transport(sock)
+    transport.add_server_key(host_key())
+    transport.set_subsystem_handler('sftp', paramiko.SFTPServer, SimSFTP, router.roots[machine])
+    server = SimSSHServer(router, machine)
+    try:
+        transport.start_server(server=server)
+    except (paramiko.SSHException, EOFError, socket.error):
+        return
+    while transport.is_active():
+        channel = transport.accept(1.0)
+        if channel is not None and channel.get_id() in server.direct:
+            thread = threading.Thread(target=serve_ssh, args=(router, "xr", channel))
+            thread.daemon = True
+            thread.start()
+
+
+def listen_ssh(router, port):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((router.host_ip, port))
+    listener.listen(64)
+    while True:
+        sock, peer = listener.accept()
+        thread = threading.Thread(target=serve_ssh, args=(router, "host", sock))
+        thread.daemon = True
+        thread.start()
+
+
+class HostConsole(object):
+    def __init__(self, router):
+        self.router = router
+        self.state = "login"
+
+    def greeting(self):
+        return "\nhost login: "
+
+    def idle(self):
+        return ''
+
+    def handle(self, line):
+        if self.state == "login":
+            if not line.strip():
+                return "\nhost login: "
+            self.state = "password"
+            return line+"\nPassword: "
+        if self.state == "password":
+            self.state = "shell"
+            return "\nLast login: "+time.strftime("%a %b %d %H:%M:%S %Y")+" on ttyS3\n"+HOST_PROMPT
+        self.router.delay()
+        status, out, err = self.router.run_command("host", line)
+        return line+"\n"+out+err+HOST_PROMPT
+
+
+class XrConsole(object):
+    '''XR console: silent while booting, then the first boot root-system
+    user dialog (only once per router) and the CLI login'''
+
+    def __init__(self, router):
+        self.router = router
+        self.state = "booting"
+        self.cli = None
+
+    def greeting(self):
+        return "\nBooting IOS-XR...\n"
+
+    def _ready(self):
+        if self.router.console_setup:
+            self.state = "username"
+            return "\n\nUser Access Verification\n\nUsername: "
+        self.state = "root-system"
+        return ("\n\n!!!!!!!!!!!!!!!!!!!! NO root-system username is configured. Need to configure root-system"
+                " username. !!!!!!!!!!!!!!!!!!!!\n\n         --- Administrative User Dialog ---\n\n\n"
+                "  Enter root-system username: ")
+
+    def idle(self):
+        if self.state == "booting" and self.router.booted():
+            return self._ready()
+        return ''
+
+    def handle(self, line):
+        if self.state == "booting":
+            return self.idle()
+        if self.state == "root-system":
+            self.state = "secret"
+            return line+"\n  Enter secret: "
+        if self.state == "secret":
+            self.state = "secret-again"
+            return "\n  Enter secret again: "
+        if self.state == "secret-again":
+            self.router.console_setup = True
+            self.state = "username"
+            return "\nUse the 'configure' command to modify this configuration.\nUser Access Verification\n\nUsername: "
+        if self.state == "username":
+            if not line.strip():
+                return "\nUsername: "
+            self.state = "password"
+            return line+"\nPassword: "
+        if self.state == "password":
+            self.state = "cli"
+            self.cli = XrCli(self.router)
+            return "\n"+self.cli.prompt()
+        self.router.delay()
+        reply = self.cli.handle(line)
+        if self.cli.exited:
+            self.cli = XrCli(self.router)
+            self.state = "username"
+            return line+"\n\nUsername: "
+        return line+"\n"+reply+self.cli.prompt()
+
+
+class ConsoleHandler(SocketServer.BaseRequestHandler):
+    def handle(self):
+        sock = self.request
+        console = self.server.console_class(self.server.router)
+
+        def recv():
+            readable, _, _ = select.select([sock], [], [], 0.5)
+            if not readable:
+                return None
+            try:
+                data = sock.recv(4096)
+            except socket.error:
+                return ''
+            if not data:
+                return ''
+            # Data that was all option negotiation is not the end of the session
+            return strip_telnet(data) or None
+
+        try:
+            sock.sendall(IAC+WILL+ECHO+IAC+WILL+SGA+crlf(console.greeting()))
+            for line in read_lines(recv):
+                reply = console.idle() if line is None else console.handle(line)
+                if reply:
+                    sock.sendall(crlf(reply).replace(IAC, IAC+IAC))
+        except socket.error:
+            pass
+
+
+class ConsoleServer(SocketServer.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, port, router, console_class):
+        SocketServer.ThreadingTCPServer.__init__(self, ('127.0.0.1', port), ConsoleHandler)
+        self.router = router
+        self.console_class = console_class
+
+
+def start_thread(target, *args):
+    thread = threading.Thread(target=target, args=args)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def start_routers(count, root_dir, ip_base="127.0.1.1", ssh_port=2222, telnet_base=17000, **router_args):
+    '''Start count simulated routers, host ips counting up from ip_base,
+    telnet ports from telnet_base (host console, XR console, ...)'''
+    prefix, last = ip_base.rsplit('.', 1)
+    routers = []
+    for index in range(count):
+        host_ip = prefix+"."+str(int(last) + index)
+        host_telnet = telnet_base + 2 * index
+        router = SimRouter(index, host_ip, host_telnet, host_telnet + 1, root_dir, **router_args)
+        start_thread(ConsoleServer(router.host_telnet, router, HostConsole).serve_forever)
+        start_thread(ConsoleServer(router.xr_telnet, router, XrConsole).serve_forever)
+        start_thread(listen_ssh, router, ssh_port)
+        routers.append(router)
+    host_key()
+    return routers
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Simulated sunstone VMs (host linux, XR lxc and console) on localhost")
+    parser.add_argument('-n', '--count', help="number of routers", type=int, default=1)
+    parser.add_argument('--ip-base', help="host ip of the first router, one loopback ip per router", type=str, default="127.0.1.1")
+    parser.add_argument('--ssh-port', help="port the host sshds listen on", type=int, default=2222)
+    parser.add_argument('--telnet-base', help="first console port, two per router", type=int, default=17000)
+    parser.add_argument('--boot-delay', help="seconds until the XR lxc is up", type=float, default=5.0)
+    parser.add_argument('--intf-delay', help="seconds after boot until interfaces have MAC/ifh", type=float, default=2.0)
+    parser.add_argument('--latency', help="seconds per command answer", type=float, default=0.05)
+    parser.add_argument('--jitter', help="+/- fraction of the latency", type=float, default=0.25)
+    parser.add_argument('--data-ports', help="GigabitEthernet0/0/0/x ports per router", type=int, default=4)
+    parser.add_argument('--ready-file', help="write the router list here as JSON once listening", type=str)
+
+    args = parser.parse_args(argv)
+
+    root_dir = tempfile.mkdtemp(prefix="sim_router.")
+    def terminate(signum, frame):
+        # Clean up the fake filesystems and go, without waiting for the
+        # session threads
+        shutil.rmtree(root_dir, ignore_errors=True)
+        os._exit(0)
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        routers = start_routers(args.count, root_dir, args.ip_base, args.ssh_port, args.telnet_base,
+                                boot_delay=args.boot_delay, intf_delay=args.intf_delay, latency=args.latency,
+                                jitter=args.jitter, data_ports=args.data_ports)
+        inventory = [{"net_name": r.net_name, "host_ip": r.host_ip, "host_telnet": r.host_telnet,
+                      "xr_telnet": r.xr_telnet, "ssh_port": args.ssh_port} for r in routers]
+        if args.ready_file:
+            with open(args.ready_file + ".tmp", "w") as f:
+                json.dump(inventory, f, indent=2)
+            os.rename(args.ready_file + ".tmp", args.ready_file)
+        for entry in inventory:
+            print "%(net_name)s host %(host_ip)s:%(ssh_port)s host console %(host_telnet)s XR console %(xr_telnet)s" % entry
+        sys.stdout.flush()
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutil.rmtree(root_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
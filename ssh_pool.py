@@ -0,0 +1,115 @@
+import atexit
+import threading
+import time
+import paramiko
+from tracer import TRACER
+
+# Transports idle for longer than this get a keepalive probe before reuse
+IDLE_CHECK_SECS = 30
+CONNECT_TIMEOUT = 5
+
+
+class SSHPool(object):
+    '''Authenticated SSH clients keyed by (host, port, user).
+
+    Every helper used to do a full connect/auth/close for each call. The
+    pool keeps one authenticated transport per endpoint and hands out fresh
+    exec, shell and sftp channels on top of it. Dead or idle transports are
+    checked and reconnected transparently.
+
+    An endpoint only reachable through a jump host is given as via=(host,
+    port, user, password): its session runs in a direct-tcpip channel of the
+    jump host's pooled transport, like ssh -J, with no local listener.
+    '''
+
+    def __init__(self, idle_check=IDLE_CHECK_SECS, timeout=CONNECT_TIMEOUT):
+        self.idle_check = idle_check
+        self.timeout = timeout
+        # Guards the dicts only, never held while talking to a host
+        self.lock = threading.Lock()
+        # key -> {"client", "password", "last_used"}
+        self.entries = {}
+        # key -> lock held while that endpoint is checked or connected, so
+        # callers of one endpoint share a connect and other endpoints go on
+        self.key_locks = {}
+
+    def _connect(self, host, port, user, password, via=None):
+        with TRACER.span("connect "+host+":"+str(port), "ssh", via=via[0] if via else None):
+            return self._open(host, port, user, password, via)
+
+    def _open(self, host, port, user, password, via):
+        sock = None
+        if via is not None:
+            jump = self.get_client(*via).get_transport()
+            sock = jump.open_channel('direct-tcpip', (host, int(port)), ('127.0.0.1', 0), timeout=self.timeout)
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(host, port=int(port), username=user, password=password, timeout=self.timeout, sock=sock)
+        return client
+
+    def _is_healthy(self, entry):
+        transport = entry["client"].get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        if time.time() - entry["last_used"] > self.idle_check:
+            try:
+                transport.send_ignore()
+            except Exception:
+                return False
+        return True
+
+    def get_client(self, host, port=22, user='root', password=None, via=None):
+        '''Return a connected SSHClient for the endpoint, reconnecting if needed'''
+        key = self._key(host, port, user, via)
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self.lock:
+                entry = self.entries.get(key)
+            if entry is not None and password is None:
+                password = entry["password"]
+            if entry is None or not self._is_healthy(entry):
+                if entry is not None:
+                    entry["client"].close()
+                entry = {"client": self._connect(host, port, user, password, via),
+                         "password": password}
+                with self.lock:
+                    self.entries[key] = entry
+            entry["last_used"] = time.time()
+            return entry["client"]
+
+    def _key(self, host, port, user, via):
+        # The jump host is part of the key, 10.11.12.14 is a different box
+        # behind every host
+        if via is not None:
+            via = self._key(via[0], via[1], via[2], None)
+        return (host, int(port), user, via)
+
+    def exec_command(self, host, port, user, password, cmd, via=None):
+        return self.get_client(host, port, user, password, via).exec_command(cmd)
+
+    def invoke_shell(self, host, port, user, password, via=None):
+        return self.get_client(host, port, user, password, via).invoke_shell()
+
+    def open_sftp(self, host, port, user, password, via=None):
+        return self.get_client(host, port, user, password, via).open_sftp()
+
+    def close(self, host, port=22, user='root', via=None):
+        with self.lock:
+            entry = self.entries.pop(self._key(host, port, user, via), None)
+        if entry is not None:
+            entry["client"].close()
+
+    def close_all(self):
+        with self.lock:
+            entries = self.entries.values()
+            self.entries = {}
+        for entry in entries:
+            try:
+                entry["client"].close()
+            except Exception:
+                pass
+
+
+POOL = SSHPool()
+atexit.register(POOL.close_all)
@@ -3066,19 +3066,16 @@ find_random_open_port_()
         die "Do not run this tool with sh, call it directly."
     fi
 
-    RESULT=`netstat -plano 2>/dev/null | grep $VM_ADDRESS; lsof -iTCP:$VM_ADDRESS; lsof -iUDP:$VM_ADDRESS`
-    while [ "$RESULT" != "" ]
-    do
-        VM_ADDRESS=`expr \( $RANDOM % $RANDOM_PORT_RANGE \) + $RANDOM_PORT_BASE`
-        RESULT=`netstat -plano 2>/dev/null | grep $VM_ADDRESS; lsof -iTCP:$VM_ADDRESS; lsof -iUDP:$VM_ADDRESS`
-    done
-
-    RANDOM_ADDRESS=$VM_ADDRESS
-
     #
-    # Double check
+    # Lease a free port from a random point in the range so parallel
+    # launches never get handed the same one
     #
-    netstat -plano 2>/dev/null | grep $VM_ADDRESS; lsof -iTCP:$VM_ADDRESS; lsof -iUDP:$VM_ADDRESS
+    RANDOM_ADDRESS=`python /home/cisco/sunstone/port_alloc.py allocate $VM_ADDRESS \
+        $(expr $RANDOM_PORT_BASE + $RANDOM_PORT_RANGE - 1) -o $OPT_NODE_NAME 2>/dev/null`
+    if [ "$RANDOM_ADDRESS" = "" ]; then
+        RANDOM_ADDRESS=`python /home/cisco/sunstone/port_alloc.py allocate $RANDOM_PORT_BASE \
+            $VM_ADDRESS -o $OPT_NODE_NAME 2>/dev/null`
+    fi
 }
 
 #
@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import time
+import mmap
+import fcntl
+import struct
+import argparse
+import threading
+import numpy as np
+from file_watch import stat_signature
+
+# Segment files: a header, then fixed width records of a float64 timestamp
+# followed by one float64 per counter of the segment (NaN when a sample did
+# not carry it). committed is the number of complete records, the writer
+# only moves it after the records are written.
+MAGIC = 'TARC'
+VERSION = 1
+HEADER = struct.Struct('<4sII')
+COMMITTED = struct.Struct('<Q')
+COMMITTED_OFFSET = 16
+HEADER_SIZE = 64
+INDEX_FILE = 'index.json'
+LOCK_FILE = 'writer.lock'
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def record_dtype(counters):
+    return np.dtype([('time', '<f8')] + [('c%d' % i, '<f8') for i in range(len(counters))])
+
+
+def series_key(router, interface):
+    return router+"|"+interface
+
+
+class ArchiveWriter(object):
+    '''Appends samples to the archive in a directory, one writer at a time.
+
+    Each router interface has a list of segments in index.json, a new one is
+    started when a sample brings a counter the current segment has no column
+    for. The index is replaced atomically, segment files only grow, so
+    readers never need a lock.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.lock_file = open(os.path.join(path, LOCK_FILE), 'w')
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            raise ArchiveError("Another process is writing the archive in "+path)
+        self.lock = threading.Lock()
+        self.index = read_index(path)
+        # key: (file, counters, column of each counter, last time, committed)
+        self.open = {}
+
+    def _save_index(self):
+        tmp = os.path.join(self.path, INDEX_FILE+'.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.index, f)
+        os.rename(tmp, os.path.join(self.path, INDEX_FILE))
+
+    def _current(self, key):
+        '''Open segment of a series, reopened from the index after a restart,
+        None if the series has none yet'''
+        segment = self.open.get(key)
+        if segment is None and self.index.get(key):
+            entry = self.index[key][-1]
+            f = open(os.path.join(self.path, entry["file"]), 'r+b')
+            f.seek(COMMITTED_OFFSET)
+            committed = COMMITTED.unpack(f.read(COMMITTED.size))[0]
+            size = record_dtype(entry["counters"]).itemsize
+            last = None
+            if committed:
+                f.seek(HEADER_SIZE + (committed - 1) * size)
+                last = struct.unpack('<d', f.read(8))[0]
+            # Drop a partly written record of a crashed writer
+            f.truncate(HEADER_SIZE + committed * size)
+            segment = self.open[key] = [f, entry["counters"], dict((c, i) for i, c in enumerate(entry["counters"])),
+                                        last, committed]
+        return segment
+
+    def _start_segment(self, key, counters, segment):
+        '''Start a segment with columns for the counters and those of the
+        current segment (if any)'''
+        names = sorted(set(counters) | set(segment[1] if segment else []))
+        entries = self.index.setdefault(key, [])
+        name = "%s.%d.seg" % (key.replace('/', '_').replace('|', '.'), len(entries))
+        f = open(os.path.join(self.path, name), 'w+b')
+        f.write(HEADER.pack(MAGIC, VERSION, len(names)).ljust(HEADER_SIZE, '\0'))
+        f.flush()
+        last = segment[3] if segment else None
+        if segment:
+            segment[0].close()
+        entries.append({"file": name, "counters": names, "first": None})
+        segment = self.open[key] = [f, names, dict((c, i) for i, c in enumerate(names)), last, 0]
+        return segment
+
+    def append(self, router, interface, timestamp, counters):
+        '''Add a sample (a TelemetryStore listener). Samples not newer than the
+        last one of the series are dropped.'''
+        key = series_key(router, interface)
+        with self.lock:
+            segment = self._current(key)
+            # Checked before a segment is started, a dropped sample must not
+            # leave an empty one in the index
+            if segment is not None and segment[3] is not None and timestamp <= segment[3]:
+                return
+            if segment is None or not set(counters) <= set(segment[2]):
+                segment = self._start_segment(key, counters, segment)
+            f, names, columns, last, committed = segment
+            record = [float('nan')] * (len(names) + 1)
+            record[0] = timestamp
+            for counter, value in counters.iteritems():
+                record[columns[counter] + 1] = value
+            f.seek(0, os.SEEK_END)
+            f.write(struct.pack('<%dd' % len(record), *record))
+            f.flush()
+            f.seek(COMMITTED_OFFSET)
+            f.write(COMMITTED.pack(committed + 1))
+            f.flush()
+            segment[3] = timestamp
+            segment[4] = committed + 1
+            if self.index[key][-1]["first"] is None:
+                self.index[key][-1]["first"] = timestamp
+                self._save_index()
+
+    def close(self):
+        with self.lock:
+            for segment in self.open.values():
+                segment[0].close()
+            self.open = {}
+            self.lock_file.close()
+
+
+def read_index(path):
+    try:
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            return json.load(f)
+    except IOError:
+        return {}
+
+
+class MappedSegment(object):
+    '''Read only mapping of a segment file, remapped when the writer has
+    committed past what is mapped'''
+
+    def __init__(self, path, counters):
+        self.path = path
+        self.counters = counters
+        self.dtype = record_dtype(counters)
+        self.map = None
+
+    def records(self):
+        '''Structured array view (no copy) of the committed records'''
+        if self.map is None:
+            self._remap()
+        committed = COMMITTED.unpack_from(self.map, COMMITTED_OFFSET)[0]
+        if HEADER_SIZE + committed * self.dtype.itemsize > len(self.map):
+            self._remap()
+            committed = min(committed, (len(self.map) - HEADER_SIZE) // self.dtype.itemsize)
+        return np.frombuffer(self.map, self.dtype, committed, HEADER_SIZE)
+
+    def _remap(self):
+        with open(self.path, 'rb') as f:
+            # Arrays handed out keep the previous map alive, it is not closed here
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, columns = HEADER.unpack_from(self.map)
+            if magic != MAGIC or columns != len(self.counters):
+                raise ArchiveError(self.path+" is not a segment of this archive")
+
+
+class ArchiveReader(object):
+    '''Time range queries over an archive another process may be writing'''
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.signature = None
+        self.index = {}
+        self.segments = {}
+
+    def _refresh(self):
+        signature = stat_signature(os.path.join(self.path, INDEX_FILE))
+        if signature != self.signature:
+            self.index = read_index(self.path)
+            self.signature = signature
+
+    def series(self):
+        '''[(router, interface)] of everything archived'''
+        with self.lock:
+            self._refresh()
+            return sorted(tuple(key.split('|', 1)) for key in self.index)
+
+    def _segment(self, entry):
+        segment = self.segments.get(entry["file"])
+        if segment is None:
+            segment = self.segments[entry["file"]] = MappedSegment(os.path.join(self.path, entry["file"]),
+                                                                   entry["counters"])
+        return segment
+
+    def window(self, router, interface, start=None, end=None, counters=None):
+        '''(times, values, names) of the samples with start <= time < end,
+        values as a (samples, counters) array. Segments are picked from the
+        index and each is binary searched on its time column.'''
+        with self.lock:
+            self._refresh()
+            entries = [e for e in self.index.get(series_key(router, interface), []) if e["first"] is not None]
+            if not entries:
+                raise KeyError(router+" "+interface)
+            if counters is None:
+                names = sorted(set(c for e in entries for c in e["counters"]))
+            else:
+                names = list(counters)
+            parts = []
+            for i, entry in enumerate(entries):
+                following = entries[i + 1]["first"] if i + 1 < len(entries) else None
+                if end is not None and entry["first"] >= end:
+                    break
+                if start is not None and following is not None and following <= start:
+                    continue
+                records = self._segment(entry).records()
+                times = records['time']
+                lo = 0 if start is None else np.searchsorted(times, start, 'left')
+                hi = len(times) if end is None else np.searchsorted(times, end, 'left')
+                if lo < hi:
+                    parts.append((entry, records[lo:hi]))
+
+        rows = sum(len(records) for entry, records in parts)
+        times = np.empty(rows)
+        values = np.full((rows, len(names)), np.nan)
+        row = 0
+        for entry, records in parts:
+            times[row:row + len(records)] = records['time']
+            for col, name in enumerate(names):
+                if name in entry["counters"]:
+                    values[row:row + len(records), col] = records['c%d' % entry["counters"].index(name)]
+            row += len(records)
+        return times, values, names
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Inspect a telemetry archive")
+    parser.add_argument('archive', type=str)
+    sub = parser.add_subparsers(dest='action')
+    sub.add_parser('list', help="print the archived router interfaces")
+    dump = sub.add_parser('dump', help="print the samples of one router interface")
+    dump.add_argument('router', type=str)
+    dump.add_argument('interface', type=str)
+    dump.add_argument('-s', '--start', type=float, help="epoch seconds, or negative for seconds ago")
+    dump.add_argument('-e', '--end', type=float)
+    dump.add_argument('-c', '--counter', action='append', help="may be repeated, all of them by default")
+
+    args = parser.parse_args(argv)
+    reader = ArchiveReader(args.archive)
+
+    if args.action == 'list':
+        for router, interface in reader.series():
+            print "%-20s %s" % (router, interface)
+        return
+
+    start = time.time() + args.start if args.start is not None and args.start < 0 else args.start
+    try:
+        times, values, names = reader.window(args.router, args.interface, start, args.end, args.counter)
+    except KeyError:
+        sys.stderr.write("Nothing archived for "+args.router+" "+args.interface+"\n")
+        sys.exit(1)
+    print "TIME\t"+"\t".join(names)
+    for i, timestamp in enumerate(times):
+        print "%.3f\t" % timestamp + "\t".join("" if np.isnan(v) else "%d" % v for v in values[i])
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
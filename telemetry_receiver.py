@@ -0,0 +1,403 @@
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import struct
+import argparse
+import threading
+import SocketServer
+from telemetry_archive import ArchiveWriter
+
+FLUME_CFG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'flume.cfg')
+TELEMETRY_PORT = 2102
+
+# TCP framing of the router's telemetry stream: type, flags and payload
+# length as big endian uint32, then the payload
+HEADER = struct.Struct('>III')
+MSG_RESET_COMPRESSOR = 1
+MSG_JSON = 2
+MSG_GPB_COMPACT = 3
+MSG_GPB_KEY_VALUE = 4
+FLAG_ZLIB = 0x1
+# Receiver encodings of the policy file the decoder handles. Compact GPB
+# ("protobuf") would need the .proto schema of every table.
+ENCODINGS = ('json', 'self-describing-gpb')
+# Anything bigger is a broken stream, not a message (the policy's MTU is 8900)
+MAX_PAYLOAD = 16 * 1024 * 1024
+
+# Capture file records: peer length, receive time, frame length, then the
+# peer address and the frame exactly as it came off the wire
+RECORD = struct.Struct('>HdI')
+
+INTERFACE_NAME = re.compile(r'^(MgmtEth|GigabitEthernet|TenGigE|FortyGigE|HundredGigE|Bundle-Ether|Loopback|tunnel|BVI)\S*$')
+NAME_KEYS = ('interface_name', 'Interface_Name', 'interface-name', 'InterfaceName')
+
+
+def receiver_config(cfg_path=FLUME_CFG):
+    '''First receiver of the flume policy file, {} if there is none'''
+    try:
+        with open(cfg_path) as f:
+            text = f.read()
+    except IOError:
+        return {}
+    # The policy file allows trailing commas, JSON does not
+    cfg = json.loads(re.sub(r',(\s*[\]}])', r'\1', text))
+    receivers = cfg.get("receivers", [])
+    return receivers[0] if receivers else {}
+
+
+def receiver_port(cfg_path=FLUME_CFG):
+    '''Receiver port of the flume policy file, TELEMETRY_PORT if it has none'''
+    return int(receiver_config(cfg_path).get("port", TELEMETRY_PORT))
+
+
+class DecodeError(Exception):
+    pass
+
+
+def _varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise DecodeError("truncated varint")
+        byte = ord(data[pos])
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def gpb_fields(data):
+    '''(field number, wire type, value) of each field of a protobuf message'''
+    pos = 0
+    while pos < len(data):
+        key, pos = _varint(data, pos)
+        number, wire = key >> 3, key & 7
+        if wire == 0:
+            value, pos = _varint(data, pos)
+        elif wire == 1:
+            value, pos = data[pos:pos + 8], pos + 8
+        elif wire == 2:
+            size, pos = _varint(data, pos)
+            value, pos = data[pos:pos + size], pos + size
+        elif wire == 5:
+            value, pos = data[pos:pos + 4], pos + 4
+        else:
+            raise DecodeError("unsupported wire type "+str(wire))
+        if pos > len(data):
+            raise DecodeError("truncated field "+str(number))
+        yield number, wire, value
+
+
+def _kv_field(data):
+    '''TelemetryField of the self-describing encoding as (name, value)'''
+    name = None
+    value = None
+    children = []
+    for number, wire, raw in gpb_fields(data):
+        if number == 2:
+            name = raw
+        elif number in (4, 5):
+            value = raw
+        elif number == 6:
+            value = bool(raw)
+        elif number in (7, 8):
+            value = raw
+        elif number in (9, 10):
+            value = (raw >> 1) ^ -(raw & 1)
+        elif number == 11:
+            value = struct.unpack('<d', raw)[0]
+        elif number == 12:
+            value = struct.unpack('<f', raw)[0]
+        elif number == 15:
+            children.append(_kv_field(raw))
+    if children:
+        value = {}
+        for child_name, child_value in children:
+            if child_name in value:
+                if not isinstance(value[child_name], list):
+                    value[child_name] = [value[child_name]]
+                value[child_name].append(child_value)
+            else:
+                value[child_name] = child_value
+    return name, value
+
+
+def decode_gpb_kv(payload):
+    '''Self-describing (key/value) protobuf message as the same kind of dict
+    the JSON encoding carries'''
+    message = {"Data": []}
+    for number, wire, raw in gpb_fields(payload):
+        if number == 1:
+            message["Identifier"] = raw
+        elif number == 6:
+            message["Path"] = raw
+        elif number == 10:
+            message["Timestamp"] = raw
+        elif number == 11:
+            message["Data"].append(_kv_field(raw)[1])
+    return message
+
+
+def _keys_name(keys):
+    '''Interface name of a row's keys, None if they do not name one'''
+    for key in NAME_KEYS:
+        if isinstance(keys.get(key), basestring):
+            return keys[key]
+    return None
+
+
+def extract_interfaces(data, found=None, name=None):
+    '''{interface: {counter: value}} of the numeric leaves found under each
+    interface in a decoded message body'''
+    if found is None:
+        found = {}
+    if isinstance(data, list):
+        for item in data:
+            extract_interfaces(item, found, name)
+        return found
+    if not isinstance(data, dict):
+        return found
+    if isinstance(data.get("keys"), dict) and "content" in data:
+        # A {"keys": {...}, "content": {...}} row: the keys name the
+        # interface the content's counters belong to
+        return extract_interfaces(data["content"], found, _keys_name(data["keys"]) or name)
+    for key in NAME_KEYS:
+        if isinstance(data.get(key), basestring):
+            name = data[key]
+    for key, value in data.iteritems():
+        if isinstance(value, (dict, list)):
+            child = key if isinstance(key, basestring) and INTERFACE_NAME.match(key) else name
+            extract_interfaces(value, found, child)
+        elif name is not None and isinstance(value, (int, long, float)) and not isinstance(value, bool):
+            found.setdefault(name, {})[key] = value
+    return found
+
+
+class TelemetryStore(object):
+    '''Latest counters per router and interface, as the receiver got them'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routers = {}
+        self.messages = 0
+        self.dropped = 0
+        self.listener_errors = 0
+        self.listeners = []
+
+    def update(self, router, interface, timestamp, counters):
+        with self.lock:
+            self.routers.setdefault(router, {})[interface] = {"timestamp": timestamp, "counters": dict(counters)}
+            listeners = list(self.listeners)
+        for listener in listeners:
+            # A failing listener (e.g. archive I/O) must not cost the others
+            # the sample or the connection its stream
+            try:
+                listener(router, interface, timestamp, counters)
+            except Exception, e:
+                print "Telemetry listener failed on "+router+" "+interface+": "+str(e)
+                self.count("listener_errors")
+
+    def snapshot(self, router=None):
+        with self.lock:
+            if router is not None:
+                return dict(self.routers.get(router, {}))
+            return dict((name, dict(intfs)) for name, intfs in self.routers.iteritems())
+
+    def stats(self):
+        with self.lock:
+            return {"messages": self.messages, "dropped": self.dropped, "listener_errors": self.listener_errors,
+                    "routers": len(self.routers),
+                    "interfaces": sum(len(intfs) for intfs in self.routers.itervalues())}
+
+    def count(self, key):
+        with self.lock:
+            setattr(self, key, getattr(self, key) + 1)
+
+
+class StreamDecoder(object):
+    '''Splits one connection's byte stream into messages and puts their
+    counters in the store. Compressed payloads share one zlib stream per
+    connection, restarted by a reset message.'''
+
+    def __init__(self, peer, store, capture=None):
+        self.peer = peer
+        self.store = store
+        self.capture = capture
+        self.buffer = ''
+        self.zlib = zlib.decompressobj()
+
+    def feed(self, data, received=None):
+        self.buffer += data
+        while len(self.buffer) >= HEADER.size:
+            msg_type, flags, length = HEADER.unpack_from(self.buffer)
+            if length > MAX_PAYLOAD:
+                raise DecodeError("payload of "+str(length)+" bytes from "+self.peer)
+            end = HEADER.size + length
+            if len(self.buffer) < end:
+                return
+            frame, self.buffer = self.buffer[:end], self.buffer[end:]
+            if self.capture is not None:
+                self.capture.write(self.peer, received or time.time(), frame)
+            self.message(msg_type, flags, frame[HEADER.size:], received or time.time())
+
+    def message(self, msg_type, flags, payload, received):
+        if msg_type == MSG_RESET_COMPRESSOR:
+            self.zlib = zlib.decompressobj()
+            return
+        if flags & FLAG_ZLIB:
+            payload = self.zlib.decompress(payload)
+        try:
+            if msg_type == MSG_JSON:
+                message = json.loads(payload)
+            elif msg_type == MSG_GPB_KEY_VALUE:
+                message = decode_gpb_kv(payload)
+            else:
+                # Compact GPB needs the per table .proto schema
+                self.store.count("dropped")
+                return
+        except (ValueError, DecodeError), e:
+            print "Bad telemetry message from "+self.peer+": "+str(e)
+            self.store.count("dropped")
+            return
+        self.store.count("messages")
+        router = message.get("Identifier") or self.peer
+        timestamp = message.get("End Time") or message.get("Timestamp")
+        timestamp = timestamp / 1000.0 if timestamp else received
+        for interface, counters in extract_interfaces(message.get("Data", message)).iteritems():
+            self.store.update(router, interface, timestamp, counters)
+
+
+class Capture(object):
+    '''Appends received frames to a file replay() can feed back'''
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, 'ab')
+
+    def write(self, peer, received, frame):
+        with self.lock:
+            self.file.write(RECORD.pack(len(peer), received, len(frame)) + peer + frame)
+            self.file.flush()
+
+
+class TelemetryHandler(SocketServer.BaseRequestHandler):
+    def handle(self):
+        peer = self.client_address[0]
+        decoder = StreamDecoder(peer, self.server.store, self.server.capture)
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                return
+            try:
+                decoder.feed(data)
+            except (DecodeError, zlib.error), e:
+                print "Dropping telemetry connection from "+peer+": "+str(e)
+                return
+
+
+class TelemetryReceiver(SocketServer.ThreadingTCPServer):
+    '''Accepts the routers' telemetry connections, one thread per router'''
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, store, port=TELEMETRY_PORT, host='0.0.0.0', capture=None):
+        SocketServer.ThreadingTCPServer.__init__(self, (host, port), TelemetryHandler)
+        self.store = store
+        self.capture = Capture(capture) if capture else None
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="telemetry receiver")
+        thread.daemon = True
+        thread.start()
+        return self
+
+
+def replay(path, store, speed=0):
+    '''Feed a capture file through the decoders. speed 0 replays as fast as
+    possible, 1 at the pace it was received, 2 twice as fast and so on.'''
+    decoders = {}
+    first = None
+    start = time.time()
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                break
+            peer_len, received, frame_len = RECORD.unpack(header)
+            peer = f.read(peer_len)
+            frame = f.read(frame_len)
+            if first is None:
+                first = received
+            if speed:
+                delay = (received - first) / speed - (time.time() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            if peer not in decoders:
+                decoders[peer] = StreamDecoder(peer, store)
+            try:
+                decoders[peer].feed(frame, received)
+            except (DecodeError, zlib.error), e:
+                # Like the receiver dropping the connection: the peer's next
+                # record starts a fresh stream
+                print "Dropping the telemetry stream of "+peer+": "+str(e)
+                del decoders[peer]
+    return store
+
+
+def print_store(store):
+    print "%-20s %-28s %-24s %s" % ("ROUTER", "INTERFACE", "TIME", "COUNTERS")
+    for router, intfs in sorted(store.snapshot().items()):
+        for interface, entry in sorted(intfs.items()):
+            print "%-20s %-28s %-24s %d" % (router, interface, time.ctime(entry["timestamp"]), len(entry["counters"]))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Receive the routers' interface telemetry stream")
+    sub = parser.add_subparsers(dest='action')
+    listen = sub.add_parser('listen', help="receive and print a summary every few seconds")
+    listen.add_argument('-p', '--port', type=int, help="defaults to the receiver port of flume.cfg")
+    listen.add_argument('-w', '--capture', type=str, help="append the received frames to this file")
+    listen.add_argument('-i', '--interval', type=float, default=10)
+    listen.add_argument('-a', '--archive', type=str, help="also append the samples to the archive in this directory")
+    play = sub.add_parser('replay', help="decode a capture file and print what it holds")
+    play.add_argument('capture', type=str)
+    play.add_argument('-s', '--speed', type=float, default=0, help="0 as fast as possible, 1 real time")
+    play.add_argument('-j', '--json', action='store_true', help="dump the whole store as JSON")
+    play.add_argument('-a', '--archive', type=str, help="also append the samples to the archive in this directory")
+
+    args = parser.parse_args(argv)
+    store = TelemetryStore()
+    if args.archive:
+        store.listeners.append(ArchiveWriter(args.archive).append)
+
+    if args.action == 'replay':
+        replay(args.capture, store, args.speed)
+        if args.json:
+            print json.dumps(store.snapshot(), indent=2, sort_keys=True)
+        else:
+            print_store(store)
+        print store.stats()
+        return
+
+    encoding = receiver_config().get("encoding")
+    if encoding not in (None,) + ENCODINGS:
+        print "Warning: flume.cfg asks for "+encoding+" messages, only "+", ".join(ENCODINGS)+" are decoded"
+    port = args.port or receiver_port()
+    TelemetryReceiver(store, port, capture=args.capture).start()
+    print "Receiving telemetry on port "+str(port)
+    try:
+        while True:
+            time.sleep(args.interval)
+            print_store(store)
+            print store.stats()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,12 +1,11 @@
 import os
-from flask import Flask, render_template, request, session, redirect, url_for, jsonify
+from flask import Flask, Response, render_template, request, session, redirect, url_for, jsonify
 from pprint import pprint
 import requests
 from requests.auth import HTTPDigestAuth
 import urlparse
 import logging
 import httplib
-httplib.HTTPConnection.debuglevel = 1
 import subprocess
 import commands
 import shlex
@@ -14,147 +13,99 @@ import json
 from subprocess import Popen, PIPE
 import time
 import os.path as path
-from threading import Timer
+from threading import Lock
 import pickle
 import hashlib
 import pdb
 import re
+import sys
+import argparse
+from file_watch import FileWatcher, PickleSnapshot
+from telemetry_receiver import TelemetryStore, TelemetryReceiver, receiver_port
+from timeseries import SeriesStore, WINDOWS, downsample
+from telemetry_archive import ArchiveWriter, ArchiveReader, ArchiveError
+from graphite_crawler import GraphiteCrawler
+from scheduler import Scheduler, SKIP, COALESCE
 
 logging.basicConfig()
 logging.getLogger().setLevel(logging.DEBUG)
 requests_log = logging.getLogger("requests.packages.urllib3")
-requests_log.setLevel(logging.DEBUG)
+# Not every pooled request of the crawler
+requests_log.setLevel(logging.INFO)
 requests_log.propagate = True
 
 GRAPHITE_SERVER = "http://10.105.237.219"
 ABS_PATH = os.path.dirname(os.path.abspath(__file__))
-MOUNT_BRANCH = {}
-BRANCH_COUNT = 0
-
-#Function to convert a list of indices to a dict path
-def nested_set(dic, keys, value):
-    for key in keys[:-1]:
-        dic = dic.setdefault(key, {})
-    dic[keys[-1]] = value
-
-def metric_list(prev_mount, mount):
-    metric_url = GRAPHITE_SERVER + "/metrics/expand/?query=collectd"+ prev_mount +  mount + ".*"
-    metric_result = requests.get(metric_url)
-    results = json.loads(metric_result.content)["results"]
-    return results
-
-#Start the lldp data gathering thread
-def lldp_gather():
-    shell_cmd = "python "+ABS_PATH+"/heat_map_gen.py -u akshshar -p cisco123 --ip-list 172.16.11.254 172.16.11.253 172.16.11.252 172.16.11.251 172.16.11.1 172.16.11.2"
-    print "shell_cmd is "+str(shell_cmd)
-
-    try:
-        out = subprocess.call(shlex.split(shell_cmd))
-    except:
-        print "Failed to run the lldp_gather script" 
-
-    Timer(30, lldp_gather).start()
-
-
-def check_file_mod(path):
-    fileChanged = False
-    try:
-        l = pickle.load(open("db"))
-    except IOError:
-        l = []
-    db = dict(l)
-    #this converts the hash to text
-    checksum = hashlib.md5(open(path).read()).hexdigest()
-    if db.get(path, None) != checksum:
-        print "file changed"
-        fileChanged = True
-        db[path] = checksum
-    pickle.dump(db.items(), open("db", "w"))
-    return fileChanged
-
-
-def update_mnt_branch (branch_list, prev_mount):
-       global BRANCH_COUNT, MOUNT_BRANCH
-       BRANCH_COUNT = BRANCH_COUNT + 1
-       MOUNT_BRANCH["branch_"+str(BRANCH_COUNT)] = {"branch" : branch_list, "prev_mount" : prev_mount}
-
-def get_mnt_branch_keyed_list():
-    branch_keys = []
-    #Obtain list of keys from mount branch
-    for key, value in MOUNT_BRANCH.iteritems():
-         branch_keys.append(key)
-
-    return branch_keys
+# Latest 1 minute average of every collectd metric in Graphite
+CRAWLER = GraphiteCrawler(GRAPHITE_SERVER, "collectd")
+ND_STATS = {"collectd_metrics" : {}, "updated" : None}
+
+# Devices the LLDP collector polls, all of them in one run. heat_map_gen.py
+# builds one heat map from the whole list, so the run as a whole starts at
+# a random point of its first interval rather than with the server.
+LLDP_DEVICES = ["172.16.11.254", "172.16.11.253", "172.16.11.252", "172.16.11.251", "172.16.11.1", "172.16.11.2"]
+LLDP_SCRIPT = os.path.join(ABS_PATH, "heat_map_gen.py")
+LLDP_INTERVAL = 30
+ND_STATS_INTERVAL = 60
+# Collector jobs, their run metrics are served on /jobs
+SCHEDULER = Scheduler(workers=4)
+
+TOPO_JSON = '/home/akshshar/topo/static/js/topo.json'
+# Watched from a background thread once the server starts, requests only
+# read the in-memory version
+TOPO = FileWatcher(TOPO_JSON)
+# Version last answered to clients that do not send their own
+TOPO_REPORTED = {"version": 0}
+TOPO_LOCK = Lock()
+# Longest a long-poll or an idle event stream waits before answering
+TOPO_WAIT_MAX = 30
+
+MGMT_ETH_STATS = '/home/cisco/sunstone/msdc/MgmEthernet_stats'
+# Reloaded by its watcher when the collector rewrites it, requests are
+# answered from the cached JSON
+TELEMETRY = PickleSnapshot(MGMT_ETH_STATS)
+
+# Counters straight from the routers' telemetry stream (see flume.cfg)
+LIVE = TelemetryStore()
+# and their recent history, for rates and trends
+SERIES = SeriesStore()
+LIVE.listeners.append(SERIES.add)
+# and all of it on disk. Whoever receives the stream writes it (this server,
+# or a standalone telemetry_receiver.py listen -a), the server reads it.
+TELEMETRY_ARCHIVE = os.path.join(ABS_PATH, 'telemetry_archive')
+ARCHIVE = ArchiveReader(TELEMETRY_ARCHIVE)
+
+def lldp_gather(user, password, devices):
+    # heat_map_gen.py lives outside this tree and is only runnable as a script
+    status = subprocess.call(["python", LLDP_SCRIPT, "-u", user, "-p", password, "--ip-list"] + devices)
+    if status != 0:
+        raise RuntimeError("heat_map_gen.py exited with "+str(status))
+
+
+def schedule_collectors(args):
+    '''Start the collectors asked for on the command line, none by default'''
+    if "lldp" in args.collect:
+        SCHEDULER.every("lldp", LLDP_INTERVAL, lambda: lldp_gather(args.lldp_user, args.lldp_password, args.lldp_devices),
+                        jitter=LLDP_INTERVAL, overlap=SKIP)
+    if "nd_stats" in args.collect:
+        SCHEDULER.every("nd_stats", ND_STATS_INTERVAL, store_nd_stats, jitter=ND_STATS_INTERVAL, overlap=COALESCE)
+    SCHEDULER.start()
+
+
+def topo_changed(version):
+    '''Whether topo.json changed since the version a client has seen. Clients
+    that send none share the version last answered, like the old db file.'''
+    if version is not None:
+        return version != TOPO.version
+    with TOPO_LOCK:
+        changed = TOPO_REPORTED["version"] != TOPO.version
+        TOPO_REPORTED["version"] = TOPO.version
+    return changed
 
 
 def store_nd_stats():
-    shell_cmd = "python "+ABS_PATH+"/store_nd_stats.py"
-    print "shell_cmd is "+str(shell_cmd)
-
-    try:
-        out = subprocess.call(shlex.split(shell_cmd))
-    except:
-        print "Failed to run the store_nd_stats script"
-
-    Timer(60, store_nd_stats).start()
-
-    #Walk through the entire collectd metric list using Graphite's API
-#    global MOUNT_BRANCH
-#    collectd_metrics = {}
-    #Prepare a list of nodes
-#    node_list = []
-#    metric_nodes_collectd_url = GRAPHITE_SERVER + "/metrics/expand/?query=collectd.*"
-#    output = requests.get(metric_nodes_collectd_url)
-#    prev_mount = "."
-#    mount_list = []
-#    for node in json.loads(output.content)["results"]:
-#        node = re.sub('^collectd\.', '' , node)
-#        node_list.append(node)
-#        collectd_metrics[node] = {}
-#    update_mnt_branch(node_list, prev_mount)
-   
-#    keys_done = 1
-#    key_index = 1
-    #key = get_mnt_branch_keyed_list()[key_index] dd
-   
-#    while(True): 
-#        for mount in MOUNT_BRANCH["branch_"+str(key_index)]["branch"]:
-#            results = metric_list(MOUNT_BRANCH["branch_"+str(key_index)]["prev_mount"], mount)
-#            if results == []:
-#                print "Result was empty!!"
-                #This is a terminal metric. Determine its summarized value over the last 1 minute
-#                render_url = GRAPHITE_SERVER + "/render?target=summarize(collectd"+ MOUNT_BRANCH["branch_"+str(key_index)]["prev_mount"] +  mount+", \"1min\", \"avg\", true)&from=-1min&format=json"
-#                metric_value = requests.get(render_url)
-#                mount_value_list = filter(None, (prev_mount+mount).split(".")) 
-                #pdb.set_trace()
-#                nested_set(collectd_metrics, mount_value_list, json.loads(metric_value.content)[0]['datapoints'][0][0]) 
-#                break
-
-#            prev_mount = MOUNT_BRANCH["branch_"+str(key_index)]["prev_mount"]+mount+"."
-#            count = 0
-#            for metric in results:
-#                mount =  re.sub('^collectd'+prev_mount, '' , metric)
-#                results[count] = mount
-#                count = count + 1
-#            update_mnt_branch(results, prev_mount)
-#            mount_list =  filter(None, prev_mount.split("."))
-#            for mount in results:
-#                mount_list.append(mount)
-                #print "MPOUNT LIST IS ---> !!!!!"
-                #print mount_list
-#                nested_set(collectd_metrics, mount_list, {})  
-#                mount_list = mount_list[:-1]
-#        MOUNT_BRANCH.pop("branch_"+str(key_index), None)
-#        key_index = key_index + 1
-#        if ("branch_"+str(key_index)) not in MOUNT_BRANCH:
-#            break
-
-#    try:
-#        pickle.dump(collectd_metrics, open("graphite_nd_stats", "wb"))     
-#        MOUNT_BRANCH = {}
-#        response  = {"result" : "success"}
-#    except:
-#        response  = {"result" : "failure"}
+    ND_STATS["collectd_metrics"] = CRAWLER.collect()
+    ND_STATS["updated"] = time.time()
 
 
 app = Flask(__name__)
@@ -166,29 +117,152 @@ def home():
 
 @app.route('/check-topo')
 def check_topo():
-        fileMod = check_file_mod('/home/akshshar/topo/static/js/topo.json')
-        if fileMod == True:
+        # ?version=N from the previous answer, ?wait=S to hold the request
+        # until topo.json changes (long-poll)
+        version = request.args.get('version', None, type=int)
+        wait = min(request.args.get('wait', 0, type=float), TOPO_WAIT_MAX)
+        if version is not None and wait > 0:
+            TOPO.wait(version, wait)
+        if topo_changed(version):
             response = {"status" : "changed"}
         else:
             response = {"status" : "unchanged"}
+        response["version"] = TOPO.version
 
         return jsonify(response)
 
 
+@app.route('/topo-events')
+def topo_events():
+    # Server-Sent Events: one "topo" event per topo.json change, a comment
+    # line keeps idle connections open through proxies
+    version = request.args.get('version', TOPO.version, type=int)
+
+    def events(version):
+        while True:
+            current = TOPO.wait(version, TOPO_WAIT_MAX)
+            if current == version:
+                yield ": keepalive\n\n"
+                continue
+            version = current
+            yield "event: topo\nid: "+str(version)+"\ndata: "+json.dumps({"status" : "changed", "version" : version})+"\n\n"
+
+    return Response(events(version), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
 @app.route('/telemetry-data')
 def telemetry_data():
+    body, etag = TELEMETRY.snapshot()
+    if body is None:
+        return jsonify({"result" : "failure, "+str(TELEMETRY.error)+"\n try again", "collectd_metrics" : ""})
+
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    # 304 without a body when the client's If-None-Match is still current
+    return response.make_conditional(request)
+
+
+@app.route('/nd-stats')
+def nd_stats():
+    return jsonify(ND_STATS)
+
+
+@app.route('/jobs')
+def jobs():
+    return jsonify(SCHEDULER.metrics())
+
+
+@app.route('/telemetry-live')
+@app.route('/telemetry-live/<router>')
+def telemetry_live(router=None):
+    return jsonify({"routers" : LIVE.snapshot(router) if router is None else {router : LIVE.snapshot(router)},
+                    "stats" : LIVE.stats()})
+
+
+def series_query():
+    '''since (epoch seconds) and counters (comma separated) of a history query'''
+    counters = request.args.get('counters', None)
+    return request.args.get('since', None, type=float), counters.split(',') if counters else None
+
+
+@app.route('/telemetry-rate/<router>/<path:interface>')
+def telemetry_rate(router, interface):
+    since, counters = series_query()
+    try:
+        return jsonify(SERIES.rates(router, interface, since, counters))
+    except KeyError:
+        return jsonify({"result" : "failure, no history for "+router+" "+interface}), 404
+
+
+@app.route('/telemetry-history/<router>/<path:interface>')
+def telemetry_history(router, interface):
+    # ?window=1m|5m|1h&rate=1 for min/avg/max/last of the per second rates
+    since, counters = series_query()
+    window = request.args.get('window', '1m')
+    if window not in WINDOWS:
+        return jsonify({"result" : "failure, window is one of "+", ".join(sorted(WINDOWS))}), 400
     try:
-        with open('/home/cisco/sunstone/msdc/MgmEthernet_stats', 'rb') as stats_file:
-            telemetry_MgmtEth0 = pickle.load(stats_file)         
-            print telemetry_MgmtEth0
-        response = telemetry_MgmtEth0
-    except Exception,e:
-        response = {"result" : "failure, "+str(e)+"\n try again", "collectd_metrics" : ""}
+        return jsonify(SERIES.history(router, interface, window, since, counters,
+                                      rate=request.args.get('rate', 0, type=int) == 1))
+    except KeyError:
+        return jsonify({"result" : "failure, no history for "+router+" "+interface}), 404
 
+
+@app.route('/telemetry-archive')
+def telemetry_archive():
+    return jsonify({"series" : [{"router" : router, "interface" : interface} for router, interface in ARCHIVE.series()]})
+
+
+@app.route('/telemetry-archive/<router>/<path:interface>')
+def telemetry_archive_window(router, interface):
+    # ?start=&end= epoch seconds, &window=1m|5m|1h to downsample
+    counters = request.args.get('counters', None)
+    window = request.args.get('window', None)
+    if window is not None and window not in WINDOWS:
+        return jsonify({"result" : "failure, window is one of "+", ".join(sorted(WINDOWS))}), 400
+    try:
+        times, values, names = ARCHIVE.window(router, interface, request.args.get('start', None, type=float),
+                                              request.args.get('end', None, type=float),
+                                              counters.split(',') if counters else None)
+    except KeyError:
+        return jsonify({"result" : "failure, nothing archived for "+router+" "+interface}), 404
+
+    if window is None:
+        aggregates = {"values" : values}
+    else:
+        times, aggregates = downsample(times, values, WINDOWS[window])
+    response = {"times" : times.tolist()}
+    for name, array in aggregates.iteritems():
+        response[name] = dict((counter, [None if v != v else float(v) for v in array[:, i]])
+                              for i, counter in enumerate(names))
     return jsonify(response)
- 
+
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0',port=6302, debug=True, use_reloader=False)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--collect', nargs='+', choices=["lldp", "nd_stats"], default=[],
+                        help="periodic collectors to run. nd_stats runs in this process, lldp still runs "
+                             "heat_map_gen.py as a subprocess, once per interval for all the --lldp-devices")
+    parser.add_argument('--lldp-user', type=str)
+    parser.add_argument('--lldp-password', type=str)
+    parser.add_argument('--lldp-devices', nargs='+', type=str, default=LLDP_DEVICES)
+    args = parser.parse_args(sys.argv[1:])
+    if "lldp" in args.collect:
+        if not (args.lldp_user and args.lldp_password):
+            parser.error("the lldp collector needs --lldp-user and --lldp-password")
+        if not os.path.exists(LLDP_SCRIPT):
+            parser.error("the lldp collector needs "+LLDP_SCRIPT)
+
+    TOPO.start()
+    TELEMETRY.start()
+    try:
+        LIVE.listeners.append(ArchiveWriter(TELEMETRY_ARCHIVE).append)
+    except ArchiveError, e:
+        print str(e)+", serving it read only"
+    TelemetryReceiver(LIVE, receiver_port()).start()
+    schedule_collectors(args)
+    # Threaded, event streams and long-polls hold their request open
+    app.run(host='0.0.0.0',port=6302, debug=True, use_reloader=False, threaded=True)
 
 
 
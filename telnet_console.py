@@ -0,0 +1,266 @@
+import re
+import sys
+import time
+import errno
+import select
+import socket
+import argparse
+from tracer import TRACER
+from expect_channel import HOST_PROMPT, XR_EXEC_PROMPT, XR_CONFIG_PROMPT
+
+# Telnet protocol bytes
+IAC = chr(255)
+DONT = chr(254)
+DO = chr(253)
+WONT = chr(252)
+WILL = chr(251)
+SB = chr(250)
+SE = chr(240)
+ECHO = chr(1)
+SGA = chr(3)
+
+# The serial consoles are qemu telnet servers on the local machine
+CONSOLE_HOST = 'localhost'
+CONSOLE_TIMEOUT = 600
+# Kick the console with a carriage return when it has been quiet this long
+NUDGE_SECS = 5
+
+
+class ConsoleError(Exception):
+    pass
+
+
+class ConsoleTask(object):
+    '''Prompt state machine driving one telnet console.
+
+    rules is an ordered list of (regex, action). When a regex matches the
+    unread output, the output up to the match is consumed and the action
+    runs: a string is sent to the console (and we keep going), a callable
+    is called with (task, match) and a non-None return value completes the
+    task with that result.
+    '''
+
+    def __init__(self, name, port, rules, host=CONSOLE_HOST, timeout=CONSOLE_TIMEOUT, nudge=NUDGE_SECS):
+        self.name = name
+        self.host = host
+        self.port = int(port)
+        self.rules = [(re.compile(regex), action) for regex, action in rules]
+        self.timeout = timeout
+        self.nudge = nudge
+        self.sock = None
+        self.raw = ''
+        self.buffer = ''
+        self.done = False
+        self.result = None
+        self.error = None
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), 10)
+        self.sock.setblocking(0)
+        self.deadline = time.time() + self.timeout
+        self.last_activity = time.time()
+        self.send("\r")
+
+    def send(self, data):
+        self.sock.sendall(data.replace(IAC, IAC+IAC))
+        self.last_activity = time.time()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def finish(self, result=None, error=None):
+        self.done = True
+        self.result = result
+        self.error = error
+        if self.sock is not None:
+            self.sock.close()
+
+    def _negotiate(self, data):
+        '''Strip telnet commands out of data, refusing every option except
+        remote echo and suppress-go-ahead. Returns the plain text.'''
+        data = self.raw + data
+        self.raw = ''
+        text = []
+        replies = []
+        i = 0
+        while i < len(data):
+            ch = data[i]
+            if ch != IAC:
+                text.append(ch)
+                i += 1
+                continue
+            if i + 1 >= len(data):
+                self.raw = data[i:]
+                break
+            cmd = data[i+1]
+            if cmd == IAC:
+                text.append(IAC)
+                i += 2
+            elif cmd in (DO, DONT, WILL, WONT):
+                if i + 2 >= len(data):
+                    self.raw = data[i:]
+                    break
+                opt = data[i+2]
+                if cmd == DO:
+                    replies.append(IAC+WONT+opt)
+                elif cmd == WILL:
+                    replies.append(IAC+(DO if opt in (ECHO, SGA) else DONT)+opt)
+                i += 3
+            elif cmd == SB:
+                end = data.find(IAC+SE, i)
+                if end < 0:
+                    self.raw = data[i:]
+                    break
+                i = end + 2
+            else:
+                i += 2
+        if replies:
+            self.sock.sendall(''.join(replies))
+        return ''.join(text)
+
+    def feed(self, data):
+        self.buffer += self._negotiate(data)
+        self.last_activity = time.time()
+        while not self.done:
+            for regex, action in self.rules:
+                match = regex.search(self.buffer)
+                if match:
+                    break
+            else:
+                return
+            self.buffer = self.buffer[match.end():]
+            if callable(action):
+                result = action(self, match)
+                if result is not None:
+                    self.finish(result)
+            else:
+                self.send(action)
+
+    def tick(self, now):
+        if now > self.deadline:
+            self.finish(error=ConsoleError(self.name+": timed out on console port "+str(self.port)))
+        elif now - self.last_activity > self.nudge:
+            self.send("\r")
+
+
+@TRACER.traced("run_consoles", "console")
+def run_consoles(tasks, poll=0.5):
+    '''Drive every task from one select() loop until all of them are done.
+
+    Returns {task.name: result}. Tasks that fail or time out, or whose
+    rules raise, have their exception stored in task.error and map to None.
+    '''
+    for task in tasks:
+        try:
+            task.connect()
+        except socket.error, e:
+            task.finish(error=e)
+
+    while True:
+        active = [t for t in tasks if not t.done]
+        if not active:
+            break
+        readable, _, _ = select.select(active, [], [], poll)
+        for task in readable:
+            try:
+                data = task.sock.recv(4096)
+            except socket.error, e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    continue
+                task.finish(error=e)
+                continue
+            if not data:
+                task.finish(error=ConsoleError(task.name+": console port "+str(task.port)+" closed"))
+                continue
+            TRACER.add("bytes", len(data))
+            try:
+                task.feed(data)
+            except Exception, e:
+                # A rule action or a send failed, the other consoles go on
+                task.finish(error=e)
+        now = time.time()
+        for task in active:
+            if not task.done:
+                try:
+                    task.tick(now)
+                except Exception, e:
+                    task.finish(error=e)
+
+    return dict((t.name, t.result) for t in tasks)
+
+
+def _read_ip(task, match):
+    return match.group(1)
+
+
+def host_ip_task(host_port, name=None):
+    '''Log into the host linux console and read the eth2 address'''
+    rules = [
+        (r'login:\s*$', 'root\r'),
+        (r'Username:\s*$', 'root\r'),
+        (r'Password:\s*$', 'lab\r'),
+        (r'inet addr:(\d+\.\d+\.\d+\.\d+)', _read_ip),
+        (HOST_PROMPT, 'ifconfig eth2\r'),
+    ]
+    return ConsoleTask(name or "host:"+str(host_port), host_port, rules)
+
+
+def xr_console_task(xr_port, name=None):
+    '''First boot XR console setup: root-system user, then back to exec mode'''
+    rules = [
+        (r'Enter root-system username:\s*$', 'root\r'),
+        (r'Enter secret:\s*$', 'root\r'),
+        (r'Enter secret again:\s*$', 'root\r'),
+        (r'Username:\s*$', 'root\r'),
+        (r'Password:\s*$', 'root\r'),
+        (r'Uncommitted changes found.*\?\s*\S*\s*$', 'no\r'),
+        (XR_CONFIG_PROMPT, 'exit\r'),
+        (XR_EXEC_PROMPT, lambda task, match: True),
+    ]
+    return ConsoleTask(name or "xr:"+str(xr_port), xr_port, rules)
+
+
+def _run_one(task):
+    run_consoles([task])
+    if task.error is not None:
+        raise task.error
+    return task.result
+
+
+def get_host_ip(host_port):
+    return _run_one(host_ip_task(host_port))
+
+
+def setup_xr_console(xr_port):
+    return _run_one(xr_console_task(xr_port))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('action', choices=['host-ip', 'xr-setup'], help="host-ip prints the host eth2 address, xr-setup does the first boot XR console setup")
+    parser.add_argument('ports', help="console telnet port(s)", nargs='+', type=int)
+
+    args = parser.parse_args(argv)
+
+    if args.action == 'host-ip':
+        tasks = [host_ip_task(port) for port in args.ports]
+    else:
+        tasks = [xr_console_task(port) for port in args.ports]
+
+    run_consoles(tasks)
+    failed = False
+    for task in tasks:
+        if task.error is not None:
+            sys.stderr.write(str(task.error)+"\n")
+            failed = True
+        elif args.action == 'host-ip':
+            if len(tasks) > 1:
+                print str(task.port)+" "+task.result
+            else:
+                print task.result
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,92 @@
+'''Builds the telemetry capture fixtures replayed by the tests.
+
+Run from the repository root: python tests/data/make_captures.py
+'''
+import os
+import sys
+import json
+import zlib
+import struct
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(DATA_DIR)))
+from telemetry_receiver import HEADER, MSG_JSON, MSG_GPB_KEY_VALUE, MSG_RESET_COMPRESSOR, FLAG_ZLIB, Capture
+
+START = 1700000000.0
+
+
+def varint(value):
+    out = ''
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out += chr(byte | 0x80)
+        else:
+            return out + chr(byte)
+
+
+def field(number, value):
+    if isinstance(value, str):
+        return varint(number << 3 | 2) + varint(len(value)) + value
+    return varint(number << 3) + varint(value)
+
+
+def kv(name, value=None, children=()):
+    '''TelemetryField: a string or uint64 leaf, or a container of children'''
+    body = field(2, name)
+    if isinstance(value, str):
+        body += field(5, value)
+    elif value is not None:
+        body += field(8, value)
+    for child in children:
+        body += field(15, child)
+    return body
+
+
+def frame(msg_type, payload, flags=0):
+    return HEADER.pack(msg_type, flags, len(payload)) + payload
+
+
+def json_message(index):
+    return json.dumps({"Policy": "ports", "Identifier": "rtr1", "End Time": int((START + 5 * index) * 1000),
+                       "Data": {"Interfaces": {"MgmtEth0/RP0/CPU0/0": {"Latest": {
+                           "Interface_Name": "MgmtEth0/RP0/CPU0/0", "bytes_received": 1000 * (index + 1),
+                           "packets_received": 10 * (index + 1)}}}}})
+
+
+def gpb_kv_message(index):
+    rows = []
+    for intf, scale in (("GigabitEthernet0/0/0/0", 1), ("GigabitEthernet0/0/0/1", 2)):
+        keys = kv("keys", children=[kv("interface-name", intf)])
+        content = kv("content", children=[kv("packets-received", 100 * scale * (index + 1)),
+                                          kv("bytes-sent", 5000 * scale * (index + 1))])
+        rows.append(kv("", children=[keys, content]))
+    message = field(1, "rtr2") + field(6, "Cisco-IOS-XR-infra-statsd-oper:infra-statistics/interfaces/interface/latest")
+    message += field(10, int((START + 5 * index) * 1000))
+    for row in rows:
+        message += field(11, row)
+    return message
+
+
+def main():
+    path = os.path.join(DATA_DIR, "telemetry_json.cap")
+    if os.path.exists(path):
+        os.remove(path)
+    capture = Capture(path)
+    compressor = zlib.compressobj()
+    capture.write("10.1.1.1", START, frame(MSG_JSON, json_message(0)))
+    capture.write("10.1.1.1", START + 5, frame(MSG_RESET_COMPRESSOR, ''))
+    payload = compressor.compress(json_message(1)) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    capture.write("10.1.1.1", START + 5, frame(MSG_JSON, payload, FLAG_ZLIB))
+
+    path = os.path.join(DATA_DIR, "telemetry_gpbkv.cap")
+    if os.path.exists(path):
+        os.remove(path)
+    capture = Capture(path)
+    for index in range(2):
+        capture.write("10.1.1.2", START + 5 * index, frame(MSG_GPB_KEY_VALUE, gpb_kv_message(index)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import json
+import urlparse
+import threading
+import BaseHTTPServer
+import SocketServer
+
+
+class StubGraphite(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''Just enough of graphite-web for the crawler: /metrics/find over a set
+    of leaf paths and a multi-target POST /render, counting the requests'''
+    daemon_threads = True
+
+    def __init__(self, leaves):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.leaves = set(leaves)
+        self.lock = threading.Lock()
+        self.counts = {"find": 0, "render": 0}
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self.server_address[1]
+
+    def count(self, kind):
+        with self.lock:
+            self.counts[kind] += 1
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, obj):
+        body = json.dumps(obj)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        if url.path.rstrip('/') != "/metrics/find":
+            self.send_error(404)
+            return
+        self.server.count("find")
+        node = urlparse.parse_qs(url.query)["query"][0][:-len(".*")]
+        children = {}
+        for leaf in self.server.leaves:
+            if leaf.startswith(node + "."):
+                rest = leaf[len(node) + 1:].split(".")
+                children[node + "." + rest[0]] = 1 if len(rest) == 1 else 0
+        self.reply([{"id": path, "leaf": leaf, "text": path.split(".")[-1]} for path, leaf in sorted(children.items())])
+
+    def do_POST(self):
+        if self.path != "/render":
+            self.send_error(404)
+            return
+        self.server.count("render")
+        form = urlparse.parse_qs(self.rfile.read(int(self.headers["Content-Length"])))
+        # Like graphite, a target that matches nothing is left out
+        self.reply([{"target": target, "datapoints": [[1.0, 60], [None, 70], [3.0, 80]]}
+                    for target in form["target"] if target in self.server.leaves])
@@ -0,0 +1,72 @@
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import unittest
+from StringIO import StringIO
+import bench_provision
+from tests.test_sim_router import free_ports
+
+
+def span(name, cat, seconds):
+    return {"name": name, "cat": cat, "ph": "X", "ts": 0, "dur": seconds * 1e6}
+
+
+class SummaryTest(unittest.TestCase):
+
+    def test_percentile(self):
+        self.assertEqual(bench_provision.percentile([], 50), 0.0)
+        self.assertEqual(bench_provision.percentile([3.0, 1.0, 2.0], 50), 2.0)
+        self.assertEqual(bench_provision.percentile([3.0, 1.0, 2.0], 100), 3.0)
+        self.assertEqual(bench_provision.percentile(range(101), 95), 95)
+
+    def test_summarize(self):
+        results = [{"net_name": "sim0", "status": 0,
+                    "events": [span("host_ip", "step", 1.0), span("tap", "step", 4.0), span("tap", "verify", 9.0),
+                               span("provision sim0", "run", 6.0)]},
+                   {"net_name": "sim1", "status": 1,
+                    "events": [span("host_ip", "step", 3.0), span("provision sim1", "run", 3.0)]}]
+        report = bench_provision.summarize(2, 7.5, results)
+        self.assertEqual((report["routers"], report["wall"], report["failed"]), (2, 7.5, 1))
+        self.assertEqual((report["router_p50"], report["router_max"]), (6.0, 6.0))
+        self.assertEqual([p["name"] for p in report["phases"]], ["host_ip", "tap"])
+        self.assertEqual(report["phases"][0]["mean"], 2.0)
+        self.assertEqual(report["phases"][1]["max"], 4.0)
+
+    def test_print_round(self):
+        report = bench_provision.summarize(1, 2.0, [{"net_name": "sim0", "status": 0,
+                                                     "events": [span("lxc_up", "step", 1.5)]}])
+        out = StringIO()
+        sys.stdout, saved = out, sys.stdout
+        try:
+            bench_provision.print_round(report)
+        finally:
+            sys.stdout = saved
+        lines = out.getvalue().strip().splitlines()
+        self.assertIn("1 router(s): 2.00s wall", lines[0])
+        self.assertEqual(lines[-1].split(), ["lxc_up", "1.50", "1.50", "1.50", "1.50"])
+
+
+class RoundTest(unittest.TestCase):
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        self.saved_home = os.environ["HOME"]
+        os.environ["HOME"] = self.home
+
+    def tearDown(self):
+        os.environ["HOME"] = self.saved_home
+        shutil.rmtree(self.home)
+
+    def test_round(self):
+        args = argparse.Namespace(ssh_port=free_ports(1), boot_delay=0.5, intf_delay=0.2, latency=0.0, keep=False)
+        report = bench_provision.run_round(2, args)
+        self.assertEqual((report["routers"], report["failed"]), (2, 0))
+        self.assertEqual([p["name"] for p in report["phases"]], bench_provision.BENCH_STEPS)
+        # Keys, journals and the inventory stay in the round's scratch dir
+        self.assertEqual(os.listdir(self.home), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import socket
+import unittest
+from expect_channel import ExpectChannel, ExpectTimeout, ExpectEOF, xr_cli_login, XR_PROMPTS, SHELL_PROMPT
+from tests.xr_stub import SlowXrShell, XrRouter, FLUME_ROW
+
+XR_PROMPT = "RP/0/RP0/CPU0:ios#"
+XR_SHELL = "[xr-vm_node0_RP0_CPU0:~]$ "
+
+
+class FakeChannel(object):
+    '''Shell channel fed from a list of chunks, '' is EOF. reply(data) is
+    called with everything sent and may queue more chunks.'''
+
+    def __init__(self, chunks=(), reply=None):
+        self.chunks = list(chunks)
+        self.reply = reply
+        self.sent = []
+        self.timeout = None
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def recv_ready(self):
+        return bool(self.chunks) and self.chunks[0] != ''
+
+    def recv(self, size):
+        if not self.chunks:
+            raise socket.timeout()
+        return self.chunks.pop(0)
+
+    def sendall(self, data):
+        self.sent.append(data)
+        if self.reply:
+            self.chunks.extend(self.reply(data))
+
+
+class ExpectTest(unittest.TestCase):
+
+    def test_match_across_chunks(self):
+        console = ExpectChannel(FakeChannel(["show ver\r\nCisco IOS XR\r\nRP/0/RP0", "/CPU0:ios#"]))
+        index, match, output = console.expect(XR_PROMPTS, 1)
+        self.assertEqual(index, 0)
+        self.assertEqual(output, "show ver\r\nCisco IOS XR\r\n"+XR_PROMPT)
+
+    def test_index_of_matching_pattern(self):
+        console = ExpectChannel(FakeChannel(["commit\r\nRP/0/RP0/CPU0:ios(config)#"]))
+        self.assertEqual(console.expect(XR_PROMPTS, 1)[0], 1)
+
+    def test_output_after_match_is_kept(self):
+        console = ExpectChannel(FakeChannel([XR_SHELL+"ls\r\n", "a b\r\n"+XR_SHELL]))
+        self.assertEqual(console.expect(r'\$ ', 1)[2], "[xr-vm_node0_RP0_CPU0:~]$ ")
+        self.assertEqual(console.buffer, "ls\r\n")
+        self.assertEqual(console.expect(SHELL_PROMPT, 1)[2], "ls\r\na b\r\n"+XR_SHELL)
+
+    def test_timeout_carries_output(self):
+        console = ExpectChannel(FakeChannel(["partial output"]))
+        with self.assertRaises(ExpectTimeout) as caught:
+            console.expect(XR_PROMPTS, 0.05)
+        self.assertEqual(caught.exception.output, "partial output")
+
+    def test_eof_carries_output(self):
+        console = ExpectChannel(FakeChannel(["logout\r\n", ""]))
+        with self.assertRaises(ExpectEOF) as caught:
+            console.expect(XR_PROMPTS, 1)
+        self.assertEqual(caught.exception.output, "logout\r\n")
+
+
+class RunTest(unittest.TestCase):
+
+    def test_run_returns_stale_output_first(self):
+        channel = FakeChannel(["old line\r\n"], reply=lambda data: [data.replace('\n', '\r\n')+"out\r\n"+XR_PROMPT])
+        console = ExpectChannel(channel)
+        console.buffer = "leftover "
+        self.assertEqual(console.run("show clock", XR_PROMPTS, 1),
+                         "leftover old line\r\nshow clock\r\nout\r\n"+XR_PROMPT)
+        self.assertEqual(channel.sent, ["show clock\n"])
+        self.assertEqual(console.buffer, "")
+
+    def test_run_eol(self):
+        channel = FakeChannel(reply=lambda data: [data+"\n"+XR_SHELL])
+        ExpectChannel(channel).run("ifconfig", SHELL_PROMPT, 1, "\r")
+        self.assertEqual(channel.sent, ["ifconfig\r"])
+
+    def test_late_prompts_of_blank_lines(self):
+        # Each blank line gets its own prompt, 50ms apart. Those still on
+        # their way must not end the wait for the next command.
+        console = ExpectChannel(SlowXrShell(XrRouter()))
+        console.expect(SHELL_PROMPT, 1)
+        xr_cli_login(console, timeout=1)
+        console.run("\n\n", XR_PROMPTS, 1)
+        self.assertIn(FLUME_ROW % (1143, 6763), console.run("show proc | i flume", XR_PROMPTS, 1))
+
+    def test_stream_waits_for_echo(self):
+        console = ExpectChannel(SlowXrShell(XrRouter()))
+        console.expect(SHELL_PROMPT, 1)
+        xr_cli_login(console, timeout=1)
+        console.sendline("")
+        output = ''.join(console.stream("show proc | i flume", XR_PROMPTS, 1))
+        self.assertIn(FLUME_ROW % (1143, 6763), output)
+
+    def test_flush(self):
+        console = ExpectChannel(FakeChannel(["a", "b", ""]))
+        console.buffer = "x"
+        self.assertEqual(console.flush(), "xab")
+        self.assertEqual(console.buffer, "")
+
+
+class XrCliLoginTest(unittest.TestCase):
+
+    def login(self, answers):
+        '''Console whose replies to exec, the username and the password are answers'''
+        answers = list(answers)
+        channel = FakeChannel(reply=lambda data: [answers.pop(0)] if answers else [])
+        return channel, xr_cli_login(ExpectChannel(channel), 'admin', 'secret', timeout=1)
+
+    def test_straight_to_prompt(self):
+        channel, output = self.login(["exec\r\n"+XR_PROMPT])
+        self.assertEqual(channel.sent, ["exec\n"])
+        self.assertTrue(output.endswith(XR_PROMPT))
+
+    def test_username_and_password(self):
+        channel, output = self.login(["exec\r\nUsername: ", "admin\r\nPassword: ", "\r\n"+XR_PROMPT])
+        self.assertEqual(channel.sent, ["exec\n", "admin\n", "secret\n"])
+
+    def test_password_only(self):
+        channel, output = self.login(["exec\r\nPassword: ", "\r\n"+XR_PROMPT])
+        self.assertEqual(channel.sent, ["exec\n", "secret\n"])
+
+    def test_no_prompt_times_out(self):
+        with self.assertRaises(ExpectTimeout):
+            self.login(["exec\r\nUsername: ", "admin\r\nPassword: ", "\r\n% Authentication failed\r\n"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+import fanout
+import xr_session
+from proc_index import parse_qemu
+from restart_flume import FLUME_RESTART_CMDS
+from tests.xr_stub import StubXrClient, XrRouter
+
+
+class StubIndex(object):
+    def __init__(self, names):
+        self.names = names
+
+    def vms(self):
+        return [parse_qemu(100 + i, ['qemu-system-x86_64', '-name', name], 1) for i, name in enumerate(self.names)]
+
+
+class StuckFlumeRouter(XrRouter):
+    '''flume never comes back after a shutdown'''
+
+    def cli(self, cmd):
+        output = XrRouter.cli(self, cmd)
+        if cmd == "process start flume":
+            self.flume_running = False
+        return output
+
+
+class FanoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = (fanout.INDEX, fanout.resolve_host_ip, xr_session.xr_client, sys.stdout)
+        self.tmp = tempfile.mkdtemp()
+        # net name -> router behind it, those missing have no host console
+        self.routers = {}
+        self.clients = {}
+        fanout.INDEX = StubIndex(["rtr2", "rtr1", "spine1"])
+        fanout.resolve_host_ip = self.resolve_host_ip
+        xr_session.xr_client = self.xr_client
+        sys.stdout = self.out = StringIO()
+
+    def tearDown(self):
+        fanout.INDEX, fanout.resolve_host_ip, xr_session.xr_client, sys.stdout = self.saved
+        shutil.rmtree(self.tmp)
+
+    def resolve_host_ip(self, net_name, host_port):
+        if net_name not in self.routers:
+            raise LookupError("no host console found for "+net_name)
+        return net_name+".host"
+
+    def xr_client(self, host_ip, host_port):
+        net_name = host_ip.split('.')[0]
+        return self.clients.setdefault(net_name, StubXrClient(self.routers[net_name], delay=0.001))
+
+    def job(self, cli=(), shell=(), restart=False):
+        return {"cli": list(cli) + (FLUME_RESTART_CMDS if restart else []), "shell": list(shell),
+                "restart_flume": restart, "ssh_port": 22}
+
+    def test_select_routers(self):
+        self.assertEqual(fanout.select_routers(["rtr*"]), ["rtr1", "rtr2"])
+        self.assertEqual(fanout.select_routers(["spine?", "rtr2"]), ["rtr2", "spine1"])
+        self.assertEqual(fanout.select_routers(["leaf*"]), [])
+
+    def test_line_emitter(self):
+        out = fanout.LineEmitter("rtr1")
+        out.write("show ver\r\nCisco ")
+        out.write("IOS XR\r\n\r\nRP/0/RP0/CPU0:ios#")
+        out.close()
+        self.assertEqual(self.out.getvalue().splitlines(),
+                         ["[rtr1] show ver", "[rtr1] Cisco IOS XR", "[rtr1] RP/0/RP0/CPU0:ios#"])
+
+    def test_restart_flume(self):
+        self.routers["rtr1"] = XrRouter()
+        entry = fanout.run_router("rtr1", self.job(restart=True))
+        self.assertEqual((entry["status"], entry["error"]), (0, None))
+        self.assertEqual(self.routers["rtr1"].cli_cmds, ["terminal length 0"] + FLUME_RESTART_CMDS)
+
+    def test_flume_not_back(self):
+        self.routers["rtr1"] = StuckFlumeRouter()
+        entry = fanout.run_router("rtr1", self.job(restart=True))
+        self.assertEqual((entry["status"], entry["error"]), (1, "flume is not running after the restart"))
+
+    def test_failed_shell_skips_cli(self):
+        self.routers["rtr1"] = XrRouter()
+        entry = fanout.run_router("rtr1", self.job(cli=["show clock"], shell=["true", "false", "echo never"]))
+        self.assertEqual(entry["status"], 1)
+        self.assertEqual(self.routers["rtr1"].cli_cmds, [])
+        self.assertNotIn("never", self.out.getvalue())
+
+    def test_one_failing_router_does_not_stop_the_others(self):
+        self.routers["rtr2"] = XrRouter()
+        results = fanout.fan_out(["rtr1", "rtr2"], self.job(cli=["show proc | i flume"]), 2)
+        self.assertEqual([(r["net_name"], r["status"]) for r in results], [("rtr1", 1), ("rtr2", 0)])
+        self.assertEqual(results[0]["error"], "no host console found for rtr1")
+        self.assertIn("[rtr2] 1143", self.out.getvalue())
+
+    def test_json_report(self):
+        self.routers["rtr1"] = XrRouter()
+        self.routers["rtr2"] = XrRouter()
+        path = os.path.join(self.tmp, "report.json")
+        fanout.main(["-t", "rtr*", "-c", "show proc | i flume", "-o", path])
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual(report["job"]["cli"], ["show proc | i flume"])
+        self.assertEqual([(r["net_name"], r["host_ip"], r["status"]) for r in report["routers"]],
+                         [("rtr1", "rtr1.host", 0), ("rtr2", "rtr2.host", 0)])
+
+    def test_failure_exits_non_zero(self):
+        self.routers["rtr1"] = XrRouter()
+        with self.assertRaises(SystemExit) as caught:
+            fanout.main(["-t", "rtr*", "-c", "show clock"])
+        self.assertEqual(caught.exception.code, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import os
+import stat
+import shutil
+import tempfile
+import subprocess
+import unittest
+from file_transfer import transfer_files, push, pull
+
+
+class LocalChannel(object):
+    '''Exec channel that runs the script with the local sh'''
+
+    def __init__(self):
+        self.out = ''
+        self.err = ''
+        self.eof_received = True
+        self.closed = False
+
+    def exec_command(self, script):
+        proc = subprocess.Popen(['sh', '-c', script], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.out, self.err = proc.communicate()
+        self.status = proc.returncode
+
+    def recv_ready(self):
+        return bool(self.out)
+
+    def recv_stderr_ready(self):
+        return bool(self.err)
+
+    def recv(self, size):
+        data, self.out = self.out[:size], self.out[size:]
+        return data
+
+    def recv_stderr(self, size):
+        data, self.err = self.err[:size], self.err[size:]
+        return data
+
+    def exit_status_ready(self):
+        return True
+
+    def recv_exit_status(self):
+        return self.status
+
+    def close(self):
+        self.closed = True
+
+
+class LocalFile(file):
+    def set_pipelined(self, pipelined):
+        pass
+
+    def prefetch(self):
+        pass
+
+
+class LocalSFTP(object):
+    '''SFTP session on the local filesystem, counts the writes'''
+
+    def __init__(self):
+        self.writes = []
+
+    def stat(self, path):
+        # paramiko raises IOError for a missing file
+        if not os.path.exists(path):
+            raise IOError(2, "No such file")
+        return os.stat(path)
+
+    def open(self, path, mode):
+        if 'w' in mode:
+            self.writes.append(path)
+        return LocalFile(path, mode)
+
+    def chmod(self, path, mode):
+        os.chmod(path, mode)
+
+    def close(self):
+        pass
+
+
+class LocalClient(object):
+    '''Stands in for a pooled SSH client, the "remote" side is the local host'''
+
+    def __init__(self):
+        self.sftp = LocalSFTP()
+
+    def get_transport(self):
+        return self
+
+    def open_session(self):
+        return LocalChannel()
+
+    def open_sftp(self):
+        return self.sftp
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+class TransferFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.client = LocalClient()
+        self.local = os.path.join(self.tmp, 'start_netbroker.sh')
+        self.remote = os.path.join(self.tmp, 'remote_netbroker.sh')
+        with open(self.local, 'w') as f:
+            f.write('#!/bin/sh\necho netbroker\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_push_copies_and_sets_mode(self):
+        report = transfer_files(self.client, [push(self.local, self.remote, 0777)])
+        self.assertFalse(report[0]["skipped"])
+        self.assertEqual(open(self.remote).read(), open(self.local).read())
+        self.assertEqual(mode(self.remote), 0777)
+
+    def test_unchanged_push_still_sets_mode(self):
+        shutil.copy(self.local, self.remote)
+        os.chmod(self.remote, 0644)
+        report = transfer_files(self.client, [push(self.local, self.remote, 0777)])
+        self.assertTrue(report[0]["skipped"])
+        self.assertEqual(self.client.sftp.writes, [])
+        self.assertEqual(mode(self.remote), 0777)
+
+    def test_unchanged_pull_still_sets_mode(self):
+        shutil.copy(self.local, self.remote)
+        os.chmod(self.local, 0600)
+        report = transfer_files(self.client, [pull(self.remote, self.local, 0755)])
+        self.assertTrue(report[0]["skipped"])
+        self.assertEqual(mode(self.local), 0755)
+
+    def test_changed_content_is_copied(self):
+        with open(self.remote, 'w') as f:
+            f.write('#!/bin/sh\necho stale!!\n')
+        report = transfer_files(self.client, [push(self.local, self.remote)])
+        self.assertFalse(report[0]["skipped"])
+        self.assertEqual(self.client.sftp.writes, [self.remote])
+        self.assertEqual(open(self.remote).read(), open(self.local).read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from file_watch import FileWatcher, PickleSnapshot
+
+
+class WatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "watched")
+        self.mtime = 1000000000
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, content):
+        with open(self.path, 'wb') as f:
+            f.write(content)
+        # A new mtime every write, whatever the file system's resolution
+        self.mtime += 1
+        os.utime(self.path, (self.mtime, self.mtime))
+
+
+class FileWatcherTest(WatchTestCase):
+
+    def test_versions(self):
+        self.write("one")
+        watcher = FileWatcher(self.path)
+        self.assertEqual(watcher.version, 1)
+        self.assertFalse(watcher.check())
+        self.write("one")
+        self.assertFalse(watcher.check())
+        self.write("two")
+        self.assertTrue(watcher.check())
+        self.assertEqual(watcher.wait(1, 0), 2)
+        os.unlink(self.path)
+        self.assertTrue(watcher.check())
+        self.assertEqual(watcher.checksum, None)
+
+    def test_wait_times_out(self):
+        self.write("one")
+        watcher = FileWatcher(self.path)
+        self.assertEqual(watcher.wait(watcher.version, 0.01), 1)
+
+
+class PickleSnapshotTest(WatchTestCase):
+
+    def test_bad_load_keeps_snapshot(self):
+        self.write(pickle.dumps({"router": {"eth0": 1}}))
+        snapshot = PickleSnapshot(self.path)
+        good = snapshot.snapshot()
+        self.assertEqual(good[0], '{"router": {"eth0": 1}}')
+        self.write("\x80\x02}q")
+        snapshot.check()
+        self.assertEqual(snapshot.snapshot(), good)
+        self.assertNotEqual(snapshot.error, None)
+        self.write(pickle.dumps({"router": {"eth0": 2}}))
+        snapshot.check()
+        self.assertEqual(snapshot.snapshot()[0], '{"router": {"eth0": 2}}')
+        self.assertEqual(snapshot.error, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
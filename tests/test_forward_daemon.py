@@ -0,0 +1,116 @@
+import os
+import socket
+import shutil
+import tempfile
+import threading
+import unittest
+from forward_daemon import ForwardServer, AlreadyRunning, control
+
+TIMEOUT = 5
+
+
+def free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class StubPool(object):
+    '''Stands in for SSHPool, every direct-tcpip channel is one end of a
+    socketpair and the test plays the far end'''
+
+    def __init__(self):
+        self.opened = []
+        self.remotes = []
+        self.channel_opened = threading.Event()
+
+    def get_client(self, host, port, user, password):
+        return self
+
+    def get_transport(self):
+        return self
+
+    def open_channel(self, kind, dest, origin):
+        channel, remote = socket.socketpair()
+        remote.settimeout(TIMEOUT)
+        self.opened.append((kind, dest))
+        self.remotes.append(remote)
+        self.channel_opened.set()
+        return channel
+
+
+class ForwardServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'forwarder.sock')
+        self.server = ForwardServer(self.path)
+        self.server.pool = StubPool()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.stop()
+        self.thread.join(TIMEOUT)
+        self.assertFalse(self.thread.is_alive())
+        for remote in self.server.pool.remotes:
+            remote.close()
+        shutil.rmtree(self.tmp)
+
+    def add(self, port):
+        return control({"cmd": "add", "local_port": port, "host": "10.0.0.1", "host_port": 22, "user": "root",
+                        "password": "lab", "dest_host": "10.11.12.14", "dest_port": 22}, self.path)["forward"]
+
+    def forwards(self):
+        return control({"cmd": "list"}, self.path)["forwards"]
+
+    def test_add_list_remove(self):
+        port = free_port()
+        self.assertEqual(self.add(port)["local_port"], port)
+        self.assertEqual([(f["local_port"], f["host"]) for f in self.forwards()], [(port, "10.0.0.1")])
+
+        self.assertEqual(control({"cmd": "remove", "local_port": port}, self.path)["forward"]["local_port"], port)
+        self.assertEqual(self.forwards(), [])
+        with self.assertRaises(socket.error):
+            socket.create_connection(('127.0.0.1', port), TIMEOUT)
+
+    def test_remove_unknown_port_fails(self):
+        with self.assertRaises(RuntimeError):
+            control({"cmd": "remove", "local_port": free_port()}, self.path)
+
+    def test_bytes_relayed_both_ways(self):
+        port = free_port()
+        self.add(port)
+        client = socket.create_connection(('127.0.0.1', port), TIMEOUT)
+        try:
+            self.assertTrue(self.server.pool.channel_opened.wait(TIMEOUT))
+            self.assertEqual(self.server.pool.opened, [('direct-tcpip', ('10.11.12.14', 22))])
+            remote = self.server.pool.remotes[0]
+
+            client.sendall('ping')
+            self.assertEqual(remote.recv(16), 'ping')
+            remote.sendall('pong!')
+            self.assertEqual(client.recv(16), 'pong!')
+
+            forward = self.forwards()[0]
+            self.assertEqual((forward["bytes_out"], forward["bytes_in"]), (4, 5))
+            self.assertEqual((forward["connections"], forward["active"]), (1, 1))
+
+            # Removing the forward closes its tunnels
+            control({"cmd": "remove", "local_port": port}, self.path)
+            self.assertEqual(remote.recv(16), '')
+        finally:
+            client.close()
+
+    def test_second_instance_refuses_to_start(self):
+        with self.assertRaises(AlreadyRunning):
+            ForwardServer(self.path)
+        # The running one is untouched
+        self.assertEqual(self.forwards(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
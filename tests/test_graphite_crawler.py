@@ -0,0 +1,51 @@
+import unittest
+from graphite_crawler import GraphiteCrawler
+from tests.graphite_stub import StubGraphite
+
+LEAVES = ["collectd.rtr%d.if%d.%s" % (r, i, c) for r in range(5) for i in range(4) for c in ("rx", "tx")]
+# collectd, 5 routers and 5 * 4 interfaces are branches
+BRANCHES = 1 + 5 + 20
+
+
+class GraphiteCrawlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.graphite = StubGraphite(LEAVES).start()
+        self.crawler = GraphiteCrawler(self.graphite.url, "collectd", concurrency=4, batch=16)
+
+    def tearDown(self):
+        # Closing the pooled connections ends the stub's handler threads
+        self.crawler.session.close()
+        self.graphite.stop()
+
+    def test_first_round_walks_later_rounds_only_render(self):
+        metrics = self.crawler.collect()
+        self.assertEqual(sorted(self.crawler.leaves), sorted(LEAVES))
+        self.assertEqual(metrics["rtr3"]["if2"]["tx"], 2.0)
+        self.assertEqual(self.graphite.counts, {"find": BRANCHES, "render": 3})
+
+        self.crawler.collect()
+        self.crawler.collect()
+        self.assertEqual(self.graphite.counts, {"find": BRANCHES, "render": 9})
+
+    def test_vanished_leaf_forces_a_rewalk(self):
+        self.crawler.collect()
+        self.graphite.leaves.discard("collectd.rtr0.if0.rx")
+        metrics = self.crawler.collect()
+        self.assertEqual(metrics["rtr0"]["if0"]["rx"], None)
+        self.assertEqual(self.graphite.counts["find"], BRANCHES)
+
+        self.crawler.collect()
+        self.assertEqual(self.graphite.counts["find"], 2 * BRANCHES)
+        self.assertNotIn("collectd.rtr0.if0.rx", self.crawler.leaves)
+
+    def test_tree_ttl(self):
+        self.crawler.tree_ttl = 0
+        self.crawler.collect()
+        self.crawler.walked -= 1
+        self.crawler.collect()
+        self.assertEqual(self.graphite.counts["find"], 2 * BRANCHES)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import sqlite3
+import unittest
+import inventory
+from inventory import Inventory, lookup_host_ip
+from proc_index import parse_qemu
+
+
+class StubIndex(object):
+    '''Stands in for the /proc index with one VM of a given pid and start'''
+
+    def __init__(self, pid, start_time):
+        self.vm = parse_qemu(pid, ['qemu-system-x86_64', '-name', 'rtr1', '-serial', 'telnet::9020,server'],
+                             start_time)
+
+    def find_vm(self, net_name):
+        return self.vm if net_name == self.vm.net_name else None
+
+
+class LookupHostIpTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.inventory = Inventory(os.path.join(self.dir, "inventory.db"))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_no_vm(self):
+        with self.assertRaises(LookupError) as caught:
+            lookup_host_ip("no-such-router", self.inventory)
+        self.assertEqual(str(caught.exception), "no host console found for no-such-router")
+
+
+class ValidityTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "inventory.db")
+        self.index = inventory.INDEX
+
+    def tearDown(self):
+        inventory.INDEX = self.index
+        shutil.rmtree(self.dir)
+
+    def test_same_vm(self):
+        inventory.INDEX = StubIndex(4242, 1000)
+        Inventory(self.path).record("rtr1", host_ip="192.168.122.10")
+        self.assertEqual(Inventory(self.path).get("rtr1")["host_ip"], "192.168.122.10")
+
+    def test_stale_row_of_recycled_pid(self):
+        inventory.INDEX = StubIndex(4242, 1000)
+        inv = Inventory(self.path)
+        inv.record("rtr1", host_ip="192.168.122.10")
+        # The VM restarted and got the same pid back
+        inventory.INDEX = StubIndex(4242, 5000)
+        self.assertIsNone(inv.get("rtr1"))
+        self.assertEqual(inv.routers(), [])
+
+    def test_rows_without_start_time_are_stale(self):
+        db = sqlite3.connect(self.path)
+        db.execute("CREATE TABLE routers (net_name TEXT PRIMARY KEY, qemu_pid INTEGER, host_telnet INTEGER, "
+                   "xr_telnet INTEGER, host_ip TEXT, xr_int_ip TEXT, xr_intf_mac TEXT, xr_ifh INTEGER, "
+                   "fwd_port INTEGER, updated REAL)")
+        db.execute("INSERT INTO routers (net_name, qemu_pid, host_ip) VALUES ('rtr1', 4242, '192.168.122.10')")
+        db.commit()
+        db.close()
+        inventory.INDEX = StubIndex(4242, 1000)
+        self.assertIsNone(Inventory(self.path).get("rtr1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import sys
+import shutil
+import subprocess
+import tempfile
+import unittest
+from proc_index import ProcIndex
+
+
+class ProcIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.index = ProcIndex(ttl=0, proc_root=self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def process(self, pid, argv, start):
+        '''A /proc/<pid> with the cmdline and the stat fields up to starttime'''
+        path = os.path.join(self.root, str(pid))
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+        with open(os.path.join(path, 'cmdline'), 'w') as f:
+            f.write('\0'.join(argv) + '\0')
+        with open(os.path.join(path, 'stat'), 'w') as f:
+            f.write("%d (%s) S " % (pid, os.path.basename(argv[0])) + "0 " * 18 + "%d 0 0\n" % start)
+
+    def test_forwards_filtered_by_destination(self):
+        self.process(100, ['ssh', '-fNL', '7000:10.11.12.14:22', 'root@192.168.122.10'], 1)
+        self.process(101, ['ssh', '-N', '-L', '7000:10.0.0.5:80', 'jump'], 1)
+        forwards = self.index.ssh_forwards(local_port=7000, dest_host='10.11.12.14', dest_port=22)
+        self.assertEqual([(f.pid, f.target, f.user) for f in forwards], [(100, '192.168.122.10', 'root')])
+        self.assertEqual(len(self.index.ssh_forwards(local_port=7000)), 2)
+
+    def test_reused_pid_is_read_again(self):
+        self.process(200, ['ssh', '-L', '7001:10.11.12.14:22', 'host'], 1)
+        self.assertEqual(len(self.index.ssh_forwards(local_port=7001)), 1)
+        self.process(200, ['/usr/bin/qemu-system-x86_64', '-name', 'vm:rtr1', '-serial', 'telnet:0.0.0.0:9000,server'], 2)
+        self.assertEqual(self.index.ssh_forwards(local_port=7001), [])
+        self.assertEqual(self.index.xr_telnet_port('rtr1'), 9000)
+
+    def test_no_ssh_stack_imported(self):
+        # display.sh and friends run the scanner on hosts without paramiko
+        code = "import sys, proc_index; print ' '.join(m for m in ('paramiko', 'ssh_pool') if m in sys.modules)"
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(subprocess.check_output([sys.executable, '-c', code], cwd=root).strip(), '')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from StringIO import StringIO
+import provision_fleet
+from port_alloc import PortAllocator
+from provision_fleet import assign_fwd_ports, parse_router, provision_fleet as run_fleet, print_summary, \
+    FWD_PORT_BASE, FWD_PORT_MAX
+
+
+class AssignFwdPortsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.allocator = PortAllocator(os.path.join(self.tmp, "leases.json"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_explicit_port_is_not_leased_again(self):
+        # The port the allocator would hand out first, nothing binds it
+        first = self.allocator.allocate(FWD_PORT_BASE, FWD_PORT_MAX)[0]
+        self.allocator.release(first)
+
+        routers = [parse_router(["rtr1", "9020", "9021"]),
+                   parse_router(["rtr2", "9022", "9023", str(first)]),
+                   parse_router(["rtr3", "9024", "9025"])]
+        assign_fwd_ports(routers, allocator=self.allocator)
+
+        ports = [r["fwd_port"] for r in routers]
+        self.assertEqual(ports[1], first)
+        self.assertEqual(len(set(ports)), 3)
+        self.assertTrue(all(FWD_PORT_BASE <= port <= FWD_PORT_MAX for port in ports))
+        self.assertNotIn(str(first), self.allocator.leases())
+
+    def test_all_explicit_leases_nothing(self):
+        routers = [parse_router(["rtr1", "9020", "9021", "7001"])]
+        assign_fwd_ports(routers, allocator=self.allocator)
+        self.assertEqual(routers[0]["fwd_port"], 7001)
+        self.assertEqual(self.allocator.leases(), {})
+
+
+class StubProvisioner(object):
+    '''Stands in for provision_router, records how many routers run at once.
+    Routers named in fail exit with status 3, those in crash raise.'''
+
+    def __init__(self, fail=(), crash=(), delay=0.05):
+        self.fail = fail
+        self.crash = crash
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.seen = []
+
+    def __call__(self, router, chef_install, log_dir):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            self.seen.append(router["net_name"])
+        try:
+            time.sleep(self.delay)
+            if router["net_name"] in self.crash:
+                raise OSError("no such file: setup_netstack.py")
+            status = 3 if router["net_name"] in self.fail else 0
+            return {"net_name": router["net_name"], "fwd_port": router["fwd_port"], "status": status,
+                    "duration": self.delay, "log": os.path.join(log_dir, router["net_name"]+".log")}
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class ProvisionFleetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.log_dir = os.path.join(tempfile.mkdtemp(), "logs")
+        self.routers = [parse_router(["rtr%d" % i, str(9020 + 2 * i), str(9021 + 2 * i), str(7000 + i)])
+                        for i in range(6)]
+        self.saved = provision_fleet.provision_router
+        self.stdout = sys.stdout
+        sys.stdout = self.out = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        provision_fleet.provision_router = self.saved
+        shutil.rmtree(os.path.dirname(self.log_dir))
+
+    def run_fleet(self, stub, concurrency):
+        provision_fleet.provision_router = stub
+        return run_fleet(self.routers, concurrency, log_dir=self.log_dir)
+
+    def test_concurrency_cap(self):
+        stub = StubProvisioner()
+        self.run_fleet(stub, 2)
+        self.assertEqual(stub.peak, 2)
+        self.assertEqual(sorted(stub.seen), [r["net_name"] for r in self.routers])
+        self.assertTrue(os.path.isdir(self.log_dir))
+
+    def test_one_router_at_a_time(self):
+        stub = StubProvisioner(delay=0.01)
+        self.run_fleet(stub, 0)
+        self.assertEqual(stub.peak, 1)
+        self.assertEqual(stub.seen, [r["net_name"] for r in self.routers])
+
+    def test_failures_are_isolated(self):
+        stub = StubProvisioner(fail=("rtr1",), crash=("rtr2", "rtr4"))
+        results = self.run_fleet(stub, 2)
+        self.assertEqual([r["net_name"] for r in results], [r["net_name"] for r in self.routers])
+        self.assertEqual([r["status"] for r in results], [0, 3, -1, 0, -1, 0])
+        self.assertEqual(len(stub.seen), 6)
+
+    def test_summary(self):
+        results = self.run_fleet(StubProvisioner(fail=("rtr1",), crash=("rtr2",)), 3)
+        self.out.truncate(0)
+        print_summary(results)
+        lines = self.out.getvalue().strip().splitlines()
+        self.assertEqual(lines[0].split(), ["NET", "PORT", "STATUS", "TIME(s)", "LOG"])
+        rows = dict((line.split()[0], line.split()) for line in lines[1:7])
+        self.assertEqual(rows["rtr0"][:3], ["rtr0", "7000", "ok"])
+        self.assertEqual(rows["rtr0"][4], os.path.join(self.log_dir, "rtr0.log"))
+        self.assertEqual(rows["rtr1"][2], "FAILED(3)")
+        self.assertEqual(rows["rtr2"][2], "FAILED(-1)")
+        self.assertEqual(lines[-1], "4 succeeded, 2 failed")
+
+
+if __name__ == '__main__':
+    unittest.main()
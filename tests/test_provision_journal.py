@@ -0,0 +1,85 @@
+import json
+import shutil
+import tempfile
+import unittest
+from provision_journal import Journal, run_steps
+
+PARAMS = {"host_telnet": 9020, "xr_telnet": 9021, "fwd_port": 7001}
+
+
+class RunStepsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.ran = []
+        self.valid = {}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def journal(self, params=PARAMS):
+        return Journal("rtr1", params, journal_dir=self.dir)
+
+    def step(self, name):
+        def func(ctx):
+            self.ran.append(name)
+            return {name: len(self.ran)}
+
+        def verify(ctx):
+            return self.valid.get(name, True)
+        return (name, func, verify)
+
+    def provision(self, journal):
+        self.ran = []
+        return run_steps(journal, [self.step("host_ip"), self.step("xr_up"), self.step("xr_intf")], {})
+
+    def test_completed_steps_are_skipped(self):
+        self.provision(self.journal())
+        self.assertEqual(self.ran, ["host_ip", "xr_up", "xr_intf"])
+
+        ctx = self.provision(self.journal())
+        self.assertEqual(self.ran, [])
+        # The recorded outputs are handed back
+        self.assertEqual(ctx, {"host_ip": 1, "xr_up": 2, "xr_intf": 3})
+
+    def test_resumes_after_last_completed_step(self):
+        def fails(ctx):
+            raise IOError("console closed")
+        journal = self.journal()
+        with self.assertRaises(IOError):
+            run_steps(journal, [self.step("host_ip"), ("xr_up", fails, None)], {})
+
+        self.provision(self.journal())
+        self.assertEqual(self.ran, ["xr_up", "xr_intf"])
+
+    def test_failed_verify_reruns_that_step_and_later_ones(self):
+        self.provision(self.journal())
+        self.valid["xr_up"] = False
+
+        ctx = self.provision(self.journal())
+        self.assertEqual(self.ran, ["xr_up", "xr_intf"])
+        self.assertEqual(ctx, {"host_ip": 1, "xr_up": 1, "xr_intf": 2})
+        with open(self.journal().path) as f:
+            self.assertEqual([s["name"] for s in json.load(f)["steps"]], ["host_ip", "xr_up", "xr_intf"])
+
+    def test_verify_raising_counts_as_failed(self):
+        self.provision(self.journal())
+
+        def broken(ctx):
+            raise IOError("no route to host")
+        self.ran = []
+        run_steps(self.journal(), [("host_ip", lambda ctx: self.ran.append("host_ip"), broken)], {})
+        self.assertEqual(self.ran, ["host_ip"])
+
+    def test_changed_params_reset_the_journal(self):
+        self.provision(self.journal())
+
+        changed = dict(PARAMS, fwd_port=7002)
+        journal = self.journal(changed)
+        self.assertEqual(journal.state["steps"], [])
+        self.provision(journal)
+        self.assertEqual(self.ran, ["host_ip", "xr_up", "xr_intf"])
+
+
+if __name__ == '__main__':
+    unittest.main()
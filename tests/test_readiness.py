@@ -0,0 +1,32 @@
+import unittest
+from readiness import Probe, ReadinessTimeout, wait_for
+
+
+def probe(name, values, deadline=5):
+    '''Probe whose check returns (or raises) the given values in turn'''
+    values = list(values)
+
+    def check():
+        value = values.pop(0)
+        if isinstance(value, Exception):
+            raise value
+        return value
+    return Probe(name, check, deadline=deadline, base=0.001, cap=0.001)
+
+
+class WaitForTest(unittest.TestCase):
+
+    def test_zero_is_ready(self):
+        self.assertEqual(wait_for(probe("ifh", [None, 0])), 0)
+
+    def test_retries_after_errors(self):
+        self.assertEqual(wait_for(probe("mac", [IOError("closed"), None, "aa:bb"])), "aa:bb")
+
+    def test_timeout_keeps_last_error(self):
+        with self.assertRaises(ReadinessTimeout) as caught:
+            wait_for(probe("never", [IOError("refused")] * 1000, deadline=0.05))
+        self.assertEqual(str(caught.exception.last_error), "refused")
+
+
+if __name__ == '__main__':
+    unittest.main()
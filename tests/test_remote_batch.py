@@ -0,0 +1,90 @@
+import subprocess
+import unittest
+from remote_batch import BatchError, run_batch
+
+
+class LateOutputChannel(object):
+    '''Exec channel that runs the script with the local sh, reports the exit
+    status right away and hands the output out a few bytes per recv with
+    gaps in between, like a channel whose exit-status overtook the data'''
+
+    def __init__(self, chunk=7):
+        self.chunk = chunk
+        self.out = ''
+        self.err = ''
+        self.status = None
+        self.polls = 0
+        self.eof_received = False
+        self.closed = False
+
+    def exec_command(self, script):
+        proc = subprocess.Popen(['sh', '-c', script], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.out, self.err = proc.communicate()
+        self.status = proc.returncode
+
+    def _ready(self, data):
+        self.polls += 1
+        if not self.out and not self.err:
+            self.eof_received = True
+        return bool(data) and self.polls % 3 == 0
+
+    def recv_ready(self):
+        return self._ready(self.out)
+
+    def recv_stderr_ready(self):
+        return self._ready(self.err)
+
+    def recv(self, size):
+        data, self.out = self.out[:self.chunk], self.out[self.chunk:]
+        return data
+
+    def recv_stderr(self, size):
+        data, self.err = self.err[:self.chunk], self.err[self.chunk:]
+        return data
+
+    def exit_status_ready(self):
+        return True
+
+    def recv_exit_status(self):
+        return self.status
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient(object):
+    def __init__(self, channel):
+        self.channel = channel
+
+    def get_transport(self):
+        return self
+
+    def open_session(self):
+        return self.channel
+
+
+class RunBatchTest(unittest.TestCase):
+
+    def run_batch(self, cmds, stop_on_error=True):
+        return run_batch(FakeClient(LateOutputChannel()), cmds, stop_on_error)
+
+    def test_output_after_exit_status(self):
+        results = self.run_batch(['echo one', 'echo two >&2; echo three'])
+        self.assertEqual([(r.status, r.stdout, r.stderr) for r in results],
+                         [(0, 'one\n', ''), (0, 'three\n', 'two\n')])
+
+    def test_stop_on_error(self):
+        results = self.run_batch(['true', 'false', 'echo never'])
+        self.assertEqual([r.status for r in results], [0, 1])
+
+    def test_keep_going(self):
+        results = self.run_batch(['false', 'echo after'], stop_on_error=False)
+        self.assertEqual([(r.status, r.stdout) for r in results], [(1, ''), (0, 'after\n')])
+
+    def test_missing_result_raises(self):
+        # exit ends the whole script, not just the command
+        self.assertRaises(BatchError, self.run_batch, ['echo one', 'exit 0', 'echo three'])
+
+
+if __name__ == "__main__":
+    unittest.main()
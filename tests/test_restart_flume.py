@@ -0,0 +1,24 @@
+import unittest
+from expect_channel import ExpectChannel, xr_cli_login, XR_PROMPTS, SHELL_PROMPT
+from restart_flume import FLUME_RESTART_CMDS, flume_procs
+from tests.xr_stub import SlowXrShell, XrRouter
+
+
+class FlumeRestartTest(unittest.TestCase):
+
+    def test_restart_shows_the_new_flume(self):
+        router = XrRouter()
+        console = ExpectChannel(SlowXrShell(router))
+        console.expect(SHELL_PROMPT, 1)
+        output = xr_cli_login(console, timeout=1)
+        for cmd in FLUME_RESTART_CMDS:
+            output += console.run(cmd, XR_PROMPTS, 1)
+        self.assertEqual(router.cli_cmds, FLUME_RESTART_CMDS)
+        self.assertEqual([p["jid"] for p in flume_procs(output)], [1144])
+
+    def test_flume_not_running(self):
+        self.assertEqual(flume_procs("show proc | i flume\r\nRP/0/RP0/CPU0:ios#"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
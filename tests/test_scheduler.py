@@ -0,0 +1,76 @@
+import time
+import threading
+import unittest
+from scheduler import Scheduler, SKIP, COALESCE
+
+# Upper bound on every wait, the conditions normally hold in milliseconds
+TIMEOUT = 5
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.scheduler = Scheduler(workers=1).start()
+
+    def tearDown(self):
+        self.release.set()
+        self.assertTrue(self.scheduler.stop(TIMEOUT))
+
+    def wait_until(self, name, condition):
+        '''Metrics of a job once condition(metrics) holds, fails after TIMEOUT'''
+        end = time.time() + TIMEOUT
+        while time.time() < end:
+            metrics = self.scheduler.metrics()[name]
+            if condition(metrics):
+                return metrics
+            time.sleep(0.005)
+        self.fail(name+" never got there: "+str(self.scheduler.metrics()[name]))
+
+    def test_overlapping_ticks_are_skipped(self):
+        self.scheduler.every("slow", 0.01, self.release.wait, offset=0, overlap=SKIP)
+        metrics = self.wait_until("slow", lambda m: m["skipped"] >= 3)
+        # Still in its first run, no tick started another one
+        self.assertTrue(metrics["running"])
+        self.assertEqual(metrics["runs"], 0)
+        self.assertEqual(metrics["queued_ticks"], 0)
+        self.release.set()
+        self.wait_until("slow", lambda m: m["runs"] >= 1)
+
+    def test_coalesced_ticks_run_once_right_after(self):
+        self.scheduler.every("slow", 0.01, self.release.wait, offset=0, overlap=COALESCE)
+        self.wait_until("slow", lambda m: m["skipped"] >= 3)
+        # Any number of missed ticks leave one run to do
+        with self.scheduler.cond:
+            self.assertNotEqual(self.scheduler.jobs["slow"].pending, None)
+        self.release.set()
+        self.wait_until("slow", lambda m: m["runs"] >= 2)
+
+    def test_waiting_for_a_worker_is_not_an_overlap(self):
+        self.scheduler.every("busy", 10, self.release.wait, offset=0)
+        self.wait_until("busy", lambda m: m["running"])
+        self.scheduler.every("waiting", 0.01, lambda: None, offset=0)
+        metrics = self.wait_until("waiting", lambda m: m["queued_ticks"] >= 3)
+        self.assertEqual(metrics["skipped"], 0)
+        self.assertEqual(metrics["runs"], 0)
+        self.release.set()
+        self.wait_until("waiting", lambda m: m["runs"] >= 1)
+
+    def test_failures_are_counted(self):
+        def fail():
+            raise ValueError("boom")
+        self.scheduler.every("fail", 0.01, fail, offset=0)
+        metrics = self.wait_until("fail", lambda m: m["failures"] >= 2)
+        self.assertEqual(metrics["last_error"], "boom")
+
+    def test_stop(self):
+        self.scheduler.every("quick", 0.01, lambda: None, offset=0)
+        self.wait_until("quick", lambda m: m["runs"] >= 1)
+        self.assertTrue(self.scheduler.stop(TIMEOUT))
+        runs = self.scheduler.metrics()["quick"]["runs"]
+        time.sleep(0.05)
+        self.assertEqual(self.scheduler.metrics()["quick"]["runs"], runs)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import shutil
+import socket
+import tempfile
+import unittest
+import paramiko
+import sim_router
+from ssh_pool import SSHPool
+from remote_batch import run_batch
+from expect_channel import ExpectChannel, SHELL_PROMPT
+from endpoints import XR_SSH_DEST
+
+TIMEOUT = 10
+
+
+def free_ports(count):
+    '''First of count consecutive free localhost ports'''
+    while True:
+        probe = socket.socket()
+        probe.bind(('127.0.0.1', 0))
+        first = probe.getsockname()[1]
+        probe.close()
+        try:
+            for port in range(first, first + count):
+                s = socket.socket()
+                s.bind(('127.0.0.1', port))
+                s.close()
+            return first
+        except socket.error:
+            pass
+
+
+class SimRouterTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.root_dir = tempfile.mkdtemp()
+        cls.port = free_ports(1)
+        cls.router = sim_router.start_routers(1, cls.root_dir, ip_base="127.0.0.1", ssh_port=cls.port,
+                                              telnet_base=free_ports(2), boot_delay=0, intf_delay=0,
+                                              latency=0)[0]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root_dir, ignore_errors=True)
+
+    def setUp(self):
+        self.pool = SSHPool()
+
+    def tearDown(self):
+        self.pool.close_all()
+
+    def host(self):
+        return self.pool.get_client(self.router.host_ip, self.port, 'root', 'lab')
+
+    def test_quick_exec_requests(self):
+        # The command is done before the request is acknowledged, the
+        # channel still has to survive until the client closes it
+        client = self.host()
+        for i in range(20):
+            stdin, stdout, stderr = client.exec_command("hostname sim")
+            self.assertEqual(stdout.channel.recv_exit_status(), 0)
+            stdout.channel.close()
+
+    def test_exec_output_and_status(self):
+        stdin, stdout, stderr = self.host().exec_command("md5sum /root/missing")
+        self.assertEqual(stdout.channel.recv_exit_status(), 1)
+        self.assertIn("No such file", stderr.read())
+
+    def test_batch(self):
+        results = run_batch(self.host(), ["modprobe cisco_nb", "md5sum /root/missing", "mkdir /root/x"],
+                            stop_on_error=True, timeout=TIMEOUT)
+        self.assertEqual([r.status for r in results], [0, 1])
+
+    def test_shell(self):
+        console = ExpectChannel(self.host().invoke_shell())
+        try:
+            console.expect(SHELL_PROMPT, TIMEOUT)
+            output = console.run("virsh -c lxc:/// list", SHELL_PROMPT, TIMEOUT, "\n")
+            self.assertIn("default-sdr--1", output)
+        finally:
+            console.channel.close()
+
+    def test_xr_sshd_through_the_host(self):
+        client = self.pool.get_client(XR_SSH_DEST[0], XR_SSH_DEST[1], 'root', 'lab',
+                                      via=(self.router.host_ip, self.port, 'root', 'lab'))
+        results = run_batch(client, ["ifconfig tap123"], timeout=TIMEOUT)
+        self.assertEqual(results[0].status, 1)
+        self.assertIn("Device not found", results[0].stderr)
+
+    def test_bad_password(self):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.assertRaises(paramiko.AuthenticationException, client.connect, self.router.host_ip, self.port,
+                          'root', 'wrong', look_for_keys=False, allow_agent=False, timeout=TIMEOUT)
+        client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import time
+import threading
+import unittest
+import ssh_pool
+from ssh_pool import SSHPool
+
+TIMEOUT = 5
+
+
+class StubTransport(object):
+    def __init__(self, client):
+        self.client = client
+        self.active = True
+        self.ignore_fails = False
+        self.ignores = 0
+        self.channels = []
+
+    def is_active(self):
+        return self.active
+
+    def send_ignore(self):
+        self.ignores += 1
+        if self.ignore_fails:
+            raise EOFError()
+
+    def open_channel(self, kind, dest, origin, timeout=None):
+        channel = ("channel", kind, dest)
+        self.channels.append(channel)
+        return channel
+
+
+class StubSSHClient(object):
+    '''Stands in for paramiko.SSHClient, every connect is recorded and may be
+    held up by a gate event'''
+    connects = []
+    gates = {}
+
+    def __init__(self):
+        self.transport = None
+        self.closed = False
+        self.args = None
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, host, port=22, username=None, password=None, timeout=None, sock=None):
+        gate = StubSSHClient.gates.get(host)
+        if gate is not None:
+            gate.wait(TIMEOUT)
+        self.args = (host, port, username, password, sock)
+        StubSSHClient.connects.append(self.args)
+        self.transport = StubTransport(self)
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        self.closed = True
+
+
+class PoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client_class = ssh_pool.paramiko.SSHClient
+        ssh_pool.paramiko.SSHClient = StubSSHClient
+        StubSSHClient.connects = []
+        StubSSHClient.gates = {}
+        self.pool = SSHPool(idle_check=30)
+
+    def tearDown(self):
+        for gate in StubSSHClient.gates.values():
+            gate.set()
+        ssh_pool.paramiko.SSHClient = self.client_class
+
+
+class SSHPoolTest(PoolTestCase):
+
+    def test_client_is_reused(self):
+        first = self.pool.get_client("10.0.0.1", 22, "root", "lab")
+        self.assertIs(self.pool.get_client("10.0.0.1", 22, "root"), first)
+        self.assertEqual(StubSSHClient.connects, [("10.0.0.1", 22, "root", "lab", None)])
+
+    def test_dead_transport_is_replaced(self):
+        first = self.pool.get_client("10.0.0.1", 22, "root", "lab")
+        first.transport.active = False
+        second = self.pool.get_client("10.0.0.1", 22, "root")
+        self.assertIsNot(second, first)
+        self.assertTrue(first.closed)
+        # The password of the first connect is used again
+        self.assertEqual(second.args[3], "lab")
+
+    def test_idle_transport_is_probed(self):
+        pool = SSHPool(idle_check=0)
+        first = pool.get_client("10.0.0.1", 22, "root", "lab")
+        time.sleep(0.01)
+        self.assertIs(pool.get_client("10.0.0.1", 22, "root"), first)
+        self.assertEqual(first.transport.ignores, 1)
+
+        first.transport.ignore_fails = True
+        time.sleep(0.01)
+        self.assertIsNot(pool.get_client("10.0.0.1", 22, "root"), first)
+        self.assertTrue(first.closed)
+
+    def test_slow_connect_holds_up_only_its_endpoint(self):
+        StubSSHClient.gates["10.0.0.1"] = threading.Event()
+        clients = []
+
+        def get():
+            clients.append(self.pool.get_client("10.0.0.1", 22, "root", "lab"))
+        threads = [threading.Thread(target=get) for i in range(3)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        # Another endpoint connects while the first one is stuck
+        other = self.pool.get_client("10.0.0.2", 22, "root", "lab")
+        self.assertEqual(other.args[0], "10.0.0.2")
+
+        StubSSHClient.gates["10.0.0.1"].set()
+        for thread in threads:
+            thread.join(TIMEOUT)
+        # The callers of the stuck endpoint shared one connect
+        self.assertEqual(len(set(map(id, clients))), 1)
+        self.assertEqual([c[0] for c in StubSSHClient.connects], ["10.0.0.2", "10.0.0.1"])
+
+    def test_close_all(self):
+        clients = [self.pool.get_client(host, 22, "root", "lab") for host in ("10.0.0.1", "10.0.0.2")]
+        self.pool.close_all()
+        self.assertEqual([c.closed for c in clients], [True, True])
+        self.assertIsNot(self.pool.get_client("10.0.0.1", 22, "root", "lab"), clients[0])
+
+    def test_close_one(self):
+        first = self.pool.get_client("10.0.0.1", 22, "root", "lab")
+        other = self.pool.get_client("10.0.0.2", 22, "root", "lab")
+        self.pool.close("10.0.0.1", 22, "root")
+        self.assertTrue(first.closed)
+        self.assertFalse(other.closed)
+
+
+class NestedTest(PoolTestCase):
+    '''Sessions riding a direct-tcpip channel of a jump host's transport'''
+
+    def test_session_rides_the_jump_transport(self):
+        xr = self.pool.get_client("10.11.12.14", 22, "root", "lab", via=("192.168.122.10", 2222, "root", "lab"))
+        jump = self.pool.get_client("192.168.122.10", 2222, "root")
+        self.assertEqual(jump.transport.channels, [("channel", "direct-tcpip", ("10.11.12.14", 22))])
+        self.assertEqual(xr.args, ("10.11.12.14", 22, "root", "lab", jump.transport.channels[0]))
+        # The jump host was connected once, first
+        self.assertEqual([c[:2] for c in StubSSHClient.connects], [("192.168.122.10", 2222), ("10.11.12.14", 22)])
+
+    def test_jump_host_is_part_of_the_key(self):
+        one = self.pool.get_client("10.11.12.14", 22, "root", "lab", via=("192.168.122.10", 22, "root", "lab"))
+        two = self.pool.get_client("10.11.12.14", 22, "root", "lab", via=("192.168.122.11", 22, "root", "lab"))
+        self.assertIsNot(one, two)
+        self.assertIs(self.pool.get_client("10.11.12.14", 22, "root", via=("192.168.122.10", 22, "root", "lab")), one)
+        self.assertEqual(len(StubSSHClient.connects), 4)
+
+    def test_dead_jump_host_is_reconnected(self):
+        via = ("192.168.122.10", 22, "root", "lab")
+        first = self.pool.get_client("10.11.12.14", 22, "root", "lab", via=via)
+        jump = self.pool.get_client(*via)
+        jump.transport.active = False
+        first.transport.active = False
+        second = self.pool.get_client("10.11.12.14", 22, "root", via=via)
+        new_jump = self.pool.get_client(*via)
+        self.assertIsNot(new_jump, jump)
+        self.assertEqual(second.args[4], new_jump.transport.channels[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from telemetry_archive import ArchiveError, ArchiveReader, ArchiveWriter, read_index, series_key
+
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.writer = ArchiveWriter(self.dir)
+
+    def tearDown(self):
+        self.writer.close()
+        shutil.rmtree(self.dir)
+
+    def test_window(self):
+        for i in range(10):
+            self.writer.append("r1", "Gi0/0/0/0", 100.0 + i, {"bytes-received": i * 10})
+        times, values, names = ArchiveReader(self.dir).window("r1", "Gi0/0/0/0", 103, 106)
+        self.assertEqual(times.tolist(), [103.0, 104.0, 105.0])
+        self.assertEqual(names, ["bytes-received"])
+        self.assertEqual(values[:, 0].tolist(), [30.0, 40.0, 50.0])
+
+    def test_old_samples_dropped(self):
+        self.writer.append("r1", "Gi0", 100.0, {"a": 1})
+        self.writer.append("r1", "Gi0", 100.0, {"a": 2})
+        self.writer.append("r1", "Gi0", 99.0, {"a": 3})
+        times, values, names = ArchiveReader(self.dir).window("r1", "Gi0")
+        self.assertEqual(values[:, 0].tolist(), [1.0])
+
+    def test_new_counter_starts_a_segment(self):
+        self.writer.append("r1", "Gi0", 100.0, {"a": 1})
+        self.writer.append("r1", "Gi0", 101.0, {"a": 2, "b": 5})
+        self.assertEqual(len(read_index(self.dir)[series_key("r1", "Gi0")]), 2)
+        times, values, names = ArchiveReader(self.dir).window("r1", "Gi0")
+        self.assertEqual(names, ["a", "b"])
+        self.assertEqual(values[:, 0].tolist(), [1.0, 2.0])
+        self.assertTrue(np.isnan(values[0, 1]))
+        self.assertEqual(values[1, 1], 5.0)
+
+    def test_old_sample_with_new_counter_dropped(self):
+        self.writer.append("r1", "Gi0", 100.0, {"a": 1})
+        self.writer.append("r1", "Gi0", 100.0, {"a": 2, "b": 5})
+        self.writer.append("r2", "Gi0", 100.0, {"a": 1})
+        entries = read_index(self.dir)[series_key("r1", "Gi0")]
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]["first"], 100.0)
+        self.assertEqual(len(os.listdir(self.dir)), 4)
+
+    def test_reader_follows_writer(self):
+        reader = ArchiveReader(self.dir)
+        self.writer.append("r1", "Gi0", 100.0, {"a": 1})
+        self.assertEqual(len(reader.window("r1", "Gi0")[0]), 1)
+        for i in range(1, 2000):
+            self.writer.append("r1", "Gi0", 100.0 + i, {"a": i})
+        self.assertEqual(len(reader.window("r1", "Gi0")[0]), 2000)
+        self.assertEqual(reader.series(), [("r1", "Gi0")])
+
+    def test_one_writer(self):
+        self.assertRaises(ArchiveError, ArchiveWriter, self.dir)
+
+    def test_reopen_drops_partial_record(self):
+        self.writer.append("r1", "Gi0", 100.0, {"a": 1})
+        self.writer.close()
+        segment = os.path.join(self.dir, read_index(self.dir)[series_key("r1", "Gi0")][0]["file"])
+        with open(segment, 'ab') as f:
+            f.write('\0' * 5)
+        self.writer = ArchiveWriter(self.dir)
+        self.writer.append("r1", "Gi0", 100.0, {"a": 2})
+        self.writer.append("r1", "Gi0", 101.0, {"a": 3})
+        times, values, names = ArchiveReader(self.dir).window("r1", "Gi0")
+        self.assertEqual(times.tolist(), [100.0, 101.0])
+        self.assertEqual(values[:, 0].tolist(), [1.0, 3.0])
+
+    def test_unknown_series(self):
+        self.assertRaises(KeyError, ArchiveReader(self.dir).window, "r1", "Gi0")
+
+
+if __name__ == '__main__':
+    unittest.main()
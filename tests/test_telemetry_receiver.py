@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+import unittest
+from telemetry_receiver import HEADER, MSG_JSON, FLAG_ZLIB, Capture, TelemetryStore, \
+    extract_interfaces, receiver_config, receiver_port, replay, TELEMETRY_PORT
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+class ExtractInterfacesTest(unittest.TestCase):
+
+    def test_keys_content_row(self):
+        rows = [{"keys": {"interface-name": "Gi0/0/0/0"}, "content": {"packets-received": 10}}]
+        self.assertEqual(extract_interfaces(rows), {"Gi0/0/0/0": {"packets-received": 10}})
+
+    def test_keys_are_not_counters(self):
+        rows = [{"keys": {"interface-name": "Gi0/0/0/0", "ifindex": 7}, "content": {"packets-received": 10}}]
+        self.assertEqual(extract_interfaces(rows), {"Gi0/0/0/0": {"packets-received": 10}})
+
+    def test_interface_named_by_key(self):
+        data = {"Interfaces": {"MgmtEth0/RP0/CPU0/0": {"Latest": {"bytes_received": 5, "up": True}}}}
+        self.assertEqual(extract_interfaces(data), {"MgmtEth0/RP0/CPU0/0": {"bytes_received": 5}})
+
+
+class ReplayTest(unittest.TestCase):
+
+    def test_json_capture(self):
+        store = replay(os.path.join(DATA_DIR, "telemetry_json.cap"), TelemetryStore())
+        entry = store.snapshot("rtr1")["MgmtEth0/RP0/CPU0/0"]
+        # The second message is zlib compressed after a compressor reset
+        self.assertEqual(entry["counters"], {"bytes_received": 2000, "packets_received": 20})
+        self.assertEqual(entry["timestamp"], 1700000005.0)
+        self.assertEqual(store.stats()["messages"], 2)
+        self.assertEqual(store.stats()["dropped"], 0)
+
+    def test_gpb_kv_capture(self):
+        store = replay(os.path.join(DATA_DIR, "telemetry_gpbkv.cap"), TelemetryStore())
+        intfs = store.snapshot("rtr2")
+        self.assertEqual(sorted(intfs), ["GigabitEthernet0/0/0/0", "GigabitEthernet0/0/0/1"])
+        self.assertEqual(intfs["GigabitEthernet0/0/0/1"]["counters"], {"packets-received": 400, "bytes-sent": 20000})
+        self.assertEqual(store.stats()["messages"], 2)
+
+    def test_listeners_see_every_sample(self):
+        store = TelemetryStore()
+        samples = []
+        store.listeners.append(lambda router, intf, ts, counters: samples.append((router, intf, ts)))
+        replay(os.path.join(DATA_DIR, "telemetry_gpbkv.cap"), store)
+        self.assertEqual(len(samples), 4)
+
+    def test_failing_listener(self):
+        store = TelemetryStore()
+        samples = []
+
+        def broken(router, intf, ts, counters):
+            raise IOError("disk full")
+        store.listeners.append(broken)
+        store.listeners.append(lambda router, intf, ts, counters: samples.append(intf))
+        replay(os.path.join(DATA_DIR, "telemetry_gpbkv.cap"), store)
+        self.assertEqual(len(samples), 4)
+        self.assertEqual(store.stats()["listener_errors"], 4)
+        self.assertEqual(store.stats()["messages"], 2)
+
+    def test_corrupt_record_drops_only_its_stream(self):
+        work_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(work_dir, "corrupt.cap")
+            capture = Capture(path)
+            # Not a zlib stream, then an oversized frame header
+            capture.write("10.9.9.9", 1.0, HEADER.pack(MSG_JSON, FLAG_ZLIB, 4) + "junk")
+            capture.write("10.9.9.8", 1.0, HEADER.pack(MSG_JSON, 0, 1 << 30))
+            capture.file.close()
+            with open(path, "ab") as f, open(os.path.join(DATA_DIR, "telemetry_json.cap"), "rb") as good:
+                f.write(good.read())
+            store = replay(path, TelemetryStore())
+            self.assertEqual(store.snapshot("rtr1")["MgmtEth0/RP0/CPU0/0"]["counters"]["packets_received"], 20)
+        finally:
+            shutil.rmtree(work_dir)
+
+
+class PolicyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "flume.cfg")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, text):
+        with open(self.path, "w") as f:
+            f.write(text)
+
+    def test_trailing_commas(self):
+        self.write('{\n  "receivers": [{\n    "ip": "10.30.110.26",\n    "port": 2103,\n'
+                   '    "encoding": "self-describing-gpb",\n    "policies": [\n      "ports",\n    ],\n  }],\n}\n')
+        self.assertEqual(receiver_config(self.path), {"ip": "10.30.110.26", "port": 2103,
+                                                      "encoding": "self-describing-gpb", "policies": ["ports"]})
+        self.assertEqual(receiver_port(self.path), 2103)
+
+    def test_first_receiver(self):
+        self.write('{"receivers": [{"port": 2104}, {"port": 2105}]}')
+        self.assertEqual(receiver_port(self.path), 2104)
+
+    def test_no_receivers(self):
+        self.write('{"policies": [],}')
+        self.assertEqual(receiver_config(self.path), {})
+        self.assertEqual(receiver_port(self.path), TELEMETRY_PORT)
+
+    def test_receiver_without_port(self):
+        self.write('{"receivers": [{"ip": "10.30.110.26", "encoding": "json",},],}')
+        self.assertEqual(receiver_port(self.path), TELEMETRY_PORT)
+
+    def test_missing_file(self):
+        self.assertEqual(receiver_config(self.path), {})
+        self.assertEqual(receiver_port(self.path), TELEMETRY_PORT)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import socket
+import threading
+import unittest
+from telnet_console import ConsoleError, ConsoleTask, run_consoles
+
+
+class Console(object):
+    '''One connection console on localhost that prints a banner, then
+    echoes back whatever it is sent'''
+
+    def __init__(self, banner):
+        self.banner = banner
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(1)
+        self.port = self.listener.getsockname()[1]
+        thread = threading.Thread(target=self.serve)
+        thread.daemon = True
+        thread.start()
+
+    def serve(self):
+        conn, peer = self.listener.accept()
+        conn.sendall(self.banner)
+        try:
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    break
+                conn.sendall(data)
+        except socket.error:
+            pass
+        conn.close()
+        self.listener.close()
+
+
+def fail(task, match):
+    raise ValueError("cannot parse "+match.group(0))
+
+
+class RunConsolesTest(unittest.TestCase):
+
+    def test_failing_rule_fails_only_its_console(self):
+        broken = ConsoleTask("broken", Console("Password: ").port, [(r'Password:\s*$', fail)], timeout=5)
+        good = ConsoleTask("good", Console("login: ").port, [(r'login:\s*$', 'root\r'),
+                                                               (r'root', lambda task, match: "in")], timeout=5)
+        results = run_consoles([broken, good])
+        self.assertEqual(results, {"broken": None, "good": "in"})
+        self.assertTrue(isinstance(broken.error, ValueError))
+        self.assertEqual(good.error, None)
+
+    def test_rules(self):
+        task = ConsoleTask("good", Console("login: ").port, [(r'login:\s*$', 'root\r'),
+                                                              (r'root', lambda task, match: "in")], timeout=5)
+        self.assertEqual(run_consoles([task]), {"good": "in"})
+        self.assertEqual(task.error, None)
+
+    def test_timeout(self):
+        task = ConsoleTask("quiet", Console("").port, [(r'never', 'x')], timeout=0.2, nudge=0.05)
+        self.assertEqual(run_consoles([task], poll=0.05), {"quiet": None})
+        self.assertTrue(isinstance(task.error, ConsoleError))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import numpy as np
+from timeseries import COLUMNS, SeriesStore, counter_rates, downsample
+
+
+class CounterRatesTest(unittest.TestCase):
+
+    def rates(self, values):
+        times = np.arange(len(values)) * 5.0
+        return counter_rates(times, np.array(values, dtype=float)[:, np.newaxis])[1][:, 0]
+
+    def test_increasing(self):
+        self.assertEqual(self.rates([0, 50, 150]).tolist(), [10.0, 20.0])
+
+    def test_32_bit_wrap(self):
+        self.assertEqual(self.rates([2 ** 32 - 20, 30]).tolist(), [10.0])
+
+    def test_reset_is_not_a_wrap(self):
+        rates = self.rates([2e9, 10, 60])
+        self.assertTrue(np.isnan(rates[0]))
+        self.assertEqual(rates[1], 10.0)
+
+    def test_64_bit_decrease_is_a_reset(self):
+        self.assertTrue(np.isnan(self.rates([2 ** 40, 2 ** 40 - 100])[0]))
+
+    def test_missing_sample(self):
+        self.assertTrue(np.isnan(self.rates([0, np.nan, 10])).all())
+
+
+class SeriesStoreTest(unittest.TestCase):
+
+    def test_reset_stays_out_of_the_aggregates(self):
+        store = SeriesStore(capacity=16)
+        for i, value in enumerate([1000, 1500, 2000, 5, 505]):
+            store.add("r1", "Gi0/0/0/0", 60.0 + 5 * i, {"bytes": value})
+        history = store.history("r1", "Gi0/0/0/0", "1m", rate=True)
+        self.assertEqual(history["max"]["bytes"], [100.0])
+        self.assertEqual(history["avg"]["bytes"], [100.0])
+
+    def test_ring_keeps_the_newest(self):
+        store = SeriesStore(capacity=4)
+        for i in range(10):
+            store.add("r1", "Gi0/0/0/0", float(i), {"pkts": i})
+        self.assertEqual(store.rates("r1", "Gi0/0/0/0")["times"], [7.0, 8.0, 9.0])
+
+    def test_more_counters_than_columns(self):
+        store = SeriesStore(capacity=4)
+        counters = dict(("counter-%d" % i, i) for i in range(COLUMNS + 8))
+        store.add("r1", "Gi0/0/0/0", 0.0, counters)
+        store.add("r1", "Gi0/0/0/0", 5.0, dict((name, value + 5) for name, value in counters.iteritems()))
+        rates = store.rates("r1", "Gi0/0/0/0")["rates"]
+        self.assertEqual(len(rates), COLUMNS + 8)
+        self.assertEqual(rates["counter-%d" % (COLUMNS + 7)], [1.0])
+
+    def test_downsample_buckets(self):
+        times = np.array([0.0, 30.0, 60.0, 90.0])
+        starts, aggs = downsample(times, np.array([[1.0], [3.0], [5.0], [np.nan]]), 60)
+        self.assertEqual(starts.tolist(), [0.0, 60.0])
+        self.assertEqual(aggs["avg"][:, 0].tolist(), [2.0, 5.0])
+        self.assertEqual(aggs["min"][:, 0].tolist(), [1.0, 5.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
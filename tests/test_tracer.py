@@ -0,0 +1,95 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from StringIO import StringIO
+from tracer import Tracer
+
+
+class TracerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tracer = Tracer()
+
+    def summary(self):
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            self.tracer.summary()
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_events_nest_and_count(self):
+        with self.tracer.span("provision rtr1", "run"):
+            with self.tracer.span("xr_config", "step") as step:
+                self.tracer.add("bytes", 100)
+                self.tracer.add("bytes", 20)
+            self.tracer.add("retries", 1)
+        events = self.tracer.events()
+        self.assertEqual([(e["name"], e["cat"], e["ph"]) for e in events],
+                         [("provision rtr1", "run", "X"), ("xr_config", "step", "X")])
+        run, step = events
+        self.assertEqual(step["args"], {"bytes": 120})
+        self.assertEqual(run["args"], {"retries": 1})
+        self.assertTrue(run["ts"] <= step["ts"] and step["ts"] + step["dur"] <= run["ts"] + run["dur"])
+        self.assertEqual(run["pid"], os.getpid())
+
+    def test_error_is_recorded(self):
+        with self.assertRaises(IOError):
+            with self.tracer.span("connect", "ssh"):
+                raise IOError("refused")
+        self.assertEqual(self.tracer.events()[0]["args"], {"error": "refused"})
+
+    def test_threads_have_their_own_stack(self):
+        def work():
+            with self.tracer.span("worker"):
+                self.tracer.add("bytes", 5)
+        with self.tracer.span("main"):
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+        events = dict((e["name"], e) for e in self.tracer.events())
+        self.assertEqual(events["main"]["args"], {})
+        self.assertEqual(events["worker"]["args"], {"bytes": 5})
+        self.assertNotEqual(events["main"]["tid"], events["worker"]["tid"])
+
+    def test_write(self):
+        with self.tracer.span("lxc_up", "step"):
+            pass
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, "trace.json")
+            self.tracer.write(path)
+            with open(path) as f:
+                trace = json.load(f)
+        finally:
+            shutil.rmtree(tmp)
+        self.assertEqual(trace["displayTimeUnit"], "ms")
+        self.assertEqual([e["name"] for e in trace["traceEvents"]], ["lxc_up"])
+
+    def test_summary(self):
+        for i in range(3):
+            with self.tracer.span("run_batch", "ssh"):
+                self.tracer.add("bytes", 10)
+        with self.tracer.span("wait", "probe"):
+            self.tracer.sleep(0.01)
+        lines = self.summary().splitlines()
+        rows = dict((line.split()[1], line.split()) for line in lines[2:])
+        self.assertEqual(rows["run_batch"][0], "ssh")
+        self.assertEqual((rows["run_batch"][2], rows["run_batch"][7]), ("3", "30"))
+        self.assertEqual(rows["wait"][5], "0.01")
+
+    def test_spans_are_capped(self):
+        tracer = self.tracer = Tracer(max_spans=3)
+        for i in range(5):
+            with tracer.span("span%d" % i):
+                pass
+        self.assertEqual([e["name"] for e in tracer.events()], ["span2", "span3", "span4"])
+        self.assertIn("(2 older spans dropped)", self.summary())
+
+
+if __name__ == '__main__':
+    unittest.main()
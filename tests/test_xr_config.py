@@ -0,0 +1,116 @@
+import unittest
+from xr_config import ConfigPlan, apply_config_plan, parse_running_config
+
+INTF = "GigabitEthernet0/RP0/CPU0/0"
+
+RUNNING = (
+    "show running-config\r\n"
+    "Thu Oct 15 10:02:11.412 UTC\r\n"
+    "Building configuration...\r\n"
+    "!! IOS XR Configuration 6.1.1\r\n"
+    "!\r\n"
+    "hostname rtr1\r\n"
+    "interface GigabitEthernet0/RP0/CPU0/0\r\n"
+    " ipv4 address 192.168.122.21 255.255.255.0\r\n"
+    " shutdown\r\n"
+    "!\r\n"
+    "router static\r\n"
+    " address-family ipv4 unicast\r\n"
+    "  10.0.0.0/8 Null0\r\n"
+    " !\r\n"
+    "!\r\n"
+    "end\r\n"
+    "\r\n"
+    "RP/0/RP0/CPU0:rtr1#"
+)
+
+
+def plan(ip="192.168.122.21", gateway="192.168.122.1"):
+    '''The plan setup_netstack builds for the XR management interface'''
+    plan = ConfigPlan()
+    plan.set('interface '+INTF, 'ipv4 address '+ip+' 255.255.255.0')
+    plan.unset('interface '+INTF, 'shutdown')
+    plan.set('router static', 'address-family ipv4 unicast', '0.0.0.0/0 '+INTF+' '+gateway)
+    return plan
+
+
+class StubConsole(object):
+    def __init__(self, running):
+        self.running = running
+        self.sent = []
+
+    def run(self, cmd, prompts, timeout=None):
+        self.sent.append(cmd)
+        return self.running if cmd == 'show running-config' else ''
+
+
+class ParseRunningConfigTest(unittest.TestCase):
+
+    def test_paths_follow_indentation(self):
+        paths = parse_running_config(RUNNING)
+        self.assertIn(('interface '+INTF, 'ipv4 address 192.168.122.21 255.255.255.0'), paths)
+        self.assertIn(('interface '+INTF, 'shutdown'), paths)
+        self.assertIn(('router static', 'address-family ipv4 unicast', '10.0.0.0/8 Null0'), paths)
+        self.assertIn(('hostname rtr1',), paths)
+
+    def test_noise_is_dropped(self):
+        lines = set(line for path in parse_running_config(RUNNING) for line in path)
+        for noise in ('!', 'end', 'Building configuration...', 'show running-config', 'RP/0/RP0/CPU0:rtr1#'):
+            self.assertNotIn(noise, lines)
+        self.assertFalse([line for line in lines if line.startswith('Thu ')])
+
+
+class DeltaTest(unittest.TestCase):
+
+    def test_present_address_is_left_alone(self):
+        cmds = plan().delta(parse_running_config(RUNNING))
+        self.assertNotIn('ipv4 address 192.168.122.21 255.255.255.0', cmds)
+
+    def test_changed_address_is_set(self):
+        cmds = plan(ip="192.168.122.30").delta(parse_running_config(RUNNING))
+        self.assertEqual(cmds[:3], ['interface '+INTF, 'ipv4 address 192.168.122.30 255.255.255.0', 'root'])
+
+    def test_present_line_is_unset(self):
+        cmds = plan().delta(parse_running_config(RUNNING))
+        self.assertEqual(cmds[:3], ['interface '+INTF, 'no shutdown', 'root'])
+
+    def test_absent_line_needs_no_unset(self):
+        running = RUNNING.replace(" shutdown\r\n", "")
+        self.assertNotIn('no shutdown', plan().delta(parse_running_config(running)))
+
+    def test_nested_route_is_set_under_its_parents(self):
+        cmds = plan().delta(parse_running_config(RUNNING))
+        self.assertEqual(cmds[-4:], ['router static', 'address-family ipv4 unicast',
+                                     '0.0.0.0/0 '+INTF+' 192.168.122.1', 'root'])
+
+    def test_nested_route_present(self):
+        running = RUNNING.replace("  10.0.0.0/8 Null0\r\n", "  0.0.0.0/0 "+INTF+" 192.168.122.1\r\n")
+        self.assertNotIn('router static', plan().delta(parse_running_config(running)))
+
+    def test_up_to_date_is_empty(self):
+        running = RUNNING.replace(" shutdown\r\n", "").replace("  10.0.0.0/8 Null0\r\n",
+                                                              "  0.0.0.0/0 "+INTF+" 192.168.122.1\r\n")
+        self.assertEqual(plan().delta(parse_running_config(running)), [])
+
+
+class ApplyConfigPlanTest(unittest.TestCase):
+
+    def test_empty_delta_does_not_commit(self):
+        running = RUNNING.replace(" shutdown\r\n", "").replace("  10.0.0.0/8 Null0\r\n",
+                                                              "  0.0.0.0/0 "+INTF+" 192.168.122.1\r\n")
+        console = StubConsole(running)
+        changed, output = apply_config_plan(console, plan())
+        self.assertFalse(changed)
+        self.assertEqual(console.sent, ['show running-config'])
+
+    def test_delta_is_committed_in_one_session(self):
+        console = StubConsole(RUNNING)
+        changed, output = apply_config_plan(console, plan())
+        self.assertTrue(changed)
+        self.assertEqual(console.sent[:2], ['show running-config', 'configure terminal'])
+        self.assertEqual(console.sent[-2:], ['commit', 'end'])
+        self.assertEqual(console.sent.count('commit'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from xr_parsers import LineParser, ShowInterfacesParser, ShowImDatabaseParser, parse_stream
+
+SHOW_INTERFACES = (
+    "GigabitEthernet0/0/0/0 is up, line protocol is up\r\n"
+    "  Interface state transitions: 1\r\n"
+    "  Hardware is GigabitEthernet, address is 5254.0012.3456 (bia 5254.0012.3456)\r\n"
+    "  Internet address is 10.1.1.1/24\r\n"
+    "  MTU 1514 bytes, BW 1000000 Kbit (Max: 1000000 Kbit)\r\n"
+    "MgmtEth0/RP0/CPU0/0 is administratively down, line protocol is administratively down\r\n"
+    "  Hardware is Management Ethernet\r\n"
+    "  MTU 1514 bytes, BW 0 Kbit\r\n"
+)
+
+
+class LineParserTest(unittest.TestCase):
+
+    def test_base_parser_skips_lines(self):
+        parser = LineParser()
+        self.assertEqual(parser.feed("any output\r\n"), [])
+        self.assertEqual(parser.close(), [])
+
+    def test_records_across_chunks(self):
+        chunks = [SHOW_INTERFACES[i:i + 7] for i in range(0, len(SHOW_INTERFACES), 7)]
+        records = list(parse_stream(ShowInterfacesParser(), chunks))
+        self.assertEqual([r["name"] for r in records], ["GigabitEthernet0/0/0/0", "MgmtEth0/RP0/CPU0/0"])
+        self.assertEqual(records[0]["mac"], "5254.0012.3456")
+        self.assertEqual(records[0]["bandwidth"], 1000000)
+        self.assertEqual(records[1]["state"], "administratively down")
+        self.assertEqual(records[1]["mac"], None)
+
+    def test_needed_fields_emit_early(self):
+        parser = ShowInterfacesParser(needed=["mtu"])
+        records = parser.feed(SHOW_INTERFACES.split("MgmtEth")[0])
+        self.assertEqual([r["mtu"] for r in records], [1514])
+        self.assertEqual(parser.close(), [])
+
+    def test_im_database(self):
+        parser = ShowImDatabaseParser()
+        records = parser.feed("Interface GigabitEthernet0/0/0/1, ifh 0x00000040 (up, 1514)\r\n")
+        records += parser.close()
+        self.assertEqual(records, [{"name": "GigabitEthernet0/0/0/1", "ifh": 0x40, "state": "up", "mtu": 1514}])
+
+
+if __name__ == '__main__':
+    unittest.main()
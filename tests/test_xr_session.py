@@ -0,0 +1,92 @@
+import socket
+import unittest
+from expect_channel import ExpectTimeout
+import xr_session
+from xr_session import open_xr_console, execute_xr_console_cmd, xr_client
+from tests.xr_stub import StubXrClient, FLUME_ROW
+
+
+class SilentShell(object):
+    '''Shell channel that never answers'''
+
+    def __init__(self):
+        self.closed = False
+
+    def settimeout(self, timeout):
+        pass
+
+    def recv_ready(self):
+        return False
+
+    def recv(self, size):
+        raise socket.timeout()
+
+    def sendall(self, data):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class SilentClient(object):
+    def __init__(self):
+        self.shells = []
+
+    def invoke_shell(self):
+        self.shells.append(SilentShell())
+        return self.shells[-1]
+
+
+class RecordingPool(object):
+    def __init__(self):
+        self.calls = []
+
+    def get_client(self, host, port, user, password, via=None):
+        self.calls.append((host, port, via))
+        return self
+
+
+class XrClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = xr_session.POOL
+        xr_session.POOL = RecordingPool()
+
+    def tearDown(self):
+        xr_session.POOL = self.pool
+
+    def test_default_host_port(self):
+        xr_client("192.168.122.10")
+        self.assertEqual(xr_session.POOL.calls, [("10.11.12.14", 22, ("192.168.122.10", 22, "root", "lab"))])
+
+    def test_host_port(self):
+        xr_client("127.0.1.1", 2222)
+        self.assertEqual(xr_session.POOL.calls[0][2], ("127.0.1.1", 2222, "root", "lab"))
+
+
+class OpenXrConsoleTest(unittest.TestCase):
+
+    def test_login_and_paging(self):
+        client = StubXrClient()
+        console, output = open_xr_console(client, timeout=1)
+        self.assertEqual(client.router.cli_cmds, ["terminal length 0"])
+        self.assertFalse(client.shells[0].closed)
+        console.channel.close()
+
+    def test_failed_login_closes_the_channel(self):
+        client = SilentClient()
+        for attempt in range(3):
+            with self.assertRaises(ExpectTimeout):
+                open_xr_console(client, timeout=0.05)
+        self.assertEqual([shell.closed for shell in client.shells], [True] * 3)
+
+    def test_console_cmds_in_one_session(self):
+        client = StubXrClient()
+        output = execute_xr_console_cmd(client, ["show proc | i flume"], timeout=1)
+        self.assertIn(FLUME_ROW % (1143, 6763), output)
+        self.assertEqual(len(client.shells), 1)
+        self.assertTrue(client.shells[0].closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import time
+import socket
+import threading
+import subprocess
+
+XR_SHELL_PROMPT = "[xr-vm_node0_RP0_CPU0:~]$ "
+XR_EXEC_PROMPT = "RP/0/RP0/CPU0:ios#"
+FLUME_ROW = "%d   %d    0  128K  20 Sleeping    flume      0 \r\n"
+
+
+class XrRouter(object):
+    '''What the stub XR CLI knows: whether flume runs and under which jid'''
+
+    def __init__(self):
+        self.flume_jid = 1143
+        self.flume_running = True
+        self.cli_cmds = []
+
+    def cli(self, cmd):
+        self.cli_cmds.append(cmd)
+        if cmd == "process shutdown flume":
+            self.flume_running = False
+        elif cmd == "process start flume":
+            self.flume_running = True
+            self.flume_jid += 1
+        elif cmd == "show proc | i flume" and self.flume_running:
+            return FLUME_ROW % (self.flume_jid, 5620 + self.flume_jid)
+        return ""
+
+
+class SlowXrShell(object):
+    '''Shell channel into the XR lxc that answers one line at a time, delay
+    seconds apart, the way sim_router and a real XR CLI do. "exec" drops
+    into the XR CLI, every line gets its echo, output and a prompt.'''
+
+    def __init__(self, router, delay=0.05):
+        self.router = router
+        self.delay = delay
+        self.timeout = None
+        self.closed = False
+        self.cli = False
+        self.out = XR_SHELL_PROMPT
+        self.lines = []
+        self.cond = threading.Condition()
+        self.sent = []
+        thread = threading.Thread(target=self._answer)
+        thread.daemon = True
+        thread.start()
+
+    def _answer(self):
+        while True:
+            with self.cond:
+                while not self.lines and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                line = self.lines.pop(0)
+            time.sleep(self.delay)
+            if not self.cli:
+                self.cli = line.strip() == "exec"
+                reply = line+"\r\n"+(XR_EXEC_PROMPT if self.cli else XR_SHELL_PROMPT)
+            else:
+                reply = line+"\r\n"+self.router.cli(line.strip())+XR_EXEC_PROMPT
+            with self.cond:
+                self.out += reply
+                self.cond.notify_all()
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def sendall(self, data):
+        self.sent.append(data)
+        with self.cond:
+            self.lines.extend(data.replace('\r', '\n').split('\n')[:-1])
+            self.cond.notify_all()
+
+    def recv_ready(self):
+        return bool(self.out)
+
+    def recv(self, size):
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        with self.cond:
+            while not self.out and not self.closed:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise socket.timeout()
+                self.cond.wait(remaining)
+            data, self.out = self.out[:size], self.out[size:]
+            return data
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class LocalExecChannel(object):
+    '''Exec channel that runs the script with the local sh'''
+
+    def __init__(self):
+        self.out = ''
+        self.err = ''
+        self.status = None
+        self.eof_received = True
+        self.closed = False
+
+    def exec_command(self, script):
+        proc = subprocess.Popen(['sh', '-c', script], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.out, self.err = proc.communicate()
+        self.status = proc.returncode
+
+    def recv_ready(self):
+        return bool(self.out)
+
+    def recv_stderr_ready(self):
+        return bool(self.err)
+
+    def recv(self, size):
+        data, self.out = self.out[:size], self.out[size:]
+        return data
+
+    def recv_stderr(self, size):
+        data, self.err = self.err[:size], self.err[size:]
+        return data
+
+    def exit_status_ready(self):
+        return True
+
+    def recv_exit_status(self):
+        return self.status
+
+    def close(self):
+        self.closed = True
+
+
+class StubXrClient(object):
+    '''Stands in for a pooled client of the XR lxc sshd: shells are slow XR
+    shells of one router, exec sessions run on the local sh'''
+
+    def __init__(self, router=None, delay=0.05):
+        self.router = router or XrRouter()
+        self.delay = delay
+        self.shells = []
+
+    def invoke_shell(self):
+        shell = SlowXrShell(self.router, self.delay)
+        self.shells.append(shell)
+        return shell
+
+    def get_transport(self):
+        return self
+
+    def open_session(self):
+        return LocalExecChannel()
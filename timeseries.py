@@ -0,0 +1,164 @@
+import threading
+import numpy as np
+
+# Two hours of samples at the 5s cadence of flume.cfg
+CAPACITY = 1440
+# Columns a series starts with, it grows by this many when a new counter shows up
+COLUMNS = 32
+WINDOWS = {"1m": 60, "5m": 300, "1h": 3600}
+# A 32 bit counter that went down is taken as wrapped only when the wrapped
+# delta stays under this (a quarter of the range), otherwise as reset
+MAX_WRAP_DELTA = 2.0 ** 30
+
+
+class Series(object):
+    '''Ring buffer of the samples of one router interface.
+
+    times is a preallocated (capacity,) array, values a (capacity, columns)
+    array with one column per counter, NaN where a sample did not carry
+    that counter. head is the next slot written, the oldest sample once the
+    buffer has wrapped.
+    '''
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.times = np.zeros(capacity)
+        self.values = np.full((capacity, COLUMNS), np.nan)
+        self.columns = {}
+        self.head = 0
+        self.count = 0
+
+    def column(self, counter):
+        if counter not in self.columns:
+            if len(self.columns) == self.values.shape[1]:
+                grown = np.full((self.capacity, self.values.shape[1] + COLUMNS), np.nan)
+                grown[:, :self.values.shape[1]] = self.values
+                self.values = grown
+            self.columns[counter] = len(self.columns)
+        return self.columns[counter]
+
+    def append(self, timestamp, counters):
+        if self.count and timestamp <= self.times[(self.head - 1) % self.capacity]:
+            # Replayed or duplicate sample
+            return
+        # Map every counter first, growing values may replace the array
+        columns = [(self.column(counter), value) for counter, value in counters.iteritems()]
+        row = self.values[self.head]
+        row[:] = np.nan
+        for column, value in columns:
+            row[column] = value
+        self.times[self.head] = timestamp
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def ordered(self, since=None, counters=None):
+        '''(times, values, names) oldest first, of the samples newer than since
+        and the given counters (all of them by default)'''
+        names = sorted(self.columns, key=self.columns.get) if counters is None else \
+            [c for c in counters if c in self.columns]
+        cols = [self.columns[name] for name in names]
+        start = (self.head - self.count) % self.capacity
+        index = (start + np.arange(self.count)) % self.capacity
+        times = self.times[index]
+        values = self.values[index][:, cols]
+        if since is not None:
+            keep = times > since
+            times, values = times[keep], values[keep]
+        return times, values, names
+
+
+def counter_rates(times, values):
+    '''Per second rate between consecutive samples of monotonic counters.
+
+    A decrease is a 32 bit wrap when the previous value fit in 32 bits and
+    the wrapped delta is plausible (under MAX_WRAP_DELTA). Any other
+    decrease is a reset (reload, clear counters) and its rate is NaN, 64
+    bit counters are never taken as wrapped. Returns (times, rates) with one
+    row less than the input, stamped with the later sample.
+    '''
+    if len(times) < 2:
+        return times[:0], values[:0]
+    delta = np.diff(values, axis=0)
+    previous = values[:-1]
+    wrapped_delta = delta + 2.0 ** 32
+    with np.errstate(invalid='ignore'):
+        decreased = delta < 0
+        wrapped = decreased & (previous < 2.0 ** 32) & (wrapped_delta < MAX_WRAP_DELTA)
+    delta = np.where(wrapped, wrapped_delta, np.where(decreased, np.nan, delta))
+    elapsed = np.diff(times)[:, np.newaxis]
+    return times[1:], delta / elapsed
+
+
+def downsample(times, values, window):
+    '''min/avg/max/last of each column per window seconds bucket. Returns the
+    bucket start times and a dict of (buckets, columns) arrays. NaNs (counters
+    missing from a sample) are left out of each aggregate.'''
+    empty = np.zeros((0, values.shape[1]))
+    if not len(times):
+        return times, {"min": empty, "avg": empty, "max": empty, "last": empty}
+    buckets = np.floor(times / window) * window
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(times)]
+
+    present = ~np.isnan(values)
+    counts = np.add.reduceat(present, starts, axis=0).astype(float)
+    sums = np.add.reduceat(np.where(present, values, 0), starts, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg = sums / counts
+    low = np.minimum.reduceat(np.where(present, values, np.inf), starts, axis=0)
+    high = np.maximum.reduceat(np.where(present, values, -np.inf), starts, axis=0)
+    none = counts == 0
+    low[none] = np.nan
+    high[none] = np.nan
+    return buckets[starts], {"min": low, "avg": avg, "max": high, "last": values[ends - 1]}
+
+
+def _columns(names, array):
+    # JSON has no NaN, missing values become null
+    return dict((name, [None if np.isnan(v) else float(v) for v in array[:, i]]) for i, name in enumerate(names))
+
+
+class SeriesStore(object):
+    '''Recent history of every router interface, fed by the telemetry
+    receiver (add() is a TelemetryStore listener)'''
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def add(self, router, interface, timestamp, counters):
+        with self.lock:
+            series = self.series.get((router, interface))
+            if series is None:
+                series = self.series[(router, interface)] = Series(self.capacity)
+            series.append(timestamp, counters)
+
+    def interfaces(self):
+        with self.lock:
+            return sorted(self.series)
+
+    def _ordered(self, router, interface, since, counters):
+        with self.lock:
+            series = self.series.get((router, interface))
+            if series is None:
+                raise KeyError(router+" "+interface)
+            return series.ordered(since, counters)
+
+    def rates(self, router, interface, since=None, counters=None):
+        '''{"times": [...], "rates": {counter: [...]}} per second'''
+        times, values, names = self._ordered(router, interface, since, counters)
+        times, rates = counter_rates(times, values)
+        return {"times": times.tolist(), "rates": _columns(names, rates)}
+
+    def history(self, router, interface, window="1m", since=None, counters=None, rate=False):
+        '''Counters (or their rates) downsampled to window buckets, as
+        {"times": [...], "min"|"avg"|"max"|"last": {counter: [...]}}'''
+        times, values, names = self._ordered(router, interface, since, counters)
+        if rate:
+            times, values = counter_rates(times, values)
+        starts, aggregates = downsample(times, values, WINDOWS[window])
+        result = {"times": starts.tolist(), "window": window}
+        for name, array in aggregates.iteritems():
+            result[name] = _columns(names, array)
+        return result
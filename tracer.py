@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from functools import wraps
+
+# Finished spans kept, the oldest go first. Long running importers (the
+# forwarder, the telemetry server) would otherwise grow without limit.
+MAX_SPANS = 20000
+
+
+class Span(object):
+    '''One timed phase. Counters (bytes, retries, sleep, ...) added while it
+    is open end up in its args.'''
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = dict(args)
+        self.start = None
+        self.end = None
+        self.tid = None
+
+    def add(self, key, value):
+        self.args[key] = self.args.get(key, 0) + value
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+
+class Tracer(object):
+    '''Records nested spans per thread and exports them.
+
+    Spans are cheap enough to leave on all the time: a start time, an end
+    time and a few counters. write() saves the Chrome trace event format
+    that chrome://tracing and Perfetto open, summary() prints where the
+    time went per category and name. Only the last max_spans finished
+    spans are kept.
+    '''
+
+    def __init__(self, max_spans=MAX_SPANS):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.spans = deque(maxlen=max_spans)
+        self.dropped = 0
+        self.origin = time.time()
+
+    def _stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def start(self, name, cat="phase", **args):
+        span = Span(name, cat, args)
+        span.tid = threading.current_thread().ident
+        span.start = time.time()
+        self._stack().append(span)
+        return span
+
+    def finish(self, span, error=None):
+        span.end = time.time()
+        if error is not None:
+            span.args["error"] = str(error)
+        stack = self._stack()
+        if span in stack:
+            del stack[stack.index(span):]
+        with self.lock:
+            if len(self.spans) == self.spans.maxlen:
+                self.dropped += 1
+            self.spans.append(span)
+
+    def span(self, name, cat="phase", **args):
+        '''Context manager timing the block, yields the Span'''
+        return _SpanContext(self, name, cat, args)
+
+    def traced(self, name=None, cat="phase"):
+        '''Decorator timing every call of a function'''
+        def decorate(func):
+            @wraps(func)
+            def wrapper(*a, **kw):
+                with self.span(name or func.__name__, cat):
+                    return func(*a, **kw)
+            return wrapper
+        return decorate
+
+    def current(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def add(self, key, value):
+        '''Add to a counter of the innermost open span of this thread'''
+        span = self.current()
+        if span is not None:
+            span.add(key, value)
+
+    def sleep(self, seconds):
+        '''time.sleep() that is accounted as sleep time of the open span'''
+        self.add("sleep", seconds)
+        time.sleep(seconds)
+
+    def events(self):
+        pid = os.getpid()
+        with self.lock:
+            spans = list(self.spans)
+        events = []
+        for span in sorted(spans, key=lambda s: s.start):
+            events.append({"name": span.name, "cat": span.cat, "ph": "X", "pid": pid, "tid": span.tid,
+                           "ts": int((span.start - self.origin) * 1e6), "dur": int(span.duration * 1e6),
+                           "args": span.args})
+        return events
+
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, f)
+
+    def summary(self):
+        '''Print count, total and max time, sleep, retries and bytes per
+        (category, name), slowest first'''
+        rows = {}
+        with self.lock:
+            spans = list(self.spans)
+            dropped = self.dropped
+        for span in spans:
+            row = rows.setdefault((span.cat, span.name), {"count": 0, "total": 0.0, "max": 0.0, "sleep": 0.0,
+                                                          "retries": 0, "bytes": 0, "errors": 0})
+            row["count"] += 1
+            row["total"] += span.duration
+            row["max"] = max(row["max"], span.duration)
+            row["sleep"] += span.args.get("sleep", 0.0)
+            row["retries"] += span.args.get("retries", 0)
+            row["bytes"] += span.args.get("bytes", 0)
+            row["errors"] += 1 if "error" in span.args else 0
+
+        print "\n%-8s %-36s %6s %10s %9s %9s %8s %12s %6s" % ("CAT", "NAME", "COUNT", "TOTAL(s)", "MAX(s)", "SLEEP(s)",
+                                                           "RETRIES", "BYTES", "ERRORS")
+        for (cat, name), row in sorted(rows.items(), key=lambda item: -item[1]["total"]):
+            print "%-8s %-36s %6d %10.2f %9.2f %9.2f %8d %12d %6d" % (cat, name[:36], row["count"], row["total"], row["max"],
+                                                                     row["sleep"], row["retries"], row["bytes"], row["errors"])
+        if dropped:
+            print "(%d older spans dropped)" % dropped
+
+
+class _SpanContext(object):
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.span = self.tracer.start(self.name, self.cat, **self.args)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer.finish(self.span, exc)
+        return False
+
+
+TRACER = Tracer()
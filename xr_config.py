@@ -0,0 +1,75 @@
+import re
+from expect_channel import XR_PROMPTS
+
+CONFIG_TIMEOUT = 60
+
+# Lines of show running-config output that are not configuration
+NOISE = re.compile(r'^(!|end$|Building configuration|(Mon|Tue|Wed|Thu|Fri|Sat|Sun) \w{3} +\d+ |show running-config|RP/0/)')
+
+
+def parse_running_config(text):
+    '''Turn show running-config output into a set of config paths.
+
+    A path is the tuple of lines from the top level down to a line, following
+    the one space per level indentation XR uses, e.g.
+    ("router static", "address-family ipv4 unicast", "0.0.0.0/0 ...")
+    '''
+    paths = set()
+    stack = []
+    for line in text.splitlines():
+        line = line.rstrip('\r ')
+        stripped = line.lstrip(' ')
+        if not stripped or NOISE.match(stripped):
+            continue
+        depth = len(line) - len(stripped)
+        del stack[depth:]
+        stack.append(stripped)
+        paths.add(tuple(stack))
+    return paths
+
+
+class ConfigPlan(object):
+    '''All the XR configuration intended for a router, as config paths that
+    must be present (set) or absent (unset)'''
+
+    def __init__(self):
+        self.entries = []
+
+    def set(self, *path):
+        self.entries.append((tuple(path), True))
+
+    def unset(self, *path):
+        self.entries.append((tuple(path), False))
+
+    def delta(self, running):
+        '''Config mode commands that bring running (a set of paths) in line
+        with the plan, empty when nothing needs to change'''
+        cmds = []
+        for path, present in self.entries:
+            if present and path not in running:
+                cmds.extend(path)
+            elif not present and path in running:
+                cmds.extend(path[:-1] + ('no '+path[-1],))
+            else:
+                continue
+            # Back to the top of the config tree for the next entry
+            cmds.append('root')
+        return cmds
+
+
+def apply_config_plan(console, plan, timeout=CONFIG_TIMEOUT):
+    '''Diff the plan against the running config and commit only the delta,
+    all in the one XR CLI session. Returns (changed, output).'''
+    output = console.run('show running-config', XR_PROMPTS, timeout)
+    cmds = plan.delta(parse_running_config(output))
+    if not cmds:
+        print "XR configuration already up to date, nothing to commit"
+        return False, output
+
+    for cmd in ['configure terminal'] + cmds + ['commit']:
+        output += console.run(cmd, XR_PROMPTS, timeout)
+    if re.search(r'% *Failed to commit', output):
+        console.run('abort', XR_PROMPTS, timeout)
+        raise RuntimeError("XR commit failed:\n"+output)
+    output += console.run('end', XR_PROMPTS, timeout)
+    return True, output
@@ -0,0 +1,123 @@
+import re
+
+
+class LineParser(object):
+    '''Incremental parser for the output of an XR show command.
+
+    Output is fed in chunks as it arrives (see ExpectChannel.stream) and
+    parsed a line at a time, feed() returns the records completed by the
+    chunk. A record is handed out as soon as the fields listed in needed
+    are known, or once its block ends when needed is not given, so the
+    output only has to be read once however long it is.
+    '''
+
+    def __init__(self, needed=None):
+        self.needed = needed
+        self.partial = ''
+        self.record = None
+        self.emitted = False
+
+    def feed(self, chunk):
+        records = []
+        lines = (self.partial + chunk).split('\n')
+        self.partial = lines.pop()
+        for line in lines:
+            self._line(line.rstrip('\r'), records)
+        return records
+
+    def close(self):
+        '''Flush the last (unterminated) line and record'''
+        records = []
+        if self.partial:
+            self._line(self.partial.rstrip('\r'), records)
+            self.partial = ''
+        self._finish(records)
+        return records
+
+    def _start(self, record, records):
+        self._finish(records)
+        self.record = record
+        self.emitted = False
+        self._check(records)
+
+    def _update(self, records, **fields):
+        if self.record is None:
+            return
+        self.record.update(fields)
+        self._check(records)
+
+    def _check(self, records):
+        if self.needed and not self.emitted and all(self.record.get(f) is not None for f in self.needed):
+            records.append(self.record)
+            self.emitted = True
+
+    def _finish(self, records):
+        if self.record is not None and not self.emitted:
+            records.append(self.record)
+        self.record = None
+
+    def _line(self, line, records):
+        '''Handle one line of output, the command parsers below override this.
+        Lines no parser knows are skipped.'''
+        pass
+
+
+class ShowInterfacesParser(LineParser):
+    '''show interfaces: one record per interface with name, state, protocol,
+    hardware, mac, bia, mtu and bandwidth (kbit/s)'''
+
+    HEADER = re.compile(r'^(\S+) is (.+?), line protocol is (\S+)')
+    HARDWARE = re.compile(r'^\s+Hardware is ([^,]+)(?:, address is (\S+) \(bia (\S+)\))?')
+    MTU = re.compile(r'^\s+.*MTU (\d+) bytes, BW (\d+) Kbit')
+
+    def _line(self, line, records):
+        header = self.HEADER.match(line)
+        if header:
+            self._start({"name": header.group(1), "state": header.group(2), "protocol": header.group(3),
+                         "hardware": None, "mac": None, "bia": None, "mtu": None, "bandwidth": None}, records)
+            return
+        hardware = self.HARDWARE.match(line)
+        if hardware:
+            self._update(records, hardware=hardware.group(1), mac=hardware.group(2), bia=hardware.group(3))
+            return
+        mtu = self.MTU.match(line)
+        if mtu:
+            self._update(records, mtu=int(mtu.group(1)), bandwidth=int(mtu.group(2)))
+
+
+class ShowImDatabaseParser(LineParser):
+    '''show im database interface: one record per interface with name, ifh,
+    state and mtu'''
+
+    INTERFACE = re.compile(r'^Interface (\S+), ifh (\S+) \((\S+?)(?:, (\d+))?\)')
+
+    def _line(self, line, records):
+        interface = self.INTERFACE.match(line)
+        if interface:
+            mtu = interface.group(4)
+            self._start({"name": interface.group(1), "ifh": int(interface.group(2), 0),
+                         "state": interface.group(3), "mtu": int(mtu) if mtu else None}, records)
+
+
+class ShowProcParser(LineParser):
+    '''show processes (the one line per thread table, filtered or not): one
+    record per row with jid, tid, cpu, stack, pri, state, name and rt_pri'''
+
+    ROW = re.compile(r'^\s*(\d+)\s+(\d+)\s+(\d+)\s+(\S+)\s+(\d+)\s+(\S+)\s+(\S+)\s+(\d+)\s*$')
+
+    def _line(self, line, records):
+        row = self.ROW.match(line)
+        if row:
+            self._start({"jid": int(row.group(1)), "tid": int(row.group(2)), "cpu": int(row.group(3)),
+                         "stack": row.group(4), "pri": int(row.group(5)), "state": row.group(6),
+                         "name": row.group(7), "rt_pri": int(row.group(8))}, records)
+            self._finish(records)
+
+
+def parse_stream(parser, chunks):
+    '''Yield the parser's records while the chunks are read'''
+    for chunk in chunks:
+        for record in parser.feed(chunk):
+            yield record
+    for record in parser.close():
+        yield record
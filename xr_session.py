@@ -0,0 +1,48 @@
+from expect_channel import ExpectChannel, xr_cli_login, XR_PROMPTS
+from ssh_pool import POOL
+from endpoints import HOST_SSH_PORT, XR_SSH_DEST
+
+# Per command timeouts (seconds) for the XR CLI sessions. Commands return as
+# soon as the prompt is back, these only bound the wait.
+XR_LOGIN_TIMEOUT = 120
+XR_CMD_TIMEOUT = 60
+
+
+def xr_client(host_ip, host_port=HOST_SSH_PORT):
+    '''Pooled SSH client to the XR lxc shell, nested in the host transport
+    of host_ip'''
+    return POOL.get_client(XR_SSH_DEST[0], XR_SSH_DEST[1], 'root', 'lab', via=(host_ip, host_port, 'root', 'lab'))
+
+
+def disable_paging(console, timeout=XR_CMD_TIMEOUT):
+    '''Disable paging on a Cisco router'''
+    return console.run("terminal length 0", XR_PROMPTS, timeout)
+
+
+def open_xr_console(client, timeout=XR_LOGIN_TIMEOUT):
+    '''Interactive session of client logged into the XR CLI with paging
+    turned off, returns (console, login output). The channel is closed
+    again when the login fails, retries would otherwise pile them up on the
+    pooled transport.'''
+    console = ExpectChannel(client.invoke_shell())
+    print "Interactive SSH session established"
+    try:
+        output = xr_cli_login(console, timeout=timeout)
+        output += disable_paging(console)
+    except Exception:
+        console.channel.close()
+        raise
+    return console, output
+
+
+def execute_xr_console_cmd(client, cmd_list, timeout=XR_CMD_TIMEOUT):
+    '''Run XR CLI commands in one session of client, returns the output'''
+    console, output = open_xr_console(client)
+    print "Cmd list is \n\n"
+    print cmd_list
+    try:
+        for cmd in cmd_list:
+            output += console.run(str(cmd), XR_PROMPTS, timeout)
+    finally:
+        console.channel.close()
+    return output